@@ -1,63 +1,240 @@
-from typing import List, Dict, Any, Optional
-import json, re
+from typing import List, Dict, Any, Optional, Iterator
+from collections import deque, OrderedDict
+import io, os, json, re, math, heapq, mmap, hashlib, threading, copy
+from array import array
 import xml.etree.ElementTree as ET
+from keyword_index import term_counts, weighted_terms
 
 try:
     import yaml
+    # libyaml (C) si pyyaml a été compilé avec, sinon le loader pur Python : mêmes règles "safe"
+    YAML_LOADER = getattr(yaml, "CSafeLoader", None) or yaml.SafeLoader
 except ImportError:
     yaml = None  # si pyyaml n'est pas installé
+    YAML_LOADER = None
+
+
+# ---------- Cache de parse ---------------------------------------------------
+# Un même rapport passe souvent par plusieurs outils/agents dans un tour (coordinate mode) :
+# les résultats de parse sont gardés en LRU, clé = (parseur, blake2b du contenu). Taille bornée en
+# nombre d'entrées et en octets d'entrée cumulés. Les objets renvoyés sont partagés : ne pas les modifier
+# (les outils qui les exposent tels quels, extract_json_tool / extract_yaml_tool, en renvoient une copie).
+PARSE_CACHE_MAX_ENTRIES = int(os.getenv("PARSE_CACHE_MAX_ENTRIES", "256"))
+PARSE_CACHE_MAX_BYTES = int(os.getenv("PARSE_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+PARSE_CACHE_MIN_BYTES = int(os.getenv("PARSE_CACHE_MIN_BYTES", "512"))  # en dessous, parser coûte moins cher
+
+class ParseCache:
+    def __init__(self, max_entries: int = PARSE_CACHE_MAX_ENTRIES, max_bytes: int = PARSE_CACHE_MAX_BYTES):
+        self.max_entries, self.max_bytes = max_entries, max_bytes
+        self._entries: "OrderedDict[Any, Any]" = OrderedDict()  # clé -> (résultat, taille)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = self.misses = 0
+
+    @staticmethod
+    def key(parser_id: str, content) -> Any:
+        data = content.encode("utf-8", errors="surrogatepass") if isinstance(content, str) else bytes(content)
+        return parser_id, hashlib.blake2b(data, digest_size=16).digest(), len(data)
+
+    def get_or_parse(self, parser_id: str, content, parse):
+        """Résultat de parse(content) ; une exception n'est pas mise en cache."""
+        if not isinstance(content, (str, bytes)) or len(content) < PARSE_CACHE_MIN_BYTES or self.max_entries <= 0:
+            return parse(content)
+        key = self.key(parser_id, content)
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key][0]
+            self.misses += 1
+        result = parse(content)
+        size = key[2]
+        if size > self.max_bytes:
+            return result
+        with self._lock:
+            if key not in self._entries:
+                self._entries[key] = (result, size)
+                self._bytes += size
+            while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+                _, (_, old_size) = self._entries.popitem(last=False)
+                self._bytes -= old_size
+        return result
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            total = self.hits + self.misses
+            return {"entries": len(self._entries), "bytes": self._bytes, "hits": self.hits, "misses": self.misses,
+                    "hit_rate": round(self.hits / total, 4) if total else 0.0,
+                    "max_entries": self.max_entries, "max_bytes": self.max_bytes}
+
+PARSE_CACHE = ParseCache()
+
+def cached_parse(parser_id: str, content, parse):
+    return PARSE_CACHE.get_or_parse(parser_id, content, parse)
 
 
 # ---------- Diff / Patch ------------------------------------------------------
-def parse_diff_tool(diff_text: str) -> Dict[str, Any]:
+_HUNK_HEADER_RE = re.compile(r"^@@ -(\d+)(?:,(\d+))? \+(\d+)(?:,(\d+))? @@(.*)$")
+_DIFF_SNIPPET_LINES = 40
+
+def _iter_lines(source) -> Iterator[str]:
+    """Lignes (sans fin de ligne) d'une str, d'un fichier texte/binaire ou d'un itérable de lignes."""
+    if isinstance(source, (str, bytes)):
+        source = io.StringIO(source) if isinstance(source, str) else io.BytesIO(source)
+    for ln in source:
+        if isinstance(ln, bytes):
+            ln = ln.decode("utf-8", errors="replace")
+        yield ln.rstrip("\r\n")
+
+def _diff_path(raw: str) -> Optional[str]:
+    path = raw.split("\t", 1)[0].strip()
+    if path == "/dev/null":
+        return None
+    return path[2:] if path[:2] in ("a/", "b/") else path
+
+def iter_diff_hunks(source, max_hunks_per_file: Optional[int] = None,
+                    max_lines_per_hunk: Optional[int] = None,
+                    summary_only: bool = False) -> Iterator[Dict[str, Any]]:
+    """
+    Parse incrémental d'un diff unifié (str, fichier ou itérable de lignes), en mémoire bornée.
+    Mode normal : un enregistrement par hunk
+        {"file", "old_file", "header", "old_start", "new_start", "added", "removed",
+         "added_lines", "removed_lines", "added_count", "removed_count", "truncated", "snippet"}
+    Les lignes au-delà de max_lines_per_hunk sont comptées mais pas conservées (truncated=True) ;
+    les hunks au-delà de max_hunks_per_file sont comptés dans le résumé du fichier mais pas émis.
+    summary_only : un enregistrement par fichier {"file", "old_file", "status", "hunks", "added_count", "removed_count"}.
     """
-    Parse un texte .diff/.patch en hunks structurés.
+    file_rec: Optional[Dict[str, Any]] = None
+    hunk: Optional[Dict[str, Any]] = None
+    old_left = new_left = 0
+    old_no = new_no = 0
+    minus_seen = False  # en-tête "--- " déjà lu pour le fichier courant
+    snippet: deque = deque(maxlen=_DIFF_SNIPPET_LINES)
+
+    def close_hunk():
+        nonlocal hunk
+        h, hunk = hunk, None
+        if h is None or summary_only:
+            return None
+        h["snippet"] = "\n".join(snippet)
+        if max_hunks_per_file is not None and file_rec["hunks"] > max_hunks_per_file:
+            return None
+        return h
+
+    def close_file():
+        nonlocal file_rec
+        f, file_rec = file_rec, None
+        return f if (summary_only and f is not None) else None
+
+    def new_file(old_path=None, new_path=None):
+        nonlocal file_rec, minus_seen
+        minus_seen = False
+        file_rec = {"file": new_path or old_path, "old_file": old_path, "status": "modified",
+                    "hunks": 0, "added_count": 0, "removed_count": 0}
+
+    for ln in _iter_lines(source):
+        # Contenu d'un hunk : les compteurs de l'en-tête disent combien de lignes consommer
+        if hunk is not None and (old_left > 0 or new_left > 0):
+            tag = ln[:1]
+            if tag == "+" and new_left > 0:
+                new_left -= 1; new_no += 1
+                file_rec["added_count"] += 1; hunk["added_count"] += 1
+                if not summary_only:
+                    if max_lines_per_hunk is None or len(hunk["added"]) + len(hunk["removed"]) < max_lines_per_hunk:
+                        hunk["added"].append(ln[1:]); hunk["added_lines"].append(new_no)
+                    else:
+                        hunk["truncated"] = True
+                    snippet.append(ln)
+                continue
+            if tag == "-" and old_left > 0:
+                old_left -= 1; old_no += 1
+                file_rec["removed_count"] += 1; hunk["removed_count"] += 1
+                if not summary_only:
+                    if max_lines_per_hunk is None or len(hunk["added"]) + len(hunk["removed"]) < max_lines_per_hunk:
+                        hunk["removed"].append(ln[1:]); hunk["removed_lines"].append(old_no)
+                    else:
+                        hunk["truncated"] = True
+                    snippet.append(ln)
+                continue
+            if tag in (" ", "") and old_left > 0 and new_left > 0:
+                old_left -= 1; new_left -= 1; old_no += 1; new_no += 1
+                if not summary_only:
+                    snippet.append(ln)
+                continue
+        if ln.startswith("\\"):  # "\ No newline at end of file"
+            continue
+
+        if ln.startswith("diff --git "):
+            done = close_hunk()
+            if done: yield done
+            done = close_file()
+            if done: yield done
+            parts = ln[len("diff --git "):].split(" b/", 1)
+            new_file(_diff_path(parts[0]), _diff_path("b/" + parts[1]) if len(parts) == 2 else None)
+        elif ln.startswith("--- "):
+            done = close_hunk()
+            if done: yield done
+            if file_rec is None or file_rec["hunks"] or minus_seen or file_rec["status"] == "binary":
+                done = close_file()
+                if done: yield done
+                new_file()
+            minus_seen = True
+            file_rec["old_file"] = _diff_path(ln[4:])
+            if file_rec["old_file"] is None:
+                file_rec["status"] = "added"
+        elif ln.startswith("+++ ") and file_rec is not None and hunk is None:
+            path = _diff_path(ln[4:])
+            if path is None:
+                file_rec["status"] = "deleted"
+            file_rec["file"] = path or file_rec["old_file"]
+        elif ln.startswith("@@ ") and file_rec is not None:
+            m = _HUNK_HEADER_RE.match(ln)
+            if not m:
+                continue
+            done = close_hunk()
+            if done: yield done
+            old_no = int(m.group(1)) - 1 if int(m.group(1)) else 0
+            new_no = int(m.group(3)) - 1 if int(m.group(3)) else 0
+            old_left = int(m.group(2)) if m.group(2) is not None else 1
+            new_left = int(m.group(4)) if m.group(4) is not None else 1
+            file_rec["hunks"] += 1
+            snippet.clear()
+            hunk = {"file": file_rec["file"], "old_file": file_rec["old_file"], "header": ln,
+                    "old_start": int(m.group(1)), "new_start": int(m.group(3)),
+                    "added": [], "removed": [], "added_lines": [], "removed_lines": [],
+                    "added_count": 0, "removed_count": 0, "truncated": False}
+        elif ln.startswith("Binary files ") and file_rec is not None:
+            file_rec["status"] = "binary"
+        elif ln.startswith(("rename from ", "rename to ")) and file_rec is not None:
+            file_rec["status"] = "renamed"
+
+    done = close_hunk()
+    if done: yield done
+    done = close_file()
+    if done: yield done
+
+def parse_diff_tool(diff_text: str, max_hunks_per_file: int = 200, max_lines_per_hunk: int = 2000,
+                    summary_only: bool = False) -> Dict[str, Any]:
+    """
+    Parse un texte .diff/.patch en hunks structurés (un enregistrement par en-tête @@).
     Args:
         diff_text: contenu du diff (string)
+        max_hunks_per_file / max_lines_per_hunk: plafonds (au-delà, compté mais pas retourné)
+        summary_only: seulement fichier + nombre de lignes ajoutées/supprimées (diffs très volumineux)
     Returns:
-        {"hunks":[{"file":str,"header":str,"added":[str],"removed":[str],"snippet":str}, ...]}
+        {"hunks":[{"file":str,"header":str,"added":[str],"removed":[str],"added_lines":[int],
+                   "removed_lines":[int],"truncated":bool,"snippet":str}, ...]}
+        ou, en summary_only : {"files":[{"file","status","hunks","added_count","removed_count"}, ...]}
     """
     if not diff_text:
-        return {"hunks": []}
-
-    hunks: List[Dict[str, Any]] = []
-    lines = diff_text.splitlines()
-    cur_file: Optional[str] = None
-    header = ""
-    added: List[str] = []
-    removed: List[str] = []
-    snippet: List[str] = []
-
-    def commit():
-        nonlocal hunks, cur_file, header, added, removed, snippet
-        if cur_file and (added or removed or snippet):
-            hunks.append({
-                "file": cur_file,
-                "header": header,
-                "added": added[:],
-                "removed": removed[:],
-                "snippet": "\n".join(snippet[-40:])
-            })
-        header, added, removed, snippet = "", [], [], []
-
-    for ln in lines:
-        if ln.startswith("diff --git "):
-            commit()
-            cur_file = None
-        if ln.startswith("+++ ") or ln.startswith("--- "):
-            if ln.startswith("+++ b/"):
-                cur_file = ln[6:]
-            elif ln.startswith("+++ "):
-                cur_file = ln[4:]
-        elif ln.startswith("@@ "):
-            header = ln
-        else:
-            if ln.startswith("+"): added.append(ln[1:])
-            elif ln.startswith("-"): removed.append(ln[1:])
-            snippet.append(ln)
-
-    commit()
-    return {"hunks": hunks}
+        return {"files": []} if summary_only else {"hunks": []}
+    records = list(iter_diff_hunks(diff_text, max_hunks_per_file, max_lines_per_hunk, summary_only))
+    return {"files": records} if summary_only else {"hunks": records}
 
 
 # ---------- JSON / YAML extraction -------------------------------------------
@@ -67,19 +244,8 @@ def extract_json_tool(text: str) -> Dict[str, Any]:
     Args: text
     Returns: {"ok": bool, "data": dict|null}
     """
-    if not text:
-        return {"ok": False, "data": None}
-    try:
-        return {"ok": True, "data": json.loads(text)}
-    except Exception:
-        start = text.find("{")
-        end = text.rfind("}")
-        if start >= 0 and end > start:
-            try:
-                return {"ok": True, "data": json.loads(text[start:end+1])}
-            except Exception:
-                return {"ok": False, "data": None}
-        return {"ok": False, "data": None}
+    data = _extract_json(text)
+    return {"ok": data is not None, "data": copy.deepcopy(data)}  # copie : l'appelant peut la modifier
 
 def extract_yaml_tool(text: str) -> Dict[str, Any]:
     """
@@ -87,13 +253,192 @@ def extract_yaml_tool(text: str) -> Dict[str, Any]:
     Args: text
     Returns: {"ok": bool, "data": dict|null}
     """
-    if not text or yaml is None:
-        return {"ok": False, "data": None}
+    data = _extract_yaml(text)
+    return {"ok": data is not None, "data": copy.deepcopy(data)}
+
+
+# ---------- XML streaming (JUnit / Cobertura / JaCoCo) -------------------------
+def _xml_source(source, path: Optional[str] = None):
+    """
+    Texte XML (str/bytes) ou fichier ouvert -> objet accepté par iterparse. Une str est toujours du
+    contenu, jamais un chemin : seul `path`, explicite et hors arguments d'outil, ouvre un fichier.
+    """
+    if path is not None:
+        return path
+    if isinstance(source, bytes):
+        return io.BytesIO(source)
+    if isinstance(source, str):
+        return io.BytesIO(source.encode("utf-8"))
+    return source
+
+def _local(tag: str) -> str:
+    return tag.rsplit("}", 1)[-1]
+
+def _iter_xml(source, path: Optional[str] = None) -> Iterator[Any]:
+    """
+    iterparse avec élagage : yield ("start"|"end", elem, stack) ; après chaque "end", l'élément
+    est vidé et détaché de son parent, donc la mémoire reste bornée quelle que soit la taille du rapport.
+    """
+    stack: List[Any] = []
+    for event, elem in ET.iterparse(_xml_source(source, path), events=("start", "end")):
+        if event == "start":
+            stack.append(elem)
+            yield event, elem, stack
+            continue
+        yield event, elem, stack
+        stack.pop()
+        elem.clear()
+        if stack:
+            stack[-1].remove(elem)
+
+def _int_attr(elem, name: str) -> int:
     try:
-        data = yaml.safe_load(text)
-        return {"ok": True, "data": data}
+        return int(float(elem.attrib.get(name, 0) or 0))
+    except ValueError:
+        return 0
+
+_JUNIT_STATUS_RANK = {"passed": 0, "skipped": 1, "failure": 2, "error": 3}
+
+def stream_junit(source=None, slowest: int = 20, max_failed: int = 200, path: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Rapport JUnit en streaming : totaux (attributs des suites de plus haut niveau, ou comptage des
+    testcase à défaut), suites, les `slowest` cas les plus lents et jusqu'à `max_failed` cas en échec.
+    source : texte XML ou fichier ouvert ; path : chemin d'un rapport (usage interne uniquement).
+    """
+    totals = {"tests": 0, "failures": 0, "errors": 0, "skipped": 0}
+    counted = {"tests": 0, "failures": 0, "errors": 0, "skipped": 0}
+    has_attrs = False
+    time_total = 0.0
+    suites: List[Dict[str, Any]] = []
+    slow_heap: List[Any] = []
+    failed: List[Dict[str, Any]] = []
+    case_status, case_msg = None, ""
+    seq = 0
+    for event, elem, stack in _iter_xml(source, path):
+        tag = _local(elem.tag)
+        if event == "start":
+            if tag == "testcase":
+                case_status, case_msg = "passed", ""
+            elif tag == "testsuite":
+                top = not any(_local(e.tag) == "testsuite" for e in stack[:-1])
+                if top and "tests" in elem.attrib:
+                    has_attrs = True
+                    for k in totals:
+                        totals[k] += _int_attr(elem, k)
+                    time_total += _to_number(elem.attrib.get("time"))
+                suites.append({"name": elem.attrib.get("name"), "tests": _int_attr(elem, "tests"),
+                               "failures": _int_attr(elem, "failures"), "errors": _int_attr(elem, "errors"),
+                               "skipped": _int_attr(elem, "skipped"), "time": _to_number(elem.attrib.get("time"))})
+            continue
+        if tag in _JUNIT_STATUS_RANK and case_status is not None:
+            # error > failure > skipped si plusieurs marqueurs
+            if _JUNIT_STATUS_RANK[tag] > _JUNIT_STATUS_RANK[case_status]:
+                case_status = tag
+                if tag != "skipped":
+                    case_msg = (elem.attrib.get("message") or (elem.text or "").strip())[:500]
+        elif tag == "testcase":
+            counted["tests"] += 1
+            key = {"failure": "failures", "error": "errors", "skipped": "skipped"}.get(case_status)
+            if key:
+                counted[key] += 1
+            case = {"name": elem.attrib.get("name"), "classname": elem.attrib.get("classname"),
+                    "time": _to_number(elem.attrib.get("time")), "status": case_status}
+            if case_status in ("failure", "error") and len(failed) < max_failed:
+                case["message"] = case_msg
+                failed.append(case)
+            seq += 1
+            if len(slow_heap) < slowest:
+                heapq.heappush(slow_heap, (case["time"], seq, case))
+            elif slowest and case["time"] > slow_heap[0][0]:
+                heapq.heapreplace(slow_heap, (case["time"], seq, case))
+            case_status = None
+    result = dict(totals) if has_attrs else dict(counted)
+    result["time"] = round(time_total if has_attrs else sum(s["time"] for s in suites), 3)
+    result["suites"] = suites
+    result["cases_parsed"] = counted["tests"]
+    result["slowest"] = [c for _, _, c in sorted(slow_heap, key=lambda x: (-x[0], x[1]))]
+    result["failed"] = failed
+    return result
+
+def _junit_totals(xml_text: str) -> Dict[str, Any]:
+    empty = {"tests": 0, "failures": 0, "errors": 0, "skipped": 0}
+    if not xml_text:
+        return empty
+    try:
+        r = cached_parse("junit-totals", xml_text, lambda t: stream_junit(t, slowest=0, max_failed=0))
+        return {k: r[k] for k in empty}
     except Exception:
-        return {"ok": False, "data": None}
+        return empty
+
+def _pct(covered: int, valid: int) -> float:
+    return round(covered / valid * 100.0, 2) if valid else 0.0
+
+def stream_coverage_xml(source=None, path: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Couverture Cobertura (coverage.py, gcovr, ...) ou JaCoCo en streaming (texte XML, fichier ouvert
+    ou `path` explicite, usage interne uniquement).
+    Returns: {"line_pct", "branch_pct", "lines_valid", "lines_covered", "branches_valid", "branches_covered",
+              "packages": {nom: {...}}, "files": {chemin: {...}}} ; chaque entrée a les mêmes compteurs + pct.
+    """
+    def bucket():
+        return {"lines_valid": 0, "lines_covered": 0, "branches_valid": 0, "branches_covered": 0}
+    totals = bucket()
+    packages: Dict[str, Dict[str, Any]] = {}
+    files: Dict[str, Dict[str, Any]] = {}
+    root_rates: Dict[str, float] = {}
+    cond_re = re.compile(r"\((\d+)/(\d+)\)")
+    for event, elem, stack in _iter_xml(source, path):
+        tag = _local(elem.tag)
+        if event == "start":
+            if len(stack) == 1 and tag == "coverage":
+                for k in ("line-rate", "branch-rate"):
+                    if k in elem.attrib:
+                        root_rates[k] = _to_number(elem.attrib[k])
+            continue
+        parent = _local(stack[-2].tag) if len(stack) >= 2 else ""
+        grand = _local(stack[-3].tag) if len(stack) >= 3 else ""
+        if tag == "line" and parent == "lines" and grand == "class":
+            # Cobertura : les lignes de <methods> dupliquent celles de la classe, on ne compte que ces dernières
+            cls, pkg = stack[-3], next((e for e in reversed(stack) if _local(e.tag) == "package"), None)
+            targets = [totals, files.setdefault(cls.attrib.get("filename") or cls.attrib.get("name", "?"), bucket())]
+            if pkg is not None:
+                targets.append(packages.setdefault(pkg.attrib.get("name", ""), bucket()))
+            hit = _int_attr(elem, "hits") > 0
+            m = cond_re.search(elem.attrib.get("condition-coverage", "")) if elem.attrib.get("branch") == "true" else None
+            for t in targets:
+                t["lines_valid"] += 1
+                t["lines_covered"] += hit
+                if m:
+                    t["branches_covered"] += int(m.group(1)); t["branches_valid"] += int(m.group(2))
+        elif tag == "counter" and elem.attrib.get("type") in ("LINE", "BRANCH"):
+            # JaCoCo : compteurs agrégés au niveau report / package / sourcefile
+            kind = "lines" if elem.attrib["type"] == "LINE" else "branches"
+            missed, covered = _int_attr(elem, "missed"), _int_attr(elem, "covered")
+            target = None
+            if parent == "report":
+                target = totals
+            elif parent == "package":
+                target = packages.setdefault(stack[-2].attrib.get("name", ""), bucket())
+            elif parent == "sourcefile":
+                pkg = stack[-3].attrib.get("name", "") if grand == "package" else ""
+                target = files.setdefault(f"{pkg}/{stack[-2].attrib.get('name', '?')}".lstrip("/"), bucket())
+            if target is not None:
+                target[f"{kind}_valid"] += missed + covered
+                target[f"{kind}_covered"] += covered
+
+    def finish(b):
+        b["line_pct"] = _pct(b["lines_covered"], b["lines_valid"])
+        b["branch_pct"] = _pct(b["branches_covered"], b["branches_valid"])
+        return b
+    result = finish(totals)
+    # Les taux déclarés à la racine Cobertura font foi s'ils existent (compatibilité)
+    if "line-rate" in root_rates:
+        result["line_pct"] = round(root_rates["line-rate"] * 100.0, 2)
+    if "branch-rate" in root_rates:
+        result["branch_pct"] = round(root_rates["branch-rate"] * 100.0, 2)
+    result["packages"] = {k: finish(v) for k, v in packages.items()}
+    result["files"] = {k: finish(v) for k, v in files.items()}
+    return result
 
 
 # ---------- Coverage (coverage.xml / lcov.info) ------------------------------
@@ -106,104 +451,566 @@ def coverage_from_coverage_xml_tool(xml_text: str) -> Dict[str, Any]:
     if not xml_text:
         return {"line_pct": 0.0, "branch_pct": 0.0}
     try:
-        root = ET.fromstring(xml_text)
-        line_rate = float(root.attrib.get("line-rate", 0.0)) * 100.0
-        branch_rate = float(root.attrib.get("branch-rate", 0.0)) * 100.0
-        return {"line_pct": round(line_rate, 2), "branch_pct": round(branch_rate, 2)}
+        cov = cached_parse("coverage-xml", xml_text, stream_coverage_xml)
+        return {"line_pct": cov["line_pct"], "branch_pct": cov["branch_pct"]}
     except Exception:
         return {"line_pct": 0.0, "branch_pct": 0.0}
 
+_LCOV_SF_RE = re.compile(rb"^SF:(.*?)\r?$", re.M)
+_LCOV_DA_ZERO_RE = re.compile(rb"\nDA:\d+,-?0+(?=[,\r\n]|$)")
+_LCOV_DA_ZERO_LINE_RE = re.compile(rb"\nDA:(\d+),-?0+(?=[,\r\n]|$)")
+_LCOV_BRDA_MISS_RE = re.compile(rb"\nBRDA:[^,\n]*,[^,\n]*,[^,\n]*,(?:-|0+)(?=[\r\n]|$)")
+_LCOV_FNDA_ZERO_RE = re.compile(rb"\nFNDA:0+,")
+
+def parse_lcov(source=None, uncovered_lines: bool = False, path: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Moteur lcov en une passe : texte ou bytes, ou `path` explicite (lu via mmap, sans charger le
+    fichier en str ; usage interne uniquement, une str n'est jamais interprétée comme chemin).
+    Chaque section SF:...end_of_record est comptée par recherches C (bytes.count / regex), sans
+    boucle Python par ligne. Les résultats sont des tableaux colonnes (array) alignés sur "files" :
+        lines_total, lines_hit, branches_total, branches_hit, functions_total, functions_hit
+    Des enregistrements avant le premier SF: forment un fichier anonyme ("").
+    uncovered_lines=True ajoute "uncovered": [array('I') des lignes non couvertes] par fichier.
+    """
+    mm = None
+    if path is not None:
+        with open(path, "rb") as fh:
+            if os.fstat(fh.fileno()).st_size == 0:
+                buf = b""
+            else:
+                buf = mm = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+    else:
+        buf = (source or "").encode("utf-8") if isinstance(source, str) or source is None else source
+    out: Dict[str, Any] = {"files": []}
+    cols = ("lines_total", "lines_hit", "branches_total", "branches_hit", "functions_total", "functions_hit")
+    for c in cols:
+        out[c] = array("q")
+    if uncovered_lines:
+        out["uncovered"] = []
+    try:
+        starts = [(m.start(), m.group(1).decode("utf-8", errors="replace")) for m in _LCOV_SF_RE.finditer(buf)]
+        first = starts[0][0] if starts else len(buf)
+        # Préfixe sans SF: (lcov tronqué ou fusionné à la main) : "\n" en tête pour compter la 1re ligne
+        head = b"\n" + buf[:first] if first else b""
+        if head.count(b"\nDA:") or head.count(b"\nBRDA:") or head.count(b"\nFN"):
+            starts.insert(0, (None, ""))
+        for i, (start, name) in enumerate(starts):
+            end = starts[i + 1][0] if i + 1 < len(starts) else len(buf)
+            sec = head if start is None else buf[start:end]
+            da = sec.count(b"\nDA:")
+            brda = sec.count(b"\nBRDA:")
+            fn = sec.count(b"\nFN:")
+            fnda = sec.count(b"\nFNDA:")
+            out["files"].append(name)
+            out["lines_total"].append(da)
+            out["lines_hit"].append(da - len(_LCOV_DA_ZERO_RE.findall(sec)) if da else 0)
+            out["branches_total"].append(brda)
+            out["branches_hit"].append(brda - len(_LCOV_BRDA_MISS_RE.findall(sec)) if brda else 0)
+            out["functions_total"].append(fn or fnda)
+            out["functions_hit"].append(fnda - len(_LCOV_FNDA_ZERO_RE.findall(sec)) if fnda else 0)
+            if uncovered_lines:
+                out["uncovered"].append(array("I", (int(x) for x in _LCOV_DA_ZERO_LINE_RE.findall(sec))))
+    finally:
+        if mm is not None:
+            mm.close()
+    return out
+
 def coverage_from_lcov_tool(lcov_text: str) -> Dict[str, Any]:
     """
-    Calcule un % ligne depuis un lcov.info.
+    Calcule les % ligne / branche / fonction depuis un lcov.info, global et par fichier.
     Args: lcov_text
-    Returns: {"line_pct": float, "lines_total": int, "lines_covered": int}
+    Returns: {"line_pct": float, "lines_total": int, "lines_covered": int,
+              "branch_pct", "branches_total", "branches_covered", "function_pct", "functions_total",
+              "functions_covered", "files_count", "lowest_files": [{file, line_pct, branch_pct, lines_total}] (20 max)}
     """
     if not lcov_text:
         return {"line_pct": 0.0, "lines_total": 0, "lines_covered": 0}
-    total, covered = 0, 0
-    for line in lcov_text.splitlines():
-        if line.startswith("DA:"):
-            try:
-                _, rest = line.split("DA:", 1)
-                _, count = rest.split(",")
-                total += 1
-                if int(count) > 0:
-                    covered += 1
-            except Exception:
+    r = cached_parse("lcov", lcov_text, parse_lcov)
+    total, covered = sum(r["lines_total"]), sum(r["lines_hit"])
+    br_total, br_hit = sum(r["branches_total"]), sum(r["branches_hit"])
+    fn_total, fn_hit = sum(r["functions_total"]), sum(r["functions_hit"])
+    per_file = [
+        {"file": f, "line_pct": _pct(r["lines_hit"][i], r["lines_total"][i]),
+         "branch_pct": _pct(r["branches_hit"][i], r["branches_total"][i]), "lines_total": r["lines_total"][i]}
+        for i, f in enumerate(r["files"]) if r["lines_total"][i]
+    ]
+    return {
+        "line_pct": _pct(covered, total), "lines_total": total, "lines_covered": covered,
+        "branch_pct": _pct(br_hit, br_total), "branches_total": br_total, "branches_covered": br_hit,
+        "function_pct": _pct(fn_hit, fn_total), "functions_total": fn_total, "functions_covered": fn_hit,
+        "files_count": len(r["files"]),
+        "lowest_files": heapq.nsmallest(20, per_file, key=lambda x: (x["line_pct"], -x["lines_total"])),
+    }
+
+
+# ---------- Security findings (Bandit / Semgrep / SARIF / Veracode / Checkmarx) ----
+# Un seul parse par rapport : le format est deviné sur l'en-tête, puis les findings sont lus
+# un par un (tableaux JSON décodés élément par élément, XML Veracode en iterparse) et normalisés en
+# {"rule_id","title","severity","file","line","message","cwe","type","tool","fingerprint"}.
+SEC_SNIFF_BYTES = 64 * 1024
+_JSON_READ_BLOCK = 1024 * 1024
+_SEC_KEY_RE = re.compile(r'"(results|vulnerabilities|findings|driver)"\s*:\s*([\[{])')
+_SEC_SNIFF = [  # (format, motif sur l'en-tête) : du plus spécifique au plus générique
+    ("sarif", re.compile(r'"\$schema"\s*:\s*"[^"]*sarif|"runs"\s*:\s*\[', re.I)),
+    ("bandit", re.compile(r'["\']?(?:test_id|issue_severity|issue_confidence)["\']?\s*:')),
+    ("semgrep", re.compile(r'["\']?check_id["\']?\s*:')),
+    ("checkmarx", re.compile(r'["\']?(?:queryName|queryID|resultDescription)["\']?\s*:')),
+    ("veracode", re.compile(r'<(?:detailedreport|flaw)\b|["\']?cweid["\']?\s*[:=]|["\']?findings["\']?\s*:')),
+    ("generic", re.compile(r'["\']?vulnerabilities["\']?\s*:')),
+]
+_SEC_SEVERITY = {"CRITICAL": "CRITICAL", "VERY HIGH": "CRITICAL", "HIGH": "HIGH", "ERROR": "HIGH",
+                 "MEDIUM": "MEDIUM", "MODERATE": "MEDIUM", "WARNING": "MEDIUM", "LOW": "LOW",
+                 "INFO": "LOW", "NOTE": "LOW", "NONE": "LOW", "INFORMATIONAL": "LOW"}
+_SEC_LEVELS = frozenset(_SEC_SEVERITY.values())
+
+def sniff_security_format(head: str) -> Optional[str]:
+    """sarif | bandit | semgrep | checkmarx | veracode | generic, ou None (tableau 'results' sans indice)."""
+    for fmt, pat in _SEC_SNIFF:
+        if pat.search(head or ""):
+            return fmt
+    return None
+
+def _sec_severity(value, default: str = "LOW") -> str:
+    if value is None or value == "":
+        return default
+    try:  # Veracode : 0-5
+        n = int(value)
+        return "HIGH" if n >= 4 else "MEDIUM" if n == 3 else "LOW"
+    except (TypeError, ValueError):
+        pass
+    s = str(value).strip().upper()
+    return _SEC_SEVERITY.get(s, s)
+
+def finding_fingerprint(tool: str, rule_id, file, anchor) -> str:
+    """Empreinte stable : outil, règle, fichier et extrait de code (espaces normalisés) ou, à défaut, ligne."""
+    anchor = re.sub(r"\s+", " ", str(anchor or "")).strip()
+    raw = "\x1f".join([str(tool or ""), str(rule_id or ""), str(file or "").replace("\\", "/").lstrip("./"), anchor])
+    return hashlib.sha256(raw.encode("utf-8", errors="replace")).hexdigest()[:20]
+
+def _finding(tool, rule_id, title, severity, file, line, message="", cwe=None, type_="security_issue",
+             anchor=None, fingerprint=None) -> Dict[str, Any]:
+    try:
+        line = int(line) if line not in (None, "") else None
+    except (TypeError, ValueError):
+        pass
+    if not anchor:  # sans extrait : ligne + contenu, deux findings distincts au même endroit ne fusionnent pas
+        anchor = "\x1f".join(str(x or "") for x in (line, title, message, cwe))
+    return {"rule_id": rule_id, "title": title, "severity": severity, "file": file, "line": line,
+            "message": message, "cwe": cwe, "type": type_, "tool": tool,
+            "fingerprint": fingerprint or finding_fingerprint(tool, rule_id, file, anchor)}
+
+def _from_bandit(r, ctx):
+    cwe = r.get("issue_cwe") or {}
+    return _finding("bandit", r.get("test_id") or r.get("test_name"), r.get("issue_text"),
+                    _sec_severity(r.get("issue_severity")), r.get("filename"), r.get("line_number"),
+                    r.get("more_info") or r.get("issue_confidence"),
+                    cwe.get("id") if isinstance(cwe, dict) else cwe, anchor=r.get("code"))
+
+def _from_semgrep(r, ctx):
+    extra = r.get("extra") or {}
+    loc = r.get("path") or ((extra.get("metavars") or {}).get("path") or {}).get("abstract_content")
+    meta = extra.get("metadata") or {}
+    cwe = meta.get("cwe")
+    lines = extra.get("lines")
+    return _finding("semgrep", r.get("check_id") or r.get("rule_id"), extra.get("message") or "Semgrep finding",
+                    _sec_severity(extra.get("severity")), loc, (r.get("start") or {}).get("line"),
+                    meta.get("shortlink", ""), cwe[0] if isinstance(cwe, list) and cwe else cwe,
+                    anchor=lines if lines and lines != "requires login" else None,
+                    fingerprint=extra.get("fingerprint") if extra.get("fingerprint") not in (None, "requires login") else None)
+
+def _from_checkmarx(r, ctx):
+    return _finding("checkmarx", r.get("queryName") or r.get("queryID"), r.get("queryName") or r.get("queryID"),
+                    _sec_severity(r.get("severity")), r.get("fileName") or r.get("path"),
+                    r.get("line") or r.get("lineNumber"), r.get("description") or r.get("resultDescription") or "",
+                    r.get("cweId") or r.get("cwe"), fingerprint=r.get("similarityId") and f"cx-{r['similarityId']}")
+
+def _from_veracode(f, ctx):
+    # XML (flaw) : attributs à plat ; JSON (API findings) : issue_id, détails sous finding_details
+    d = f.get("finding_details") or {}
+    cwe = f.get("cwe") or f.get("cweid") or d.get("cwe")
+    if isinstance(cwe, dict):
+        cwe = cwe.get("id")
+    category = d.get("finding_category")
+    issue_id = f.get("issueid") or f.get("issue_id")
+    return _finding("veracode", cwe, f.get("title") or f.get("categoryname")
+                    or (category.get("name") if isinstance(category, dict) else category),
+                    _sec_severity(f.get("severity", d.get("severity"))),
+                    f.get("file") or f.get("sourcefilepath") or d.get("file_path") or f.get("module") or d.get("module"),
+                    f.get("line") or d.get("file_line_number"), f.get("desc") or f.get("description") or "", cwe,
+                    anchor=issue_id and f"issue-{issue_id}")
+
+def _from_generic(v, ctx):
+    return _finding(v.get("tool") or "unknown", v.get("id") or v.get("rule_id") or v.get("type"),
+                    v.get("title") or v.get("description") or "", _sec_severity(v.get("severity")),
+                    v.get("file") or v.get("path") or "", v.get("line") or v.get("lineNumber"),
+                    v.get("description") or v.get("title") or "", v.get("cwe"), v.get("type", "vulnerability"))
+
+def _from_sarif(r, ctx):
+    rule_id = r.get("ruleId") or (r.get("rule") or {}).get("id")
+    rule = ctx.get("rules", {}).get(rule_id) or {}
+    level = r.get("level") or (rule.get("defaultConfiguration") or {}).get("level") or "warning"
+    props = rule.get("properties") or {}
+    sev = props.get("security-severity")
+    if sev is not None:  # score CVSS (GitHub code scanning)
+        score = _to_number(sev)
+        severity = "CRITICAL" if score >= 9 else "HIGH" if score >= 7 else "MEDIUM" if score >= 4 else "LOW"
+    else:
+        severity = _sec_severity(level)
+    phys = ((r.get("locations") or [{}])[0] or {}).get("physicalLocation") or {}
+    region = phys.get("region") or {}
+    partial = r.get("partialFingerprints") or r.get("fingerprints") or {}
+    tags = [t for t in props.get("tags", []) if str(t).upper().startswith("CWE")]
+    tool = ctx.get("tool") or "sarif"
+    return _finding(tool, rule_id, (rule.get("shortDescription") or {}).get("text") or rule_id,
+                    severity, (phys.get("artifactLocation") or {}).get("uri"), region.get("startLine"),
+                    (r.get("message") or {}).get("text", ""), tags[0] if tags else None,
+                    anchor=(region.get("snippet") or {}).get("text"),
+                    fingerprint=partial and f"{tool}-{sorted(partial.items())[0][1]}")
+
+_SEC_NORMALIZERS = {"bandit": _from_bandit, "semgrep": _from_semgrep, "checkmarx": _from_checkmarx,
+                    "veracode": _from_veracode, "generic": _from_generic, "sarif": _from_sarif}
+# Clé du tableau de findings attendue par format (None : toutes)
+_SEC_ARRAY_KEYS = {"bandit": "results", "semgrep": "results", "checkmarx": "results", "sarif": "results",
+                   "veracode": "findings", "generic": "vulnerabilities"}
+
+class _Prefixed:
+    """Flux dont l'en-tête (déjà lu pour deviner le format) est rejoué avant la suite."""
+
+    def __init__(self, head: str, stream):
+        self._head, self._stream = io.StringIO(head), stream
+
+    def read(self, n: int = -1) -> str:
+        return self._head.read(n) or self._stream.read(n)
+
+def _text_stream(source):
+    """
+    Texte, bytes ou fichier ouvert -> flux texte. Une str est toujours du contenu, jamais un chemin :
+    les appelants internes qui lisent un fichier l'ouvrent eux-mêmes et passent le fichier.
+    """
+    if isinstance(source, bytes):
+        return io.StringIO(source.decode("utf-8", errors="replace"))
+    if isinstance(source, str):
+        return io.StringIO(source)
+    if isinstance(source, (io.BufferedIOBase, io.RawIOBase)) or "b" in getattr(source, "mode", ""):
+        return io.TextIOWrapper(source, encoding="utf-8", errors="replace")
+    return source
+
+def iter_json_keyed(stream, block_size: int = _JSON_READ_BLOCK) -> Iterator[Any]:
+    """
+    Décodage incrémental : yield (clé, élément) pour chaque élément des tableaux "results" /
+    "vulnerabilities" / "findings" (à toute profondeur, ex. runs[].results SARIF) et ("driver", objet).
+    Un seul élément est matérialisé à la fois ; un document qui est lui-même un tableau donne ("results", ...).
+    """
+    dec = json.JSONDecoder()
+    buf, pos, eof = "", 0, False
+    key: Optional[str] = None
+
+    def more() -> bool:
+        nonlocal buf, pos, eof
+        block = stream.read(block_size)
+        if not block:
+            eof = True
+            return False
+        buf, pos = buf[pos:] + block, 0
+        return True
+
+    more()
+    start = len(buf) - len(buf.lstrip())
+    if buf[start:start + 1] == "[":
+        key, pos = "results", start + 1
+    while True:
+        if key is None:
+            m = _SEC_KEY_RE.search(buf, pos)
+            if not m:
+                pos = max(pos, len(buf) - 64)  # une clé coupée en fin de bloc est gardée
+                if not more():
+                    return
+                continue
+            if m.group(2) == "{":
+                if m.group(1) != "driver":  # "findings": {...} : on explore l'intérieur
+                    pos = m.end()
+                    continue
+                try:
+                    obj, pos = dec.raw_decode(buf, m.start(2))
+                except ValueError:
+                    if more():
+                        continue
+                    return
+                yield "driver", obj
+                continue
+            key, pos = m.group(1), m.end()
+            continue
+        while pos < len(buf) and buf[pos] in " \t\r\n,":
+            pos += 1
+        if pos >= len(buf):
+            if not more():
+                return
+            continue
+        if buf[pos] == "]":
+            key, pos = None, pos + 1
+            continue
+        try:
+            item, end = dec.raw_decode(buf, pos)
+        except ValueError:
+            if not eof and more():
+                continue
+            return
+        pos = end
+        yield key, item
+
+def _iter_yaml_keyed(text: str) -> Iterator[Any]:
+    data = _extract_yaml(text)
+    if isinstance(data, list):
+        data = {"results": data}
+    if not isinstance(data, dict):
+        return
+    for run in data.get("runs") or []:
+        yield "driver", ((run or {}).get("tool") or {}).get("driver") or {}
+        for r in (run or {}).get("results") or []:
+            yield "results", r
+    for key in ("results", "vulnerabilities", "findings"):
+        for item in data.get(key) or []:
+            yield key, item
+
+def iter_security_findings(source, default_format: Optional[str] = None, fmt: Optional[str] = None,
+                           dedupe: bool = True, stats: Optional[Dict[str, Any]] = None) -> Iterator[Dict[str, Any]]:
+    """
+    Findings normalisés d'un rapport (texte ou fichier ouvert), en un seul passage.
+    Le format est deviné sur les SEC_SNIFF_BYTES premiers octets (sinon `default_format`) ;
+    les doublons (même empreinte) sont écartés et comptés dans stats["duplicates"].
+    """
+    stats = stats if stats is not None else {}
+    stream = _text_stream(source)
+    head = stream.read(SEC_SNIFF_BYTES)
+    fmt = fmt or sniff_security_format(head) or default_format or "checkmarx"
+    stats.update({"format": fmt, "duplicates": 0})
+    normalize = _SEC_NORMALIZERS[fmt]
+    want = _SEC_ARRAY_KEYS.get(fmt)
+    seen = set()
+
+    if head.lstrip().startswith("<"):
+        items = (("findings", dict(e.attrib)) for ev, e, _ in _iter_xml(_Prefixed(head, stream))
+                 if ev == "end" and _local(e.tag) == "flaw")
+    elif head.lstrip()[:1] in ("{", "[") or _SEC_KEY_RE.search(head):
+        items = iter_json_keyed(_Prefixed(head, stream))
+    else:
+        items = _iter_yaml_keyed(head + stream.read())
+
+    ctx: Dict[str, Any] = {}
+    for key, item in items:
+        if key == "driver":
+            ctx = {"tool": (item.get("name") or "sarif").lower(),
+                   "rules": {r.get("id"): r for r in item.get("rules") or [] if isinstance(r, dict)}}
+            continue
+        if (want and key != want) or not isinstance(item, dict):
+            continue
+        finding = normalize(item, ctx)
+        if dedupe:
+            if finding["fingerprint"] in seen:
+                stats["duplicates"] += 1
                 continue
-    pct = (covered / total * 100.0) if total else 0.0
-    return {"line_pct": round(pct, 2), "lines_total": total, "lines_covered": covered}
+            seen.add(finding["fingerprint"])
+        yield finding
 
+def scan_security_report(source, default_format: Optional[str] = None, fmt: Optional[str] = None,
+                         dedupe: bool = True) -> Dict[str, Any]:
+    """Returns: {"format", "findings":[finding normalisé], "by_severity", "duplicates"}"""
+    def scan(src) -> Dict[str, Any]:
+        stats: Dict[str, Any] = {}
+        try:
+            findings = list(iter_security_findings(src, default_format, fmt, dedupe, stats))
+        except Exception as e:
+            return {"format": stats.get("format"), "findings": [], "by_severity": {}, "duplicates": 0, "error": str(e)}
+        return {"format": stats["format"], "findings": findings,
+                "by_severity": _count_by(findings, "severity"), "duplicates": stats["duplicates"]}
+    return cached_parse(f"security:{default_format}:{fmt}:{int(dedupe)}", source, scan)
+
+def _project(report: Dict[str, Any], fields: Dict[str, str]) -> List[Dict[str, Any]]:
+    """Findings normalisés -> forme historique d'un outil ({clé de sortie: clé normalisée}) + empreinte."""
+    return [{**{out: f.get(src) for out, src in fields.items()}, "fingerprint": f["fingerprint"]}
+            for f in report["findings"]]
+
+_LEGACY_FINDING = {"rule_id": "rule_id", "title": "title", "severity": "severity", "file": "file",
+                   "line": "line", "message": "message"}
 
-# ---------- Security (Semgrep / Bandit) --------------------------------------
 def normalize_bandit_tool(doc_text: str) -> Dict[str, Any]:
     """
-    Normalise un rapport Bandit (JSON ou YAML) en findings génériques.
+    Normalise un rapport Bandit (JSON, YAML ou SARIF) en findings génériques.
     Args: doc_text
-    Returns: {"findings":[{"rule_id","title","severity","file","line","message"}]}
-    """
-    data = extract_json_tool(doc_text)["data"] or extract_yaml_tool(doc_text)["data"] or {}
-    findings: List[Dict[str, Any]] = []
-    for r in (data or {}).get("results", []):
-        findings.append({
-            "rule_id": r.get("test_id") or r.get("test_name"),
-            "title": r.get("issue_text"),
-            "severity": (r.get("issue_severity") or "LOW").upper(),
-            "file": r.get("filename"),
-            "line": r.get("line_number"),
-            "message": r.get("more_info") or r.get("issue_confidence"),
-        })
-    return {"findings": findings}
+    Returns: {"findings":[{"rule_id","title","severity","file","line","message","fingerprint"}], "format", "duplicates"}
+    """
+    report = scan_security_report(doc_text, default_format="bandit")
+    return {"findings": _project(report, _LEGACY_FINDING), "format": report["format"],
+            "duplicates": report["duplicates"]}
 
 def normalize_semgrep_tool(doc_text: str) -> Dict[str, Any]:
     """
-    Normalise un rapport Semgrep (JSON ou YAML) en findings génériques.
+    Normalise un rapport Semgrep (JSON, YAML ou SARIF) en findings génériques.
     Args: doc_text
-    Returns: {"findings":[{"rule_id","title","severity","file","line","message"}]}
-    """
-    data = extract_json_tool(doc_text)["data"] or extract_yaml_tool(doc_text)["data"] or {}
-    findings: List[Dict[str, Any]] = []
-    for r in (data or {}).get("results", []):
-        loc = r.get("path") or (r.get("extra", {}).get("metavars", {}).get("path", {}).get("abstract_content"))
-        sev = (r.get("extra", {}).get("severity") or "LOW").upper()
-        findings.append({
-            "rule_id": r.get("check_id") or r.get("rule_id"),
-            "title": r.get("extra", {}).get("message") or "Semgrep finding",
-            "severity": sev,
-            "file": loc or r.get("path"),
-            "line": (r.get("start") or {}).get("line"),
-            "message": (r.get("extra", {}).get("metadata") or {}).get("shortlink", ""),
-        })
-    return {"findings": findings}
+    Returns: {"findings":[{"rule_id","title","severity","file","line","message","fingerprint"}], "format", "duplicates"}
+    """
+    report = scan_security_report(doc_text, default_format="semgrep")
+    return {"findings": _project(report, _LEGACY_FINDING), "format": report["format"],
+            "duplicates": report["duplicates"]}
 
 
 # ---------- Stack traces ------------------------------------------------------
-_STACK_PATTERNS = [
-    re.compile(r'File "([^"]+)", line (\d+), in ([^\n]+)'),        # Python
-    re.compile(r'at ([\w./-]+):(\d+):\d+'),                        # JS/TS
-    re.compile(r'at ([\w.$/\\-]+)\(([\w./-]+):(\d+)\)'),           # Java (Class.method(File.java:123))
-]
+# Une ligne = au plus un frame (Python / Java / JS) ; l'entrée est lue une fois, ligne à ligne.
+# Recherche non ancrée à gauche : tolère un préfixe de log (horodatage, "web_1  | " de docker-compose)
+_PY_FRAME_RE = re.compile(r'(?:^|\s)File "([^"]+)", line (\d+)(?:, in (.+))?$')
+# at pkg.Class.method(File.java:123), suivi éventuellement des données de packaging logback (~[app.jar:1.0])
+_JAVA_FRAME_RE = re.compile(r'(?:^|\s)at ([\w$.<>/\-]+)\(([^()]*?)(?::(\d+))?\)(?:\s+~?\[[^\]]*\])?$')
+_JS_FRAME_RE = re.compile(r'(?:^|\s)at (?:(?:async )?(.+?) \()?([^\s()]+?):(\d+)(?::\d+)?\)?$')  # at fn (file.js:1:2) | at file.js:1:2
+_PY_TRACEBACK = "Traceback (most recent call last)"
+_EXC_HEADER_RE = re.compile(
+    r'(?:^|\s|:)((?:[A-Za-z_$][\w$]*\.)*[A-Za-z_$][\w$]*(?:Exception|Error|Throwable|Fault|Interrupt|Exit))(?::\s?(.*))?$'
+)
+_EXC_HINTS = ("Exception", "Error", "Throwable", "Fault", "Interrupt", "Exit")  # filtre avant la regex d'en-tête
+_PY_EXC_LINE_RE = re.compile(r'^([A-Za-z_][\w.]*)(?::\s?(.*))?$')
+_STACK_CONTINUATION_RE = re.compile(r'^\.\.\. \d+ (?:more|common frames omitted)$')
+STACK_FINGERPRINT_FRAMES = 8
 
-def parse_stacktrace_tool(text: str) -> Dict[str, Any]:
+def _parse_frame(s: str) -> Optional[Dict[str, Any]]:
+    if 'File "' in s:
+        m = _PY_FRAME_RE.search(s)
+        if m:
+            return {"file": m.group(1), "line": int(m.group(2)), "symbol": (m.group(3) or "").strip(), "lang": "python"}
+    if "at " not in s:
+        return None
+    m = _JAVA_FRAME_RE.search(s)
+    if m:
+        return {"file": m.group(2), "line": int(m.group(3)) if m.group(3) else None, "symbol": m.group(1), "lang": "java"}
+    m = _JS_FRAME_RE.search(s)
+    if m:
+        return {"file": m.group(2), "line": int(m.group(3)), "symbol": m.group(1) or "", "lang": "js"}
+    return None
+
+def exception_fingerprint(exc_type: Optional[str], frames: List[Dict[str, Any]], causes: List[str] = (),
+                          lang: Optional[str] = None) -> str:
+    """Type (+ causes) et frames les plus internes en fichier:symbole, sans numéros de ligne (stables entre versions)."""
+    inner = frames[-STACK_FINGERPRINT_FRAMES:] if lang == "python" else frames[:STACK_FINGERPRINT_FRAMES]
+    names = [(f["file"] or "").replace("\\", "/").rsplit("/", 1)[-1] for f in inner]
+    parts = [exc_type or "", *causes] + [f"{name}:{f['symbol']}" for name, f in zip(names, inner)]
+    return hashlib.sha1("\n".join(parts).encode("utf-8", errors="replace")).hexdigest()[:16]
+
+def iter_exceptions(source=None, max_frames: int = 64, path: Optional[str] = None) -> Iterator[Dict[str, Any]]:
     """
-    Extrait fichiers/lignes depuis des stack traces (Python/JS/Java).
-    Args: text
-    Returns: {"items":[{"file","line","symbol"}]}
+    Découpe un texte / flux de logs (ou le fichier `path`) en exceptions, en un passage :
+    yield {"type", "message", "lang", "frames", "frames_total", "causes", "line", "fingerprint"}.
+    Une chaîne est toujours du contenu, jamais un chemin. Au plus `max_frames` frames gardés par
+    trace (les plus internes), donc mémoire bornée même sur une récursion infinie. Des frames sans
+    en-tête forment une trace de type None. Le préfixe de log qui précède "Traceback" est retiré
+    des lignes suivantes de la trace Python (indentation des lignes de code, ligne d'exception).
+    """
+    if path is not None:
+        with open(path, "rb") as fh:
+            yield from iter_exceptions(fh, max_frames)
+        return
+    cur: Optional[Dict[str, Any]] = None
+    pending = None  # en-tête Java/JS candidat : (type, message, n° de ligne)
+    prefix = ""     # préfixe de log de la trace Python en cours
+
+    def start(lang, header, n):
+        typ, msg, line = header if header else (None, None, n)
+        frames = deque(maxlen=max_frames) if lang == "python" else []
+        return {"type": typ, "message": msg, "lang": lang, "frames": frames, "frames_total": 0,
+                "causes": [], "line": line}
+
+    def close(tr):
+        tr["frames"] = list(tr["frames"])
+        tr["fingerprint"] = exception_fingerprint(tr["type"], tr["frames"], tr["causes"], tr["lang"])
+        return tr
+
+    for n, raw in enumerate(_iter_lines(source), 1):
+        s = raw.strip()
+        if _PY_TRACEBACK in s:
+            if cur:
+                yield close(cur)
+            cur, pending = start("python", None, n), None
+            prefix = raw[:raw.index(_PY_TRACEBACK)].lstrip()
+            continue
+        frame = _parse_frame(s)
+        if frame:
+            if cur is None or (cur["lang"] == "python") != (frame["lang"] == "python"):
+                if cur:
+                    yield close(cur)
+                cur = start(frame["lang"], pending, n)
+            cur["frames_total"] += 1
+            if cur["lang"] == "python" or len(cur["frames"]) < max_frames:
+                cur["frames"].append({k: frame[k] for k in ("file", "line", "symbol")})
+            pending = None
+            continue
+        if cur is not None:
+            if cur["lang"] == "python":
+                body = raw.lstrip()
+                # Même préfixe, ou préfixe de même largeur qui varie (horodatage) : même dernier caractère visible
+                if prefix and (body.startswith(prefix) or
+                               body[:len(prefix)].rstrip()[-1:] == prefix.rstrip()[-1:] != ""):
+                    raw = body[len(prefix):]
+                    s = raw.strip()
+                if not s or raw[:1] in (" ", "\t"):
+                    continue  # ligne de code sous un frame
+                m = _PY_EXC_LINE_RE.match(s)
+                if m:
+                    cur["type"], cur["message"] = m.group(1), (m.group(2) or "").strip()
+                yield close(cur)
+                cur = None
+                continue
+            if s.startswith(("Caused by:", "Suppressed:")):
+                m = _EXC_HEADER_RE.search(s)
+                if m:
+                    cur["causes"].append(m.group(1))
+                continue
+            if _STACK_CONTINUATION_RE.match(s):
+                continue
+            yield close(cur)
+            cur = None
+        m = _EXC_HEADER_RE.search(s) if any(h in s for h in _EXC_HINTS) else None
+        pending = (m.group(1), (m.group(2) or "").strip(), n) if m else None
+    if cur:
+        yield close(cur)
+
+def group_exceptions(source=None, max_groups: int = 1000, max_frames: int = 64,
+                     path: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Regroupe les exceptions par empreinte : compte, première/dernière ligne, trace représentative (la première).
+    Au-delà de max_groups empreintes distinctes, les nouvelles sont seulement comptées (overflow).
+    Returns: {"exceptions": int, "groups": [...] (compte décroissant), "overflow": int}
+    """
+    groups: Dict[str, Dict[str, Any]] = {}
+    total = overflow = 0
+    for exc in iter_exceptions(source, max_frames, path=path):
+        total += 1
+        g = groups.get(exc["fingerprint"])
+        if g is not None:
+            g["count"] += 1
+            g["last_line"] = exc["line"]
+        elif len(groups) < max_groups:
+            groups[exc["fingerprint"]] = {"fingerprint": exc["fingerprint"], "type": exc["type"],
+                                          "message": exc["message"], "lang": exc["lang"], "causes": exc["causes"],
+                                          "count": 1, "first_line": exc["line"], "last_line": exc["line"],
+                                          "frames": exc["frames"], "frames_total": exc["frames_total"]}
+        else:
+            overflow += 1
+    return {"exceptions": total, "groups": sorted(groups.values(), key=lambda g: (-g["count"], g["first_line"])),
+            "overflow": overflow}
+
+def parse_stacktrace_tool(text: str, top: int = 50) -> Dict[str, Any]:
+    """
+    Découpe les stack traces (Python/JS/Java) en exceptions et les regroupe par empreinte.
+    Args: text, top (nombre de groupes retournés)
+    Returns: {"items":[{"file","line","symbol"}] (frames des traces représentatives),
+              "groups":[{fingerprint, type, message, lang, causes, count, first_line, last_line, frames, frames_total}],
+              "exceptions": int, "distinct": int (empreintes suivies),
+              "overflow": int (exceptions au-delà de la limite de groupes, empreintes non comptées)}
     """
-    items: List[Dict[str, Any]] = []
     if not text:
-        return {"items": items}
-    for pat in _STACK_PATTERNS:
-        for m in pat.finditer(text):
-            g = m.groups()
-            if len(g) == 3 and str(g[1]).isdigit():
-                items.append({"file": g[0], "line": int(g[1]), "symbol": g[2]})
-            elif len(g) == 2 and str(g[1]).isdigit():
-                items.append({"file": g[0], "line": int(g[1]), "symbol": ""})
-            elif len(g) == 3 and str(g[2]).isdigit():
-                items.append({"file": g[1], "line": int(g[2]), "symbol": g[0]})
-    return {"items": items}
+        return {"items": [], "groups": [], "exceptions": 0, "distinct": 0, "overflow": 0}
+    r = cached_parse("stacktraces", text, group_exceptions)
+    groups = r["groups"][:top]
+    items = [f for g in groups for f in g["frames"]]
+    return {"items": items, "groups": groups, "exceptions": r["exceptions"],
+            "distinct": len(r["groups"]), "overflow": r["overflow"]}
 
 
 # ---------- Score qualité -----------------------------------------------------
@@ -230,6 +1037,9 @@ def quality_score_tool(coverage_line_pct: float = 0.0, violations: Optional[List
 def _extract_json(text: str) -> Optional[dict]:
     if not text:
         return None
+    return cached_parse("json", text, _parse_json)
+
+def _parse_json(text: str) -> Optional[dict]:
     try:
         return json.loads(text)
     except Exception:
@@ -245,10 +1055,62 @@ def _extract_json(text: str) -> Optional[dict]:
 def _extract_yaml(text: str) -> Optional[dict]:
     if not text or yaml is None:
         return None
+    return cached_parse("yaml", text, _parse_yaml)
+
+def _parse_yaml(text: str) -> Optional[dict]:
+    """Premier document non vide (un flux '---' multi-documents n'est plus rejeté)."""
     try:
-        return yaml.safe_load(text)
+        for doc in iter_yaml_documents(text):
+            return doc
     except Exception:
-        return None
+        pass
+    return None
+
+def iter_yaml_documents(source) -> Iterator[Any]:
+    """
+    Documents d'un flux YAML (texte ou fichier ouvert), un par un (safe_load_all), vides ignorés.
+    Une str est toujours du contenu YAML, jamais un chemin (voir iter_yaml_file).
+    """
+    if yaml is None:
+        return
+    for doc in yaml.load_all(source, Loader=YAML_LOADER):
+        if doc is not None:
+            yield doc
+
+def iter_yaml_file(path: str) -> Iterator[Any]:
+    """Documents d'un fichier YAML désigné explicitement (usage interne, jamais depuis un argument d'outil)."""
+    with open(path, "r", encoding="utf-8", errors="replace") as fh:
+        yield from iter_yaml_documents(fh)
+
+_YAML_DOC_SEP_RE = re.compile(r"^---[ \t]*(?:#.*)?$", re.M)
+
+def _load_yaml_documents(text: str) -> List[Any]:
+    """
+    Documents d'un texte YAML. Si un document est invalide, le texte est redécoupé sur les
+    séparateurs '---' et chaque document est chargé seul : les objets valides avant et après sont gardés.
+    """
+    docs: List[Any] = []
+    try:
+        for doc in iter_yaml_documents(text):
+            docs.append(doc)
+        return docs
+    except Exception:
+        pass
+    docs = []
+    for part in _YAML_DOC_SEP_RE.split(text):
+        if not part.strip():
+            continue
+        try:
+            docs.extend(iter_yaml_documents(part))
+        except Exception:
+            continue  # document invalide ignoré
+    return docs
+
+def _extract_yaml_all(text: str) -> List[Any]:
+    """Tous les documents valides d'un texte YAML (liste vide si pyyaml absent)."""
+    if not text or yaml is None:
+        return []
+    return cached_parse("yaml-all", text, _load_yaml_documents)
 
 def _to_number(val, default=0.0) -> float:
     try:
@@ -351,89 +1213,403 @@ def devops_junit_summary_tool(xml_text: str) -> Dict[str, Any]:
     """
     Résume un rapport JUnit XML: tests, failures, errors, skipped.
     """
-    if not xml_text:
-        return {"tests": 0, "failures": 0, "errors": 0, "skipped": 0}
-    try:
-        root = ET.fromstring(xml_text)
-        # <testsuite tests=".." failures=".." errors=".." skipped="..">
-        if root.tag.endswith("testsuite"):
-            return {
-                "tests": int(root.attrib.get("tests", 0)),
-                "failures": int(root.attrib.get("failures", 0)),
-                "errors": int(root.attrib.get("errors", 0)),
-                "skipped": int(root.attrib.get("skipped", 0))
-            }
-        # <testsuites>
-        total = {"tests": 0, "failures": 0, "errors": 0, "skipped": 0}
-        for ts in root.findall(".//testsuite"):
-            total["tests"] += int(ts.attrib.get("tests", 0))
-            total["failures"] += int(ts.attrib.get("failures", 0))
-            total["errors"] += int(ts.attrib.get("errors", 0))
-            total["skipped"] += int(ts.attrib.get("skipped", 0))
-        return total
-    except Exception:
-        return {"tests": 0, "failures": 0, "errors": 0, "skipped": 0}
+    return _junit_totals(xml_text)
+
+# Chemin du template de pod par kind de workload
+_K8S_POD_TEMPLATES = {
+    "Deployment": ("spec", "template", "spec"), "StatefulSet": ("spec", "template", "spec"),
+    "DaemonSet": ("spec", "template", "spec"), "ReplicaSet": ("spec", "template", "spec"),
+    "ReplicationController": ("spec", "template", "spec"), "Job": ("spec", "template", "spec"),
+    "CronJob": ("spec", "jobTemplate", "spec", "template", "spec"), "Pod": ("spec",),
+}
+
+def iter_k8s_objects(docs) -> Iterator[Dict[str, Any]]:
+    """Objets Kubernetes d'une suite de documents ; les 'List' (v1/List, DeploymentList, ...) sont dépliées."""
+    for d in docs:
+        if isinstance(d, list):
+            yield from iter_k8s_objects(d)
+        elif isinstance(d, dict) and d.get("kind"):
+            if str(d["kind"]).endswith("List") and isinstance(d.get("items"), list):
+                yield from iter_k8s_objects(d["items"])
+            else:
+                yield d
+
+def _dig(obj, path):
+    for key in path:
+        obj = obj.get(key) if isinstance(obj, dict) else None
+    return obj or {}
 
 def devops_parse_k8s_manifest_tool(yaml_text: str) -> Dict[str, Any]:
     """
-    Extrait les images, replicas et ports d'un manifest Kubernetes (Deployment/Service).
-    Returns: {"deployments":[{name, image, replicas}], "services":[{name, ports}]} 
+    Extrait images, replicas et ports d'un manifest Kubernetes multi-documents ('---', rendu Helm, kind List).
+    Returns: {"deployments":[{name, image, replicas}], "services":[{name, ports}],
+              "workloads":[{kind, name, namespace, container, image, replicas, init}] (Deployment, StatefulSet,
+              DaemonSet, ReplicaSet, Job, CronJob, Pod), "by_kind": {kind: ["namespace/name", ...]}, "objects": int}
     """
-    data = _extract_yaml(yaml_text) or {}
-    deployments, services = [], []
-    if isinstance(data, dict) and "kind" in data:
-        docs = [data]
-    elif isinstance(data, list):
-        docs = data
-    else:
-        docs = []
-
-    for d in docs:
-        kind = d.get("kind", "")
+    deployments, services, workloads = [], [], []
+    by_kind: Dict[str, List[str]] = {}
+    count = 0
+    for d in iter_k8s_objects(_extract_yaml_all(yaml_text)):
+        count += 1
+        kind = str(d.get("kind"))
         meta = d.get("metadata", {}) or {}
-        name = meta.get("name")
-        if kind == "Deployment":
-            spec = d.get("spec", {}) or {}
-            replicas = spec.get("replicas", 1)
-            tpl = (spec.get("template") or {}).get("spec", {}) or {}
-            containers = tpl.get("containers", []) or []
-            for c in containers:
-                deployments.append({"name": name, "image": c.get("image"), "replicas": replicas})
+        name, namespace = meta.get("name"), meta.get("namespace")
+        by_kind.setdefault(kind, []).append(f"{namespace}/{name}" if namespace else str(name))
+        spec = d.get("spec", {}) or {}
+        if kind in _K8S_POD_TEMPLATES:
+            pod = _dig(d, _K8S_POD_TEMPLATES[kind])
+            # DaemonSet : un pod par nœud, pas de replicas ; Job : parallelism
+            replicas = None if kind in ("DaemonSet", "Pod", "CronJob") else \
+                spec.get("parallelism", 1) if kind == "Job" else spec.get("replicas", 1)
+            for init, key in ((False, "containers"), (True, "initContainers")):
+                for c in pod.get(key, []) or []:
+                    if not isinstance(c, dict):
+                        continue
+                    workloads.append({"kind": kind, "name": name, "namespace": namespace, "container": c.get("name"),
+                                      "image": c.get("image"), "replicas": replicas, "init": init})
+                    if kind == "Deployment" and not init:
+                        deployments.append({"name": name, "image": c.get("image"), "replicas": replicas})
         elif kind == "Service":
-            spec = d.get("spec", {}) or {}
-            ports = [{"port": p.get("port"), "targetPort": p.get("targetPort")} for p in (spec.get("ports") or [])]
+            ports = [{"port": p.get("port"), "targetPort": p.get("targetPort")}
+                     for p in (spec.get("ports") or []) if isinstance(p, dict)]
             services.append({"name": name, "ports": ports})
-    return {"deployments": deployments, "services": services}
+    return {"deployments": deployments, "services": services, "workloads": workloads,
+            "by_kind": by_kind, "objects": count}
+
+# Une seule alternance compilée : un passage par bloc de log, quel que soit le type d'erreur
+_LOG_ERROR_RE = re.compile(r"(ERROR|Exception|CRITICAL)[: ]+([^\n]+)")
+_LOG_TS_RE = re.compile(r"^\[?(\d{4}-\d{2}-\d{2}[T ]\d{2}:\d{2}:\d{2}(?:[.,]\d+)?(?:Z|[+-]\d{2}:?\d{2})?|\d{10}(?:\.\d+)?)", re.M)
+_LOG_MASK_RE = re.compile(
+    r"(?P<uuid>\b[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}\b)"
+    r"|(?P<ts>\b\d{4}-\d{2}-\d{2}[T ]\d{2}:\d{2}:\d{2}(?:[.,]\d+)?(?:Z|[+-]\d{2}:?\d{2})?)"
+    r"|(?P<ip>\b\d{1,3}(?:\.\d{1,3}){3}(?::\d+)?\b)"
+    r"|(?P<hex>\b0x[0-9a-fA-F]+\b|\b(?=[0-9a-fA-F]*\d)[0-9a-fA-F]{8,}\b)"
+    r"|(?P<num>(?<![A-Za-z])-?\d+(?:\.\d+)?)"
+)
+_LOG_MASKS = {"uuid": "<UUID>", "ts": "<TS>", "ip": "<IP>", "hex": "<HEX>", "num": "<NUM>"}
+LOG_READ_BLOCK = 1024 * 1024
+
+def iter_line_blocks(stream, block_size: int = LOG_READ_BLOCK) -> Iterator[str]:
+    """Blocs de lignes complètes d'un fichier (texte ou binaire), coupés sur la dernière fin de ligne."""
+    carry = ""
+    while True:
+        block = stream.read(block_size)
+        if not block:
+            break
+        if isinstance(block, bytes):
+            block = block.decode("utf-8", errors="replace")
+        block = carry + block
+        cut = block.rfind("\n") + 1
+        if cut == 0:
+            carry = block
+            continue
+        yield block[:cut]
+        carry = block[cut:]
+    if carry:
+        yield carry
+
+def log_template(message: str) -> str:
+    """Remplace ids, UUID, hex, IP, timestamps et nombres par des jetons : les variantes d'une même erreur s'agrègent."""
+    return _LOG_MASK_RE.sub(lambda m: _LOG_MASKS[m.lastgroup], message.strip())[:300]
+
+class LogAnalyzer:
+    """
+    Agrégation d'erreurs de logs en streaming, mémoire bornée :
+    - top-k approximatif par template (algorithme space-saving : `capacity` compteurs au plus,
+      count surestimé d'au plus `error`) ;
+    - premier / dernier vu (source, ligne, timestamp si la ligne en porte un) ;
+    - fusionnable (merge) et sérialisable (to_dict / from_dict) pour traiter des fichiers en parallèle.
+    """
+
+    def __init__(self, capacity: int = 1000, source: str = ""):
+        self.capacity = capacity
+        self.source = source
+        self.total = 0
+        self.lines = 0
+        self.entries: Dict[str, Dict[str, Any]] = {}
+        self._heap: List[Any] = []  # (count, template), entrées périmées ignorées à la lecture
+
+    def _evict_min(self) -> int:
+        while self._heap:
+            count, key = heapq.heappop(self._heap)
+            e = self.entries.get(key)
+            if e is not None and e["count"] == count:
+                del self.entries[key]
+                return count
+        return 0
+
+    def _bump(self, key: str, kind: str, example: str, seen: Dict[str, Any], n: int = 1):
+        e = self.entries.get(key)
+        if e is None:
+            floor = self._evict_min() if len(self.entries) >= self.capacity else 0
+            e = self.entries[key] = {"count": floor, "error": floor, "kind": kind, "example": example[:500],
+                                     "first_seen": seen, "last_seen": seen}
+        e["count"] += n
+        e["last_seen"] = seen
+        heapq.heappush(self._heap, (e["count"], key))
+        if len(self._heap) > 4 * self.capacity:  # compaction des entrées périmées
+            self._heap = [(v["count"], k) for k, v in self.entries.items()]
+            heapq.heapify(self._heap)
+
+    def feed(self, text: str):
+        """Analyse un bloc de lignes complètes."""
+        base = self.lines
+        line_no, pos = base, 0
+        for m in _LOG_ERROR_RE.finditer(text):
+            line_no += text.count("\n", pos, m.start()); pos = m.start()
+            line_start = text.rfind("\n", 0, m.start()) + 1
+            ts = _LOG_TS_RE.match(text, line_start)
+            msg = m.group(2).strip()
+            self.total += 1
+            self._bump(f"{m.group(1)}: {log_template(msg)}", m.group(1), msg,
+                       {"source": self.source, "line": line_no + 1, "ts": ts.group(1) if ts else None})
+        self.lines = base + text.count("\n") + (0 if text.endswith("\n") or not text else 1)
+
+    def feed_stream(self, stream, block_size: int = LOG_READ_BLOCK):
+        """Lit un fichier (texte ou binaire) par blocs, coupés sur la dernière fin de ligne."""
+        for block in iter_line_blocks(stream, block_size):
+            self.feed(block)
+
+    def _floor(self) -> int:
+        """Compte minimal d'un résumé plein : borne du count de toute clé qu'il n'a pas gardée."""
+        if len(self.entries) < self.capacity or not self.entries:
+            return 0
+        return min(e["count"] for e in self.entries.values())
+
+    def merge(self, other: "LogAnalyzer") -> "LogAnalyzer":
+        """
+        Fusion space-saving (mergeable summaries) : une clé absente d'un côté y compte pour le minimum
+        de ce résumé (count et error), ce qui préserve la borne d'erreur ; on garde ensuite les
+        `capacity` plus grands. first/last_seen ne sont comparés que si les deux ont un timestamp.
+        """
+        floor_self, floor_other = self._floor(), other._floor()
+        self.total += other.total
+        self.lines += other.lines
+        for key, e in self.entries.items():
+            if key not in other.entries:
+                e["count"] += floor_other; e["error"] += floor_other
+        for key, o in other.entries.items():
+            e = self.entries.get(key)
+            if e is None:
+                e = self.entries[key] = dict(o)
+                e["count"] += floor_self; e["error"] += floor_self
+                continue
+            e["count"] += o["count"]; e["error"] += o["error"]
+            e_first, o_first = e["first_seen"].get("ts"), o["first_seen"].get("ts")
+            if e_first and o_first and o_first < e_first:
+                e["first_seen"] = o["first_seen"]
+            e_last, o_last = e["last_seen"].get("ts"), o["last_seen"].get("ts")
+            if e_last and o_last and o_last > e_last:
+                e["last_seen"] = o["last_seen"]
+        if len(self.entries) > self.capacity:
+            keep = heapq.nlargest(self.capacity, self.entries.items(), key=lambda kv: kv[1]["count"])
+            self.entries = dict(keep)
+        self._heap = [(v["count"], k) for k, v in self.entries.items()]
+        heapq.heapify(self._heap)
+        return self
+
+    def top(self, k: int = 20) -> List[Dict[str, Any]]:
+        best = heapq.nlargest(k, self.entries.items(), key=lambda kv: kv[1]["count"])
+        return [{"pattern": key, **e} for key, e in best]
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"capacity": self.capacity, "source": self.source, "total": self.total,
+                "lines": self.lines, "entries": self.entries}
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "LogAnalyzer":
+        a = cls(capacity=data.get("capacity", 1000), source=data.get("source", ""))
+        a.total, a.lines = data.get("total", 0), data.get("lines", 0)
+        a.entries = {k: dict(v) for k, v in (data.get("entries") or {}).items()}
+        a._heap = [(v["count"], k) for k, v in a.entries.items()]
+        heapq.heapify(a._heap)
+        return a
+
+def analyze_log_file(path: str, capacity: int = 1000) -> Dict[str, Any]:
+    a = LogAnalyzer(capacity=capacity, source=path)
+    with open(path, "rb") as fh:
+        a.feed_stream(fh)
+    return a.to_dict()
+
+def analyze_log_files(paths: List[str], capacity: int = 1000, workers: Optional[int] = None) -> LogAnalyzer:
+    """Analyse chaque fichier dans un process séparé puis fusionne les résultats (sérialisés)."""
+    from concurrent.futures import ProcessPoolExecutor
+    merged = LogAnalyzer(capacity=capacity)
+    if len(paths) <= 1 or workers == 1:
+        for p in paths:
+            merged.merge(LogAnalyzer.from_dict(analyze_log_file(p, capacity)))
+        return merged
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for data in pool.map(analyze_log_file, paths, [capacity] * len(paths)):
+            merged.merge(LogAnalyzer.from_dict(data))
+    return merged
 
 def devops_logs_errors_tool(log_text: str) -> Dict[str, Any]:
     """
     Agrège les erreurs par motif depuis des logs (stack, ERROR, exception).
-    Returns: {"top_errors":[{"pattern","count"}]}
+    Les messages sont normalisés en templates (ids, nombres, UUID, hex, timestamps masqués).
+    Returns: {"top_errors":[{"pattern","count","kind","example","first_seen","last_seen"}],
+              "total_errors": int, "distinct_patterns": int}
     """
     if not log_text:
         return {"top_errors": []}
-    patterns = [
-        r'ERROR[: ]+([^\n]+)', r'Exception[: ]+([^\n]+)', r'CRITICAL[: ]+([^\n]+)'
-    ]
-    counts: Dict[str, int] = {}
-    for pat in patterns:
-        for m in re.finditer(pat, log_text):
-            msg = m.group(1).strip()
-            counts[msg] = counts.get(msg, 0) + 1
-    top = sorted([{"pattern": k, "count": v} for k, v in counts.items()], key=lambda x: -x["count"])[:20]
-    return {"top_errors": top}
+    a = LogAnalyzer()
+    a.feed(log_text)
+    top = [{k: e[k] for k in ("pattern", "count", "kind", "example", "first_seen", "last_seen")} for e in a.top(20)]
+    return {"top_errors": top, "total_errors": a.total, "distinct_patterns": len(a.entries)}
 
-def devops_latency_parse_tool(text: str) -> Dict[str, Any]:
+class LatencySketch:
     """
-    Extrait des latences p50/p95/p99 depuis des lignes 'latency=123ms' ou 'p95=250ms'.
-    Returns: {"p50":..., "p95":..., "p99":...} si trouvé.
+    Sketch de quantiles type DDSketch : buckets logarithmiques d'erreur relative `alpha` (1 % par défaut),
+    donc p50/p99 à ±1 % quel que soit le nombre d'échantillons. Mémoire bornée par `max_buckets`
+    (au-delà, les plus petits buckets sont fusionnés : seuls les quantiles bas perdent en précision).
+    Fusionnable (merge, mêmes paramètres) et sérialisable (to_dict / from_dict).
     """
+
+    def __init__(self, alpha: float = 0.01, max_buckets: int = 2048):
+        self.alpha = alpha
+        self.max_buckets = max_buckets
+        self.gamma = (1 + alpha) / (1 - alpha)
+        self._log_gamma = math.log(self.gamma)
+        self.buckets: Dict[int, int] = {}
+        self.zeros = 0
+        self.count = 0
+        self.total = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def add(self, value: float, n: int = 1):
+        if value < 0 or n <= 0:
+            return
+        self.count += n; self.total += value * n
+        self.min = min(self.min, value); self.max = max(self.max, value)
+        if value == 0:
+            self.zeros += n
+            return
+        idx = math.ceil(math.log(value) / self._log_gamma)
+        self.buckets[idx] = self.buckets.get(idx, 0) + n
+        if len(self.buckets) > self.max_buckets:
+            self._collapse()
+
+    def _collapse(self):
+        keys = sorted(self.buckets)
+        extra = len(keys) - self.max_buckets
+        merged = sum(self.buckets.pop(k) for k in keys[:extra + 1])
+        self.buckets[keys[extra]] = self.buckets.get(keys[extra], 0) + merged
+
+    def quantile(self, q: float) -> Optional[float]:
+        if not self.count:
+            return None
+        if q >= 1:
+            return self.max
+        rank = q * (self.count - 1)
+        seen = self.zeros
+        if rank < seen:
+            return 0.0
+        for idx in sorted(self.buckets):
+            seen += self.buckets[idx]
+            if seen > rank:
+                value = 2 * self.gamma ** idx / (self.gamma + 1)
+                return min(max(value, self.min), self.max)
+        return self.max
+
+    def merge(self, other: "LatencySketch") -> "LatencySketch":
+        if abs(other.gamma - self.gamma) > 1e-12:
+            raise ValueError("LatencySketch: alpha différents, fusion impossible")
+        for idx, n in other.buckets.items():
+            self.buckets[idx] = self.buckets.get(idx, 0) + n
+        self.zeros += other.zeros; self.count += other.count; self.total += other.total
+        self.min = min(self.min, other.min); self.max = max(self.max, other.max)
+        while len(self.buckets) > self.max_buckets:
+            self._collapse()
+        return self
+
+    def summary(self, digits: int = 2) -> Dict[str, Any]:
+        def r(v):
+            return round(v, digits) if v is not None else None
+        return {"count": self.count, "mean": r(self.total / self.count) if self.count else None,
+                "p50": r(self.quantile(0.50)), "p90": r(self.quantile(0.90)), "p95": r(self.quantile(0.95)),
+                "p99": r(self.quantile(0.99)), "max": r(self.max) if self.count else None}
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"alpha": self.alpha, "max_buckets": self.max_buckets, "count": self.count, "sum": self.total,
+                "min": self.min if self.count else None, "max": self.max if self.count else None,
+                "zeros": self.zeros, "buckets": {str(k): v for k, v in self.buckets.items()}}
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "LatencySketch":
+        sk = cls(alpha=data.get("alpha", 0.01), max_buckets=data.get("max_buckets", 2048))
+        sk.buckets = {int(k): int(v) for k, v in (data.get("buckets") or {}).items()}
+        sk.zeros, sk.count, sk.total = data.get("zeros", 0), data.get("count", 0), data.get("sum", 0.0)
+        if sk.count:
+            sk.min, sk.max = data["min"], data["max"]
+        return sk
+
+# Échantillons bruts : "latency=123ms", "duration: 1.2s", "took 45 ms", "request_time=0.123" (secondes nginx)...
+_LATENCY_UNIT_MS = {
+    "ms": 1.0, "msec": 1.0, "msecs": 1.0, "millisecond": 1.0, "milliseconds": 1.0,
+    "s": 1000.0, "sec": 1000.0, "secs": 1000.0, "second": 1000.0, "seconds": 1000.0,
+    "us": 0.001, "µs": 0.001, "usec": 0.001, "microsecond": 0.001, "microseconds": 0.001,
+    "min": 60000.0, "mins": 60000.0, "minute": 60000.0, "minutes": 60000.0,
+}
+# Unité collée au nombre (groupe 3, quelconque) ou séparée par des espaces (groupe 4, unité connue seulement :
+# "request_time=0.05 upstream=..." ne prend pas "upstream" pour une unité)
+_LATENCY_SAMPLE_RE = re.compile(
+    r"\b(latency|duration|elapsed|took|response_time|request_time|upstream_response_time|rt)"
+    r"\s*[=:]?\s*(\d+(?:\.\d+)?)(?:([a-zµ]+)|\s+(" + "|".join(sorted(_LATENCY_UNIT_MS, key=len, reverse=True)) + r")\b)?",
+    re.IGNORECASE,
+)
+_LATENCY_SECONDS_KEYS = {"request_time", "upstream_response_time", "rt"}
+
+def latency_samples(text: str) -> Iterator[float]:
+    """Latences (ms) de toutes les occurrences dans le texte, converties selon l'unité ; unité inconnue : ignorée."""
+    for m in _LATENCY_SAMPLE_RE.finditer(text):
+        key, unit = m.group(1).lower(), (m.group(3) or m.group(4) or "").lower()
+        if unit:
+            factor = _LATENCY_UNIT_MS.get(unit)
+            if factor is None:
+                continue  # "took 5h", "duration=3d" : unité non résolue, pas d'échantillon faux
+        else:
+            factor = 1000.0 if key in _LATENCY_SECONDS_KEYS else 1.0
+        yield float(m.group(2)) * factor
+
+def latency_sketch_from_stream(stream, sketch: Optional[LatencySketch] = None,
+                               block_size: int = LOG_READ_BLOCK) -> LatencySketch:
+    """Alimente un sketch depuis un fichier (texte ou binaire) lu par blocs coupés sur les fins de ligne."""
+    sketch = sketch or LatencySketch()
+    for block in iter_line_blocks(stream, block_size):
+        for v in latency_samples(block):
+            sketch.add(v)
+    return sketch
+
+def devops_latency_parse_tool(text: str, include_sketch: bool = False) -> Dict[str, Any]:
+    """
+    Calcule p50/p90/p95/p99/max (ms) sur tous les échantillons 'latency=123ms', 'duration=1.2s',
+    'took 45ms', 'request_time=0.12'... ; à défaut, reprend les valeurs 'p95=250ms' déjà agrégées.
+    include_sketch : ajoute le sketch sérialisé (fusionnable, jusqu'à 2048 buckets) ; sinon absent du résultat.
+    Returns: {"p50", "p90", "p95", "p99", "max", "count", "mean", "latency"} (+ "sketch" si demandé)
+    """
+    sketch = LatencySketch()
+    first = None
+    for v in latency_samples(text or ""):
+        first = v if first is None else first
+        sketch.add(v)
+    if sketch.count:
+        out = sketch.summary()
+        out["latency"] = first
+        if include_sketch:
+            out["sketch"] = sketch.to_dict()
+        return out
     vals = {}
-    for key in ["p50", "p95", "p99", "latency"]:
-        m = re.search(rf'{key}\s*=\s*(\d+)\s*ms', text or "", re.IGNORECASE)
+    for key in ["p50", "p90", "p95", "p99"]:
+        m = re.search(rf'{key}\s*=\s*(\d+(?:\.\d+)?)\s*ms', text or "", re.IGNORECASE)
         if m:
-            vals[key.upper()] = int(m.group(1))
-    return {"p50": vals.get("P50"), "p95": vals.get("P95"), "p99": vals.get("P99"), "latency": vals.get("LATENCY")}
+            vals[key] = float(m.group(1))
+    out = {"p50": vals.get("p50"), "p90": vals.get("p90"), "p95": vals.get("p95"), "p99": vals.get("p99"),
+           "max": None, "count": 0, "mean": None, "latency": None}
+    if include_sketch:
+        out["sketch"] = None
+    return out
 
 
 # ------------------------------------------------------------------------------
@@ -484,20 +1660,30 @@ def wiki_front_matter_tool(md_text: str) -> Dict[str, Any]:
     data = _extract_yaml(m.group(1))
     return {"front_matter": data}
 
-def knowledge_tag_extract_tool(text: str) -> Dict[str, Any]:
+# Tags BM25 : délai de connexion à la base avant le repli sur les fréquences brutes
+KNOWLEDGE_TAG_DB_TIMEOUT_S = int(os.getenv("KNOWLEDGE_TAG_DB_TIMEOUT_S", "2"))
+
+def knowledge_tag_extract_tool(text: str, top: int = 15) -> Dict[str, Any]:
     """
-    Tente d'extraire des tags/keywords simples (mots fréquents >3 lettres, hors stop-words FR/EN minimaux).
-    Returns: {"tags":[...]}
+    Extrait des tags/keywords pondérés BM25 contre les statistiques du corpus indexé (documents) :
+    les mots courants du corpus passent derrière les termes propres au texte. Sans base disponible,
+    repli sur les fréquences brutes (hors stop-words FR/EN).
+    Returns: {"tags":[...], "scores":{tag: poids}, "weighting": "bm25"|"tf"}
     """
-    stop = set("the and of to a in for on with les des aux une un et ou de la le du".split())
-    words = re.findall(r"[a-zA-Z]{4,}", text or "")
-    freq: Dict[str, int] = {}
-    for w in words:
-        lw = w.lower()
-        if lw in stop: continue
-        freq[lw] = freq.get(lw, 0) + 1
-    tags = [k for k, v in sorted(freq.items(), key=lambda x: -x[1])[:15]]
-    return {"tags": tags}
+    counts, length = term_counts(text or "")
+    if not counts:
+        return {"tags": [], "scores": {}, "weighting": "tf"}
+    try:
+        from tools import get_pg_connection
+        conn = get_pg_connection(connect_timeout=KNOWLEDGE_TAG_DB_TIMEOUT_S); cur = conn.cursor()
+        try:
+            scored, weighting = weighted_terms(cur, counts, length, top), "bm25"
+        finally:
+            cur.close(); conn.close()
+    except Exception:
+        scored = sorted(counts.items(), key=lambda x: (-x[1], x[0]))[:top]
+        weighting = "tf"
+    return {"tags": [t for t, _ in scored], "scores": dict(scored), "weighting": weighting}
 
 
 # ------------------------------------------------------------------------------
@@ -519,26 +1705,7 @@ def test_junit_summary_tool(xml_text: str) -> Dict[str, Any]:
     """
     Résumé JUnit (identique logique devops mais dédié testing).
     """
-    if not xml_text:
-        return {"tests": 0, "failures": 0, "errors": 0, "skipped": 0}
-    try:
-        root = ET.fromstring(xml_text)
-        if root.tag.endswith("testsuite"):
-            return {
-                "tests": int(root.attrib.get("tests", 0)),
-                "failures": int(root.attrib.get("failures", 0)),
-                "errors": int(root.attrib.get("errors", 0)),
-                "skipped": int(root.attrib.get("skipped", 0))
-            }
-        total = {"tests": 0, "failures": 0, "errors": 0, "skipped": 0}
-        for ts in root.findall(".//testsuite"):
-            total["tests"] += int(ts.attrib.get("tests", 0))
-            total["failures"] += int(ts.attrib.get("failures", 0))
-            total["errors"] += int(ts.attrib.get("errors", 0))
-            total["skipped"] += int(ts.attrib.get("skipped", 0))
-        return total
-    except Exception:
-        return {"tests": 0, "failures": 0, "errors": 0, "skipped": 0}
+    return _junit_totals(xml_text)
 
 def test_visual_diff_summary_tool(json_text: str) -> Dict[str, Any]:
     """
@@ -562,91 +1729,39 @@ def test_visual_diff_summary_tool(json_text: str) -> Dict[str, Any]:
 
 def sec_comprehensive_scan_tool(scan_data: str) -> Dict[str, Any]:
     """
-    Comprehensive security scan analysis tool that can handle multiple scan formats.
-    Returns: {"findings":[{"type","severity","file","line","desc","tool"}], "by_severity":{...}}
+    Comprehensive security scan analysis tool that can handle multiple scan formats
+    (SARIF, Bandit, Semgrep, Checkmarx, Veracode, generic "vulnerabilities"), deduplicated by fingerprint.
+    Returns: {"findings":[{"type","severity","file","line","desc","tool","rule_id","fingerprint"}], "by_severity":{...}, "format"}
     """
-    try:
-        data = _extract_json(scan_data) or {}
-        findings = []
-        
-        # Handle various scan tool outputs
-        if "vulnerabilities" in data:  # Generic format
-            for v in data.get("vulnerabilities", []):
-                findings.append({
-                    "type": v.get("type", "vulnerability"),
-                    "severity": (v.get("severity") or "LOW").upper(),
-                    "file": v.get("file") or v.get("path") or "",
-                    "line": v.get("line") or v.get("lineNumber"),
-                    "desc": v.get("description") or v.get("title") or "",
-                    "tool": v.get("tool") or "unknown"
-                })
-        elif "results" in data:  # Checkmarx-like format
-            for r in data.get("results", []):
-                findings.append({
-                    "type": "security_issue",
-                    "severity": (r.get("severity") or "LOW").upper(),
-                    "file": r.get("fileName") or r.get("path") or "",
-                    "line": r.get("line") or r.get("lineNumber"),
-                    "desc": r.get("description") or r.get("resultDescription") or "",
-                    "tool": "security_scanner"
-                })
-        
-        return {"findings": findings, "by_severity": _count_by(findings, "severity")}
-    except Exception as e:
-        return {"findings": [], "by_severity": {}, "error": str(e)}
+    report = scan_security_report(scan_data)
+    findings = [{"type": f["type"], "severity": f["severity"], "file": f["file"] or "", "line": f["line"],
+                 "desc": f["message"] or f["title"] or "", "tool": f["tool"], "rule_id": f["rule_id"],
+                 "fingerprint": f["fingerprint"]} for f in report["findings"]]
+    out = {"findings": findings, "by_severity": report["by_severity"], "format": report["format"],
+           "duplicates": report["duplicates"]}
+    if "error" in report:
+        out["error"] = report["error"]
+    return out
 
 def sec_normalize_veracode_tool(xml_or_json_text: str) -> Dict[str, Any]:
     """
     Normalise un rapport Veracode (XML ou JSON) en findings génériques.
-    Returns: {"findings":[{"cwe","severity","file","line","desc"}], "by_severity":{...}}
-    """
-    data = _extract_json(xml_or_json_text)
-    findings = []
-    if data:
-        for f in data.get("findings", []):
-            findings.append({
-                "cwe": f.get("cwe"), "severity": (f.get("severity") or "LOW").upper(),
-                "file": f.get("file"), "line": f.get("line"), "desc": f.get("desc")
-            })
-        return {"findings": findings, "by_severity": _count_by(findings, "severity")}
-    # XML (Veracode XML summaries)
-    try:
-        root = ET.fromstring(xml_or_json_text)
-        for flaw in root.findall(".//flaw"):
-            findings.append({
-                "cwe": flaw.attrib.get("cweid"),
-                "severity": str(flaw.attrib.get("severity") or "0"),
-                "file": flaw.attrib.get("sourcefilepath") or flaw.attrib.get("module") or "",
-                "line": flaw.attrib.get("line"),
-                "desc": flaw.attrib.get("description") or ""
-            })
-        # Convertir numeric severity (1-5) en HIGH/MEDIUM/LOW simple
-        for f in findings:
-            try:
-                sev = int(f["severity"])
-                f["severity"] = "HIGH" if sev >= 4 else "MEDIUM" if sev == 3 else "LOW"
-            except Exception:
-                f["severity"] = str(f["severity"]).upper()
-    except Exception:
-        pass
-    return {"findings": findings, "by_severity": _count_by(findings, "severity")}
+    Returns: {"findings":[{"cwe","severity","file","line","desc","fingerprint"}], "by_severity":{...}}
+    """
+    report = scan_security_report(xml_or_json_text, default_format="veracode")
+    findings = _project(report, {"cwe": "cwe", "severity": "severity", "file": "file", "line": "line",
+                                 "desc": "message"})
+    return {"findings": findings, "by_severity": report["by_severity"]}
 
 def sec_normalize_checkmarx_tool(json_text: str) -> Dict[str, Any]:
     """
     Normalise un rapport Checkmarx JSON.
-    Returns: {"findings":[{"query","severity","file","line","desc"}], "by_severity":{...}}
+    Returns: {"findings":[{"query","severity","file","line","desc","fingerprint"}], "by_severity":{...}}
     """
-    data = _extract_json(json_text) or {}
-    findings = []
-    for r in data.get("results", []):
-        findings.append({
-            "query": r.get("queryName") or r.get("queryID"),
-            "severity": (r.get("severity") or "LOW").upper(),
-            "file": (r.get("fileName") or r.get("path")),
-            "line": r.get("line"),
-            "desc": r.get("description") or r.get("resultDescription") or ""
-        })
-    return {"findings": findings, "by_severity": _count_by(findings, "severity")}
+    report = scan_security_report(json_text, default_format="checkmarx")
+    findings = _project(report, {"query": "rule_id", "severity": "severity", "file": "file", "line": "line",
+                                 "desc": "message"})
+    return {"findings": findings, "by_severity": report["by_severity"]}
 
 def sec_policy_compliance_tool(policy_yaml_or_json_text: str, findings_text: str) -> Dict[str, Any]:
     """
@@ -655,8 +1770,17 @@ def sec_policy_compliance_tool(policy_yaml_or_json_text: str, findings_text: str
     Policy ex.: {"min_coverage":80,"block_on":{"HIGH":1,"MEDIUM":5}}
     """
     policy = _extract_yaml(policy_yaml_or_json_text) or _extract_json(policy_yaml_or_json_text) or {}
-    f = _extract_json(findings_text) or {}
-    by_sev = f.get("by_severity") or _count_by(f.get("findings", []), "severity")
+    head = (findings_text or "")[:SEC_SNIFF_BYTES]
+    f = _extract_json(findings_text) if ('"by_severity"' in head or '"findings"' in head) else None
+    by_sev = None
+    if isinstance(f, dict) and (f.get("by_severity") or isinstance(f.get("findings"), list)):
+        # findings déjà normalisés (sortie d'un outil sec_*) : comptés tels quels, seulement si toutes les
+        # sévérités sont des libellés normalisés (un rapport Veracode brut a aussi "findings", sévérités 0-5)
+        counted = f.get("by_severity") or _count_by(f.get("findings", []), "severity")
+        if isinstance(counted, dict) and set(counted) <= _SEC_LEVELS:
+            by_sev = counted
+    if by_sev is None:  # rapport brut d'un scanner : chaque finding compte, pas de déduplication pour une gate
+        by_sev = scan_security_report(findings_text or "", dedupe=False)["by_severity"]
     violations = []
     block_on = policy.get("block_on", {})
     for sev, limit in (block_on or {}).items():
@@ -0,0 +1,138 @@
+# benchmarks/corpus.py — corpus synthétique d'archives pour les benchmarks d'ingestion
+import os, io, json, random, tarfile, zipfile, argparse
+from dataclasses import dataclass, asdict, field
+from typing import Dict, List, Tuple
+
+WORDS = (
+    "deploy pipeline cluster ingress latency request error timeout retry worker queue cache index "
+    "postgres redis kubernetes service pod container build release rollback metric trace span log "
+    "warning info debug user session token payload schema config vector embedding chunk document"
+).split()
+
+
+@dataclass
+class CorpusSpec:
+    files: int = 200
+    min_size: int = 2 * 1024
+    max_size: int = 64 * 1024
+    extensions: Tuple[str, ...] = (".md", ".log", ".json", ".yaml", ".txt")
+    depth: int = 2                 # profondeur max des sous-dossiers
+    nested_tars: int = 0           # nombre de .tar internes (déballés par extract_nested_tars)
+    fmt: str = "zip"               # zip | tar.gz
+    seed: int = 42
+    salt: str = ""                 # rend le contenu unique (sinon tout est dédupliqué par content_hash)
+
+
+@dataclass
+class CorpusStats:
+    path: str
+    files: int = 0
+    bytes: int = 0
+    by_extension: Dict[str, int] = field(default_factory=dict)
+
+
+def _text(rng: random.Random, size: int, salt: str) -> str:
+    lines, total = [f"# {salt}"], 0
+    while total < size:
+        line = " ".join(rng.choice(WORDS) for _ in range(rng.randint(6, 16)))
+        lines.append(line); total += len(line) + 1
+    return "\n".join(lines)[:size]
+
+def _log(rng: random.Random, size: int, salt: str) -> str:
+    lines, total, t = [], 0, 1_700_000_000
+    while total < size:
+        t += rng.randint(0, 5)
+        level = rng.choice(("INFO", "INFO", "INFO", "WARN", "ERROR", "DEBUG"))
+        line = f"{t} {level} [{rng.choice(WORDS)}] {salt} " + " ".join(rng.choice(WORDS) for _ in range(8))
+        lines.append(line); total += len(line) + 1
+    return "\n".join(lines)[:size]
+
+def _json(rng: random.Random, size: int, salt: str) -> str:
+    items, total = [], 0
+    while total < size:
+        item = {"id": len(items), "salt": salt, "name": rng.choice(WORDS),
+                "tags": [rng.choice(WORDS) for _ in range(4)], "value": rng.random()}
+        items.append(item); total += len(json.dumps(item)) + 2
+    return json.dumps({"items": items}, indent=1)
+
+def _yaml(rng: random.Random, size: int, salt: str) -> str:
+    lines, total = [f"salt: {salt}", "items:"], 0
+    while total < size:
+        block = f"  - name: {rng.choice(WORDS)}\n    replicas: {rng.randint(1, 9)}\n    image: {rng.choice(WORDS)}:1.{rng.randint(0, 99)}"
+        lines.append(block); total += len(block) + 1
+    return "\n".join(lines)
+
+GENERATORS = {".log": _log, ".json": _json, ".yaml": _yaml, ".yml": _yaml}
+
+def generate_files(spec: CorpusSpec) -> List[Tuple[str, bytes]]:
+    """(chemin relatif, contenu) ; déterministe pour (seed, salt)."""
+    rng = random.Random(f"{spec.seed}:{spec.salt}")
+    out = []
+    for i in range(spec.files):
+        ext = spec.extensions[i % len(spec.extensions)]
+        parts = [f"d{rng.randint(0, 3)}" for _ in range(rng.randint(0, spec.depth))]
+        rel = "/".join(parts + [f"file_{i:05d}{ext}"])
+        size = rng.randint(spec.min_size, spec.max_size)
+        body = GENERATORS.get(ext, _text)(rng, size, f"{spec.salt}:{i}")
+        out.append((rel, body.encode("utf-8")))
+    return out
+
+def _tar_bytes(files: List[Tuple[str, bytes]]) -> bytes:
+    buf = io.BytesIO()
+    with tarfile.open(fileobj=buf, mode="w") as t:
+        for rel, data in files:
+            info = tarfile.TarInfo(rel); info.size = len(data)
+            t.addfile(info, io.BytesIO(data))
+    return buf.getvalue()
+
+def build_archive(spec: CorpusSpec, out_dir: str) -> CorpusStats:
+    """Écrit l'archive (zip ou tar.gz) ; une partie des fichiers peut être emballée dans des .tar internes."""
+    os.makedirs(out_dir, exist_ok=True)
+    files = generate_files(spec)
+    stats = CorpusStats(path="")
+    for rel, data in files:
+        ext = os.path.splitext(rel)[1]
+        stats.files += 1; stats.bytes += len(data)
+        stats.by_extension[ext] = stats.by_extension.get(ext, 0) + 1
+
+    entries: List[Tuple[str, bytes]] = []
+    if spec.nested_tars > 0:
+        per_tar = max(1, len(files) // (spec.nested_tars + 1))
+        for n in range(spec.nested_tars):
+            chunk, files = files[:per_tar], files[per_tar:]
+            if chunk:
+                entries.append((f"nested/inner_{n}.tar", _tar_bytes(chunk)))
+    entries += files
+
+    name = f"corpus_{spec.files}f_{spec.seed}_{spec.salt or 'nosalt'}"
+    if spec.fmt == "zip":
+        stats.path = os.path.join(out_dir, f"{name}.zip")
+        with zipfile.ZipFile(stats.path, "w", compression=zipfile.ZIP_DEFLATED) as z:
+            for rel, data in entries:
+                z.writestr(rel, data)
+    else:
+        stats.path = os.path.join(out_dir, f"{name}.tar.gz")
+        with tarfile.open(stats.path, "w:gz") as t:
+            for rel, data in entries:
+                info = tarfile.TarInfo(rel); info.size = len(data)
+                t.addfile(info, io.BytesIO(data))
+    return stats
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Génère une archive de corpus synthétique")
+    ap.add_argument("--out", default="bench_data")
+    ap.add_argument("--files", type=int, default=200)
+    ap.add_argument("--min-size", type=int, default=2 * 1024)
+    ap.add_argument("--max-size", type=int, default=64 * 1024)
+    ap.add_argument("--extensions", default=".md,.log,.json,.yaml,.txt")
+    ap.add_argument("--depth", type=int, default=2)
+    ap.add_argument("--nested-tars", type=int, default=0)
+    ap.add_argument("--format", dest="fmt", choices=("zip", "tar.gz"), default="zip")
+    ap.add_argument("--seed", type=int, default=42)
+    ap.add_argument("--salt", default="")
+    a = ap.parse_args()
+    spec = CorpusSpec(files=a.files, min_size=a.min_size, max_size=a.max_size,
+                      extensions=tuple(e.strip() for e in a.extensions.split(",") if e.strip()),
+                      depth=a.depth, nested_tars=a.nested_tars, fmt=a.fmt, seed=a.seed, salt=a.salt)
+    print(json.dumps(asdict(build_archive(spec, a.out)), indent=2))
@@ -0,0 +1,133 @@
+# benchmarks/fake_embeddings.py — faux serveur d'embeddings compatible OpenAI (latence et quotas configurables)
+# Pointer le backend dessus : OPENAI_BASE_URL=http://127.0.0.1:<port>/v1 OPENAI_API_KEY=bench
+import json, time, random, hashlib, argparse, threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Optional
+
+import numpy as np
+
+DIMENSIONS = 1536
+
+
+class FakeEmbeddingServer:
+    """
+    POST /v1/embeddings : vecteurs déterministes (hash du texte), après latency_ms ± jitter_ms.
+    Au-delà de rpm requêtes sur une fenêtre glissante de 60 s, répond 429 avec Retry-After.
+    GET /stats : compteurs (requêtes, 429, entrées, latence servie).
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, latency_ms: float = 50.0,
+                 jitter_ms: float = 10.0, rpm: Optional[int] = None, error_rate: float = 0.0):
+        self.latency_ms, self.jitter_ms, self.rpm, self.error_rate = latency_ms, jitter_ms, rpm, error_rate
+        self._lock = threading.Lock()
+        self._window: list = []
+        self.stats: Dict[str, Any] = {"requests": 0, "throttled": 0, "errors": 0, "inputs": 0, "served_ms": 0.0}
+        self.httpd = ThreadingHTTPServer((host, port), self._handler())
+        self.httpd.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self) -> "FakeEmbeddingServer":
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown(); self.httpd.server_close()
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return dict(self.stats)
+
+    def _admit(self) -> Optional[float]:
+        """None si la requête passe, sinon le Retry-After (s)."""
+        now = time.monotonic()
+        with self._lock:
+            self.stats["requests"] += 1
+            if self.rpm:
+                self._window = [t for t in self._window if now - t < 60.0]
+                if len(self._window) >= self.rpm:
+                    self.stats["throttled"] += 1
+                    return max(0.1, 60.0 - (now - self._window[0]))
+                self._window.append(now)
+            return None
+
+    @staticmethod
+    def vector(text: str) -> list:
+        seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "little")
+        v = np.random.default_rng(seed).standard_normal(DIMENSIONS)
+        return (v / np.linalg.norm(v)).round(6).tolist()
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def _send(self, code: int, body: Dict[str, Any], headers: Optional[Dict[str, str]] = None):
+                data = json.dumps(body).encode("utf-8")
+                self.send_response(code)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                for k, v in (headers or {}).items():
+                    self.send_header(k, v)
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_GET(self):
+                if self.path.rstrip("/") == "/stats":
+                    self._send(200, server.snapshot())
+                else:
+                    self._send(404, {"error": {"message": "not found"}})
+
+            def do_POST(self):
+                if not self.path.rstrip("/").endswith("/embeddings"):
+                    return self._send(404, {"error": {"message": "not found"}})
+                payload = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+                retry_after = server._admit()
+                if retry_after is not None:
+                    return self._send(429, {"error": {"message": "Rate limit reached", "type": "requests"}},
+                                      {"Retry-After": f"{retry_after:.2f}"})
+                if server.error_rate and random.random() < server.error_rate:
+                    with server._lock:
+                        server.stats["errors"] += 1
+                    return self._send(500, {"error": {"message": "injected failure"}})
+                inputs = payload.get("input", [])
+                inputs = [inputs] if isinstance(inputs, str) else inputs
+                delay = max(0.0, random.gauss(server.latency_ms, server.jitter_ms)) / 1000.0
+                time.sleep(delay)
+                with server._lock:
+                    server.stats["inputs"] += len(inputs)
+                    server.stats["served_ms"] += delay * 1000
+                self._send(200, {
+                    "object": "list",
+                    "model": payload.get("model", "text-embedding-3-small"),
+                    "data": [{"object": "embedding", "index": i, "embedding": server.vector(t)}
+                             for i, t in enumerate(inputs)],
+                    "usage": {"prompt_tokens": sum(len(t) // 4 for t in inputs),
+                              "total_tokens": sum(len(t) // 4 for t in inputs)},
+                })
+
+        return Handler
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Faux serveur d'embeddings OpenAI pour les benchmarks")
+    ap.add_argument("--port", type=int, default=8089)
+    ap.add_argument("--latency-ms", type=float, default=50.0)
+    ap.add_argument("--jitter-ms", type=float, default=10.0)
+    ap.add_argument("--rpm", type=int, default=0, help="0 = pas de limite")
+    ap.add_argument("--error-rate", type=float, default=0.0)
+    a = ap.parse_args()
+    srv = FakeEmbeddingServer(port=a.port, latency_ms=a.latency_ms, jitter_ms=a.jitter_ms,
+                              rpm=a.rpm or None, error_rate=a.error_rate)
+    print(f"🧪 fake embeddings sur {srv.base_url}")
+    try:
+        srv.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,187 @@
+# benchmarks/ingest_bench.py — benchmark de bout en bout du chemin d'ingestion
+#
+#   python -m benchmarks.ingest_bench --output bench.json
+#   python -m benchmarks.ingest_bench --scenarios many-small --compare bench_main.json
+#
+# Nécessite Postgres/pgvector (PG_* ; utiliser une base dédiée) et, pour le limiteur d'embeddings, Redis.
+# Les embeddings sont servis par benchmarks/fake_embeddings.py : aucun appel fournisseur réel.
+import os, sys, json, time, uuid, shutil, platform, argparse, resource, subprocess, tempfile
+import multiprocessing as mp
+from queue import Empty
+from dataclasses import asdict
+from typing import Any, Dict, List, Optional
+
+from benchmarks.corpus import CorpusSpec, build_archive, generate_files
+from benchmarks.fake_embeddings import FakeEmbeddingServer
+
+# mode : "archive" = ingest_archive_job (extraction + lots), "store" = store_in_pgvector sur un dict en mémoire
+SCENARIOS: Dict[str, Dict[str, Any]] = {
+    "many-small": {"mode": "archive", "spec": CorpusSpec(files=500, min_size=1024, max_size=8 * 1024)},
+    "few-large": {"mode": "archive", "spec": CorpusSpec(files=20, min_size=200 * 1024, max_size=1024 * 1024)},
+    "nested": {"mode": "archive",
+               "spec": CorpusSpec(files=200, depth=4, nested_tars=3, fmt="tar.gz")},
+    "throttled": {"mode": "archive", "spec": CorpusSpec(files=200, min_size=1024, max_size=8 * 1024),
+                  "server": {"rpm": 600}},
+    "store-direct": {"mode": "store", "spec": CorpusSpec(files=300)},
+}
+
+# Métriques de débit : une baisse au-delà de --max-regression fait échouer --compare
+THROUGHPUT_METRICS = ("files_per_s", "chunks_per_s", "rows_per_s")
+
+
+def _db_counts(cur) -> Dict[str, int]:
+    cur.execute("SELECT COUNT(*), COALESCE(MAX(id), 0) FROM documents;")
+    docs, max_doc = cur.fetchone()
+    cur.execute("SELECT COUNT(*) FROM document_chunks;")
+    return {"documents": docs, "chunks": cur.fetchone()[0], "max_document_id": max_doc}
+
+def _run_scenario(name: str, scenario: Dict[str, Any], base_url: str, work_dir: str, cleanup: bool, out):
+    """Process enfant : env du faux fournisseur avant l'import de tools, pic RSS isolé par scénario."""
+    os.environ["OPENAI_BASE_URL"] = base_url
+    os.environ.setdefault("OPENAI_API_KEY", "bench")
+    import tools
+    from ingestion_queue.tasks import ingest_archive_job
+
+    spec: CorpusSpec = scenario["spec"]
+    conn = tools.get_pg_connection(); cur = conn.cursor()
+    before = _db_counts(cur)
+    try:
+        if scenario["mode"] == "archive":
+            corpus = build_archive(spec, os.path.join(work_dir, "corpus"))
+            files, size = corpus.files, corpus.bytes
+            t0 = time.perf_counter()
+            ingest_archive_job(corpus.path, extract_root=os.path.join(work_dir, "extracted"))
+        else:
+            generated = generate_files(spec)
+            files, size = len(generated), sum(len(d) for _, d in generated)
+            payload = {rel: data.decode("utf-8") for rel, data in generated}
+            t0 = time.perf_counter()
+            tools.store_in_pgvector(payload)
+        elapsed = time.perf_counter() - t0
+        after = _db_counts(cur)
+    finally:
+        if cleanup:
+            cur.execute("DELETE FROM documents WHERE id > %s;", (before["max_document_id"],))
+            conn.commit()
+        cur.close(); conn.close()
+
+    docs = after["documents"] - before["documents"]
+    chunks = after["chunks"] - before["chunks"]
+    out.put({
+        "mode": scenario["mode"],
+        "corpus": {"files": files, "bytes": size, **{k: v for k, v in asdict(spec).items() if k != "salt"}},
+        "elapsed_s": round(elapsed, 3),
+        "documents_inserted": docs,
+        "chunks_inserted": chunks,
+        "files_per_s": round(files / elapsed, 2) if elapsed else 0.0,
+        "chunks_per_s": round(chunks / elapsed, 2) if elapsed else 0.0,
+        "rows_per_s": round((docs + chunks) / elapsed, 2) if elapsed else 0.0,
+        "mb_per_s": round(size / 1e6 / elapsed, 3) if elapsed else 0.0,
+        # ru_maxrss : Ko sous Linux, octets sous macOS
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+                             / (1024 * 1024 if sys.platform == "darwin" else 1024), 1),
+    })
+
+def _child_result(p, out) -> Optional[Dict[str, Any]]:
+    """Attend le résultat du scénario tant que le process enfant vit ; None s'il meurt sans résultat."""
+    while True:
+        try:
+            return out.get(timeout=1.0)
+        except Empty:
+            if not p.is_alive():
+                try:
+                    return out.get(timeout=1.0)  # mis en file juste avant la sortie
+                except Empty:
+                    return None
+
+def run_benchmarks(names: List[str], latency_ms: float, jitter_ms: float, cleanup: bool,
+                   salt: Optional[str] = None) -> Dict[str, Any]:
+    salt = salt or uuid.uuid4().hex[:8]  # contenu unique : rien n'est dédupliqué par content_hash
+    results: Dict[str, Any] = {}
+    ctx = mp.get_context("spawn")
+    for name in names:
+        scenario = dict(SCENARIOS[name])
+        scenario["spec"] = CorpusSpec(**{**asdict(scenario["spec"]), "salt": f"{salt}-{name}"})
+        server = FakeEmbeddingServer(latency_ms=latency_ms, jitter_ms=jitter_ms,
+                                     **scenario.get("server", {})).start()
+        work_dir = tempfile.mkdtemp(prefix=f"bench_{name}_")
+        try:
+            out = ctx.Queue()
+            p = ctx.Process(target=_run_scenario, args=(name, scenario, server.base_url, work_dir, cleanup, out))
+            p.start()
+            # Résultat lu avant join() : un enfant bloqué sur le flush de la Queue ne se termine jamais
+            result = _child_result(p, out)
+            p.join()
+            if result is None or p.exitcode != 0:
+                results[name] = {"error": f"exit code {p.exitcode}"}
+                continue
+            stats = server.snapshot()
+            result["embedding_requests"] = stats["requests"]
+            result["embedding_throttled"] = stats["throttled"]
+            result["embedding_inputs"] = stats["inputs"]
+            results[name] = result
+            print(f"📈 {name}: {result['files_per_s']} files/s, {result['chunks_per_s']} chunks/s, "
+                  f"{result['rows_per_s']} rows/s, {stats['requests']} req ({stats['throttled']} 429), "
+                  f"RSS {result['peak_rss_mb']} MB")
+        finally:
+            server.stop()
+            shutil.rmtree(work_dir, ignore_errors=True)
+    return {
+        "commit": _git_commit(),
+        "timestamp": time.time(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "params": {"latency_ms": latency_ms, "jitter_ms": jitter_ms, "salt": salt},
+        "scenarios": results,
+    }
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], stderr=subprocess.DEVNULL).decode().strip()
+    except Exception:
+        return None
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any], max_regression: float) -> List[str]:
+    """Écarts de débit vs une exécution de référence ; retourne les régressions au-delà du seuil."""
+    regressions = []
+    for name, cur in current["scenarios"].items():
+        base = baseline.get("scenarios", {}).get(name)
+        if not base or "error" in cur or "error" in base:
+            continue
+        for metric in THROUGHPUT_METRICS + ("peak_rss_mb",):
+            if not base.get(metric):
+                continue
+            delta = (cur[metric] - base[metric]) / base[metric]
+            print(f"   {name}.{metric}: {base[metric]} -> {cur[metric]} ({delta:+.1%})")
+            if metric in THROUGHPUT_METRICS and delta < -max_regression:
+                regressions.append(f"{name}.{metric} {delta:+.1%}")
+    return regressions
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Benchmark d'ingestion de bout en bout")
+    ap.add_argument("--scenarios", default=",".join(SCENARIOS), help=f"parmi : {', '.join(SCENARIOS)}")
+    ap.add_argument("--latency-ms", type=float, default=50.0)
+    ap.add_argument("--jitter-ms", type=float, default=10.0)
+    ap.add_argument("--output", help="fichier JSON de résultats")
+    ap.add_argument("--compare", help="JSON d'une exécution de référence")
+    ap.add_argument("--max-regression", type=float, default=0.15)
+    ap.add_argument("--no-cleanup", action="store_true", help="garder les documents insérés")
+    a = ap.parse_args()
+
+    names = [n.strip() for n in a.scenarios.split(",") if n.strip()]
+    unknown = [n for n in names if n not in SCENARIOS]
+    if unknown:
+        ap.error(f"scénario(s) inconnu(s) : {', '.join(unknown)}")
+    report = run_benchmarks(names, a.latency_ms, a.jitter_ms, cleanup=not a.no_cleanup)
+    if a.output:
+        with open(a.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+    if a.compare:
+        with open(a.compare, "r", encoding="utf-8") as f:
+            regressions = compare(report, json.load(f), a.max_regression)
+        if regressions:
+            print(f"❌ régressions : {', '.join(regressions)}")
+            sys.exit(1)
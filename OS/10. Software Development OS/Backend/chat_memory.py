@@ -0,0 +1,84 @@
+# chat_memory.py
+import os
+from typing import Any, Dict, List
+from psycopg2.extras import Json
+
+# Taille du contexte conversationnel transmis aux agents (bornée, indépendante de la longueur du chat)
+CHAT_RECENT_TURNS = int(os.getenv("CHAT_RECENT_TURNS", "6"))
+CHAT_SUMMARY_MAX_CHARS = int(os.getenv("CHAT_SUMMARY_MAX_CHARS", "4000"))
+CHAT_TURN_MAX_CHARS = int(os.getenv("CHAT_TURN_MAX_CHARS", "2000"))
+CHAT_SUMMARY_LINE_CHARS = 240
+
+# ---------- DDL ----------
+def init_chat_state_table(cur):
+    """Une ligne par chat : résumé incrémental + N derniers tours (jamais relus depuis `messages`)."""
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS chat_state (
+            chat_id INTEGER PRIMARY KEY REFERENCES chats(id) ON DELETE CASCADE,
+            summary TEXT NOT NULL DEFAULT '',
+            recent JSONB NOT NULL DEFAULT '[]'::jsonb,   -- [{"user": str, "assistant": str}, ...]
+            turns INTEGER NOT NULL DEFAULT 0,
+            updated_at TIMESTAMPTZ DEFAULT NOW()
+        );
+    """)
+
+# ---------- Utilitaires ----------
+def _clip(text: str, limit: int) -> str:
+    text = (text or "").strip()
+    return text if len(text) <= limit else text[:limit].rstrip() + " …"
+
+def _one_line(text: str, limit: int) -> str:
+    return _clip(" ".join((text or "").split()), limit)
+
+def fold_into_summary(summary: str, evicted: List[Dict[str, str]], max_chars: int = CHAT_SUMMARY_MAX_CHARS) -> str:
+    """
+    Résumé extractif incrémental : chaque tour sorti de la fenêtre devient une ligne compacte.
+    Au-delà de max_chars, les lignes les plus anciennes sont abandonnées (le résumé reste borné).
+    """
+    lines = [ln for ln in (summary or "").splitlines() if ln.strip()]
+    half = CHAT_SUMMARY_LINE_CHARS // 2
+    for t in evicted:
+        lines.append(f"- U: {_one_line(t.get('user', ''), half)} → A: {_one_line(t.get('assistant', ''), half)}")
+    while lines and sum(len(ln) + 1 for ln in lines) > max_chars:
+        lines.pop(0)
+    return "\n".join(lines)
+
+# ---------- Lecture (chemin chaud : une ligne par clé primaire) ----------
+def load_chat_state(cur, chat_id: int) -> Dict[str, Any]:
+    cur.execute("SELECT summary, recent FROM chat_state WHERE chat_id=%s;", (chat_id,))
+    row = cur.fetchone()
+    if not row:
+        return {"summary": "", "recent": []}
+    return {"summary": row["summary"] or "", "recent": row["recent"] or []}
+
+def render_chat_context(state: Dict[str, Any]) -> str:
+    """Texte de contexte transmis à l'agent (vide pour un nouveau chat)."""
+    parts = []
+    if state.get("summary"):
+        parts.append(f"Résumé de la conversation :\n{state['summary']}")
+    if state.get("recent"):
+        turns = "\n".join(f"Utilisateur : {t.get('user', '')}\nAssistant : {t.get('assistant', '')}"
+                          for t in state["recent"])
+        parts.append(f"Derniers échanges :\n{turns}")
+    return "\n\n".join(parts)
+
+# ---------- Mise à jour (après chaque réponse assistant) ----------
+def record_turn(cur, chat_id: int, user_text: str, assistant_text: str,
+                recent_turns: int = CHAT_RECENT_TURNS):
+    """
+    Ajoute le tour à la fenêtre glissante et replie les tours évincés dans le résumé.
+    À appeler dans la transaction qui persiste la réponse ; FOR UPDATE sérialise les tours concurrents.
+    """
+    cur.execute("INSERT INTO chat_state (chat_id) VALUES (%s) ON CONFLICT (chat_id) DO NOTHING;", (chat_id,))
+    cur.execute("SELECT summary, recent, turns FROM chat_state WHERE chat_id=%s FOR UPDATE;", (chat_id,))
+    row = cur.fetchone()
+    recent = list(row["recent"] or [])
+    recent.append({"user": _clip(user_text, CHAT_TURN_MAX_CHARS),
+                   "assistant": _clip(assistant_text, CHAT_TURN_MAX_CHARS)})
+    keep = max(0, recent_turns)
+    evicted, recent = recent[:len(recent) - keep], recent[len(recent) - keep:]
+    summary = fold_into_summary(row["summary"], evicted) if evicted else (row["summary"] or "")
+    cur.execute(
+        "UPDATE chat_state SET summary=%s, recent=%s, turns=%s, updated_at=NOW() WHERE chat_id=%s;",
+        (summary, Json(recent), (row["turns"] or 0) + 1, chat_id)
+    )
@@ -3,6 +3,14 @@ import os, json
 from typing import Any, Dict, Optional
 import requests
 
+# Outils à effets de bord (création, commentaire, déclenchement, notification) : un module dont
+# une équipe les utilise n'est jamais servi depuis le cache de réponses (cf. main.AgentRouter)
+SIDE_EFFECT_TOOLS = frozenset({
+    "gh_post_pr_comment_tool", "gh_set_commit_status_tool", "gl_post_mr_comment_tool",
+    "jira_create_issue_tool", "gha_dispatch_workflow_tool", "gl_trigger_pipeline_tool",
+    "confluence_create_page_tool", "slack_webhook_post_tool",
+})
+
 # ---------- util ----------
 def _resp(r: requests.Response) -> Dict[str, Any]:
     try:
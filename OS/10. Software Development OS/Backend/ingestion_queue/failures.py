@@ -0,0 +1,183 @@
+import os, json, time, random, traceback
+from typing import Any, Dict, List, Optional
+from rq import Queue, Retry, Worker
+from rq.job import Job
+from rq.exceptions import NoSuchJobError
+from ingestion_queue.progress import ProgressReporter
+
+# Échecs d'ingestion :
+#   - compteurs par classe d'exception (toutes tentatives / échecs définitifs)
+#   - dead-letter queue : payload d'origine des jobs en échec définitif, rejouable via requeue_dead_letter
+DLQ_KEY = "ingest:dlq"                       # hash job_id -> entrée JSON
+DLQ_INDEX_KEY = "ingest:dlq:index"           # zset job_id -> date d'échec (ordre d'affichage)
+DLQ_MAX_ENTRIES = int(os.getenv("INGEST_DLQ_MAX_ENTRIES", "5000"))
+FAILURES_ATTEMPTS_KEY = "ingest:failures:attempts"
+FAILURES_FINAL_KEY = "ingest:failures:final"
+
+# Erreurs sur le contenu lui-même (upload corrompu) : aucun retry, directement en DLQ
+NON_RETRYABLE_ERRORS = {
+    name.strip() for name in os.getenv(
+        "INGEST_NON_RETRYABLE_ERRORS",
+        "CorruptUploadError,BadZipFile,ReadError,UnidentifiedImageError,DecompressionBombError,PdfReadError,"
+        "UnicodeDecodeError"
+    ).split(",") if name.strip()
+}
+
+def retry_policy(max_retries: int, base_s: float, cap_s: float = 1800.0) -> Optional[Retry]:
+    """Backoff exponentiel avec jitter (±25 %), calculé à l'enqueue : base, 2*base, 4*base, ..."""
+    if max_retries <= 0:
+        return None
+    intervals = [int(min(cap_s, base_s * (2 ** i)) * random.uniform(0.75, 1.25)) for i in range(max_retries)]
+    return Retry(max=max_retries, interval=intervals)
+
+def error_class(exc_type) -> str:
+    if exc_type is None:
+        return "Unknown"
+    module = getattr(exc_type, "__module__", "") or ""
+    return exc_type.__name__ if module in ("builtins", "") else f"{module}.{exc_type.__name__}"
+
+def is_retryable(exc_type) -> bool:
+    return not any(cls.__name__ in NON_RETRYABLE_ERRORS for cls in getattr(exc_type, "__mro__", ()))
+
+def on_ingest_failure(job: Job, connection, exc_type, exc_value, tb):
+    """
+    Callback RQ on_failure (appelé à chaque tentative, avant la décision de retry).
+    Compte l'échec par classe d'exception et note dans job.meta["retryable"] si l'erreur est
+    rejouable (décision appliquée par IngestWorker). Si c'est la dernière tentative (ou une erreur
+    non rejouable), publie la progression 'failed', range le payload d'origine dans la DLQ et passe
+    l'upload en 'failed'.
+    """
+    cls = error_class(exc_type)
+    connection.hincrby(FAILURES_ATTEMPTS_KEY, cls, 1)
+    retryable = is_retryable(exc_type)
+    job.meta["attempts"] = job.meta.get("attempts", 0) + 1
+    job.meta["retryable"] = retryable
+    job.save_meta()
+    if job.retries_left and retryable:
+        return
+    connection.hincrby(FAILURES_FINAL_KEY, cls, 1)
+    error = f"{type(exc_value).__name__}: {exc_value}"
+    ProgressReporter(job=job).finish("failed", error=error)
+    entry = {
+        "job_id": job.id,
+        "func_name": job.func_name,
+        "args": list(job.args),
+        "kwargs": job.kwargs,
+        "origin": job.origin,
+        "timeout": job.timeout,
+        "error_class": cls,
+        "error": error[:2000],
+        "traceback": "".join(traceback.format_tb(tb))[-4000:] if tb else None,
+        "attempts": job.meta["attempts"],
+        "failed_at": time.time(),
+    }
+    pipe = connection.pipeline()
+    pipe.hset(DLQ_KEY, job.id, json.dumps(entry, default=str))
+    pipe.zadd(DLQ_INDEX_KEY, {job.id: entry["failed_at"]})
+    pipe.execute()
+    _trim_dead_letters(connection)
+    _set_upload_status(job.kwargs.get("upload_hash"), "failed", only_if="pending")
+
+def _set_upload_status(upload_hash: Optional[str], status: str, only_if: Optional[str] = None):
+    """Statut de l'upload du job (coordinateur, agrégation, fichier seul) ; les lots d'archive n'en ont pas."""
+    if not upload_hash:
+        return
+    from tools import set_upload_status
+    try:
+        set_upload_status(upload_hash, status, only_if=only_if)
+    except Exception as e:  # Postgres indisponible : la DLQ est déjà écrite, la maintenance rattrapera
+        print(f"⚠️ upload {upload_hash[:12]}: statut '{status}' non enregistré ({type(e).__name__}: {e})")
+
+class WorkHorseTerminated(Exception):
+    """Work-horse tué pendant le job (OOM, SIGKILL, timeout dur) : aucune exception Python levée."""
+
+class IngestWorker(Worker):
+    """
+    Worker des files d'ingestion : un job dont l'erreur a été classée non rejouable par
+    on_ingest_failure (meta "retryable" = False) n'est pas replanifié, quelle que soit sa politique Retry.
+    Si le work-horse meurt, RQ n'exécute pas le callback on_failure : le worker parent l'appelle
+    lui-même (compteurs, DLQ et upload 'failed' si c'était la dernière tentative).
+    """
+    def handle_work_horse_killed(self, job: Job, retpid, ret_val, rusage):
+        super().handle_work_horse_killed(job, retpid, ret_val, rusage)
+        if job.failure_callback is None:
+            return
+        job.get_meta()  # meta à jour (écrite par le work-horse), pas la copie d'avant le fork
+        exc = WorkHorseTerminated(f"work-horse {retpid} terminé, waitpid={ret_val}")
+        try:
+            job.failure_callback(job, self.connection, WorkHorseTerminated, exc, None)
+        except Exception as e:
+            print(f"⚠️ job {job.id}: callback d'échec impossible après la mort du work-horse ({e})")
+
+    def handle_job_failure(self, job: Job, queue: Queue, started_job_registry=None, exc_string=""):
+        if job.meta.get("retryable") is False:
+            job.retries_left = None
+        return super().handle_job_failure(job, queue, started_job_registry=started_job_registry,
+                                          exc_string=exc_string)
+
+def _trim_dead_letters(connection):
+    excess = connection.zcard(DLQ_INDEX_KEY) - DLQ_MAX_ENTRIES
+    if excess > 0:
+        oldest = connection.zrange(DLQ_INDEX_KEY, 0, excess - 1)
+        pipe = connection.pipeline()
+        pipe.hdel(DLQ_KEY, *oldest)
+        pipe.zrem(DLQ_INDEX_KEY, *oldest)
+        pipe.execute()
+
+def list_dead_letters(connection, limit: int = 100) -> List[Dict[str, Any]]:
+    ids = connection.zrevrange(DLQ_INDEX_KEY, 0, max(0, limit - 1))
+    if not ids:
+        return []
+    return [json.loads(raw) for raw in connection.hmget(DLQ_KEY, ids) if raw]
+
+def get_dead_letter(connection, job_id: str) -> Optional[Dict[str, Any]]:
+    raw = connection.hget(DLQ_KEY, job_id)
+    return json.loads(raw) if raw else None
+
+class DeadLetterRequeueError(ValueError):
+    """Entrée de DLQ qui ne peut pas être rejouée seule."""
+
+# Jobs d'agrégation d'archive : rejoués seuls, ils relanceraient sans leurs lots (dépendances perdues,
+# résultats des lots expirés) et échoueraient de nouveau. On ré-uploade l'archive à la place.
+NON_REQUEUABLE_FUNCS = ("ingestion_queue.tasks.aggregate_archive_job",)
+
+def requeue_dead_letter(connection, job_id: str) -> Optional[Job]:
+    """
+    Rejoue le payload d'origine sous le même job_id (l'upload et le suivi de progression restent
+    valides), avec la politique de retry de sa file. None si le job n'est pas dans la DLQ ;
+    DeadLetterRequeueError pour un job d'agrégation d'archive (rejouer l'upload de l'archive).
+    """
+    from ingestion_queue.routing import job_options
+    entry = get_dead_letter(connection, job_id)
+    if entry is None:
+        return None
+    if entry["func_name"] in NON_REQUEUABLE_FUNCS:
+        raise DeadLetterRequeueError(
+            "Job d'agrégation d'archive : il dépend de ses lots, ré-uploader l'archive pour la réindexer"
+        )
+    try:
+        # Retire l'ancien job (registre des échecs, résultat, meta) avant de réutiliser son id
+        Job.fetch(job_id, connection=connection).delete()
+    except NoSuchJobError:
+        pass
+    opts = job_options(entry["origin"])
+    if entry.get("timeout"):
+        opts["job_timeout"] = entry["timeout"]
+    job = Queue(entry["origin"], connection=connection).enqueue(
+        entry["func_name"], *entry["args"], job_id=job_id, **entry["kwargs"], **opts
+    )
+    pipe = connection.pipeline()
+    pipe.hdel(DLQ_KEY, job_id)
+    pipe.zrem(DLQ_INDEX_KEY, job_id)
+    pipe.execute()
+    _set_upload_status(entry["kwargs"].get("upload_hash"), "pending", only_if="failed")
+    return job
+
+def failure_stats(connection) -> Dict[str, Any]:
+    def decode(h):
+        return {k.decode(): int(v) for k, v in h.items()}
+    return {
+        "attempts_by_class": decode(connection.hgetall(FAILURES_ATTEMPTS_KEY)),
+        "final_by_class": decode(connection.hgetall(FAILURES_FINAL_KEY)),
+        "dead_letters": connection.zcard(DLQ_INDEX_KEY),
+    }
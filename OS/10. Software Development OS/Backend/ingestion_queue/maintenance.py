@@ -0,0 +1,255 @@
+import os, json, time, shutil
+from datetime import timedelta
+from typing import Any, Callable, Dict, List, Tuple
+from rq import Queue, get_current_job
+from tools import UPLOAD_DIR, get_pg_connection, bump_index_version, get_index_version
+from response_cache import RESPONSE_CACHE_TTL_S
+from keyword_index import KEYWORD_INDEX_ENABLED, backfill_keyword_index, prune_term_stats
+
+# Maintenance planifiée (scheduler RQ des workers) : chaque tâche se ré-enfile elle-même avec enqueue_in.
+# Un verrou Redis NX par tâche garantit une seule chaîne planifiée dans tout le cluster ; s'il expire
+# (job perdu, Redis vidé), ensure_maintenance_scheduled() appelé par le superviseur relance la chaîne.
+# File de la chaîne de maintenance : doit être écoutée par un worker avec scheduler, sinon les jobs
+# planifiés ne sont jamais promus (cf. maintenance_queue)
+MAINT_QUEUE = os.getenv("MAINT_QUEUE", "ingest-bulk")
+MAINT_CLEANUP_INTERVAL_S = int(os.getenv("MAINT_CLEANUP_INTERVAL_S", "3600"))
+MAINT_VACUUM_INTERVAL_S = int(os.getenv("MAINT_VACUUM_INTERVAL_S", str(24 * 3600)))
+# Âge minimal avant de considérer un dossier d'extraction / un upload temporaire comme orphelin
+MAINT_ORPHAN_MIN_AGE_S = int(os.getenv("MAINT_ORPHAN_MIN_AGE_S", str(6 * 3600)))
+# Uploads 'pending' sans changement depuis ce délai : worker mort sans callback d'échec -> 'failed'
+MAINT_PENDING_UPLOAD_MAX_AGE_S = int(os.getenv("MAINT_PENDING_UPLOAD_MAX_AGE_S", str(24 * 3600)))
+# Documents 'partial' sans checkpoint récent depuis ce délai : ingestion abandonnée
+MAINT_PARTIAL_MAX_AGE_S = int(os.getenv("MAINT_PARTIAL_MAX_AGE_S", str(7 * 24 * 3600)))
+# Réponses assistant encore 'pending' après ce délai : processus API tué pendant la génération
+MAINT_PENDING_MESSAGE_MAX_AGE_S = int(os.getenv("MAINT_PENDING_MESSAGE_MAX_AGE_S", "3600"))
+INTERRUPTED_REPLY = "Réponse interrompue : la génération n'a pas abouti. Renvoie ta question."
+# Ratio tuples morts / total au-delà duquel les index ANN (ivfflat/hnsw) de la table sont reconstruits
+MAINT_REINDEX_DEAD_RATIO = float(os.getenv("MAINT_REINDEX_DEAD_RATIO", "0.2"))
+
+EXTRACT_ROOT = os.path.join(UPLOAD_DIR, "extracted")
+UPLOAD_TMP_DIR = os.path.join(UPLOAD_DIR, ".tmp")
+VECTOR_TABLES = ("documents", "document_chunks", "response_cache")
+SCHEDULE_LOCK_PREFIX = "maintenance:scheduled:"
+RUN_LOCK_PREFIX = "maintenance:running:"
+REPORT_KEY = "maintenance:last_report"
+
+
+def _dir_size(path: str) -> int:
+    total = 0
+    for root, _, files in os.walk(path):
+        for f in files:
+            try:
+                total += os.path.getsize(os.path.join(root, f))
+            except OSError:
+                pass
+    return total
+
+def _remove(path: str) -> int:
+    """Supprime un fichier ou un dossier et retourne les octets libérés."""
+    if not os.path.exists(path):
+        return 0
+    if os.path.isdir(path):
+        size = _dir_size(path)
+        shutil.rmtree(path, ignore_errors=True)
+    else:
+        size = os.path.getsize(path)
+        os.remove(path)
+    return size
+
+def _older_than(path: str, age_s: float) -> bool:
+    try:
+        return time.time() - os.path.getmtime(path) > age_s
+    except OSError:
+        return False
+
+
+# ---------- Orphelins ----------
+def cleanup_orphans() -> Dict[str, Any]:
+    """
+    - uploads 'pending' abandonnés (passés en 'failed') ;
+    - dossiers Uploads/extracted/* dont l'upload n'est plus en cours d'ingestion (échecs compris) ;
+    - uploads temporaires abandonnés (Uploads/.tmp) ;
+    - fichiers (et vignettes) d'uploads dont tous les documents ont été supprimés ;
+    - documents 'partial' abandonnés, checkpoints périmés, entrées obsolètes du cache de réponses ;
+    - réponses assistant restées 'pending' (passées en 'error') ;
+    - index lexical : rattrapage des documents sans termes, termes sans document.
+    """
+    report: Dict[str, Any] = {"bytes_freed": 0, "stale_uploads": 0, "extract_dirs": 0, "tmp_files": 0,
+                              "uploads": 0, "partial_documents": 0, "checkpoints": 0, "response_cache_rows": 0,
+                              "stale_messages": 0, "keyword_backfilled": 0, "term_stats_pruned": 0}
+    conn = get_pg_connection(); cur = conn.cursor()
+    try:
+        cur.execute("""
+            UPDATE uploads SET status='failed', updated_at=NOW()
+            WHERE status='pending' AND updated_at < NOW() - make_interval(secs => %s);
+        """, (MAINT_PENDING_UPLOAD_MAX_AGE_S,))
+        report["stale_uploads"] = cur.rowcount
+        conn.commit()
+        cur.execute("SELECT sha256 FROM uploads WHERE status='pending';")
+        pending = {r[0] for r in cur.fetchall()}
+        if os.path.isdir(EXTRACT_ROOT):
+            for name in os.listdir(EXTRACT_ROOT):
+                path = os.path.join(EXTRACT_ROOT, name)
+                # Les lots d'une archive en cours lisent encore ce dossier
+                if name not in pending and _older_than(path, MAINT_ORPHAN_MIN_AGE_S):
+                    report["bytes_freed"] += _remove(path); report["extract_dirs"] += 1
+        if os.path.isdir(UPLOAD_TMP_DIR):
+            for name in os.listdir(UPLOAD_TMP_DIR):
+                path = os.path.join(UPLOAD_TMP_DIR, name)
+                if _older_than(path, MAINT_ORPHAN_MIN_AGE_S):
+                    report["bytes_freed"] += _remove(path); report["tmp_files"] += 1
+
+        # Uploads indexés dont plus aucun document n'existe : fichier, vignettes et ligne images/uploads.
+        # Un upload sans document (document_ids vide) n'a rien perdu : ANY('{}') rendrait NOT EXISTS vrai.
+        cur.execute("""
+            SELECT u.sha256, u.path FROM uploads u
+            WHERE u.status='indexed' AND cardinality(u.document_ids) > 0
+              AND NOT EXISTS (SELECT 1 FROM documents d WHERE d.id = ANY(u.document_ids));
+        """)
+        for sha, path in cur.fetchall():
+            report["bytes_freed"] += _remove(os.path.dirname(path))
+            cur.execute("DELETE FROM images WHERE sha256=%s;", (sha,))
+            cur.execute("DELETE FROM uploads WHERE sha256=%s;", (sha,))
+            report["uploads"] += 1
+        conn.commit()
+
+        cur.execute("""
+            DELETE FROM documents d
+            WHERE d.status='partial' AND d.created_at < NOW() - make_interval(secs => %s)
+              AND NOT EXISTS (
+                  SELECT 1 FROM ingest_checkpoints c
+                  WHERE c.document_id = d.id AND c.updated_at >= NOW() - make_interval(secs => %s)
+              );
+        """, (MAINT_PARTIAL_MAX_AGE_S, MAINT_PARTIAL_MAX_AGE_S))
+        report["partial_documents"] = cur.rowcount
+        if cur.rowcount:
+            bump_index_version(cur)
+        cur.execute("DELETE FROM ingest_checkpoints WHERE updated_at < NOW() - make_interval(secs => %s);",
+                    (MAINT_PARTIAL_MAX_AGE_S,))
+        report["checkpoints"] = cur.rowcount
+        conn.commit()
+
+        # Réponses servies seulement pour la version courante de l'index : les autres sont mortes
+        cur.execute("""
+            DELETE FROM response_cache
+            WHERE index_version < %s OR created_at < NOW() - make_interval(secs => %s);
+        """, (get_index_version(), RESPONSE_CACHE_TTL_S))
+        report["response_cache_rows"] = cur.rowcount
+        conn.commit()
+
+        # Table créée par l'API : absente tant qu'elle n'a jamais démarré sur cette base
+        cur.execute("SELECT to_regclass('messages') IS NOT NULL;")
+        if cur.fetchone()[0]:
+            cur.execute("""
+                UPDATE messages SET status='error', content=%s
+                WHERE status='pending' AND role='assistant' AND created_at < NOW() - make_interval(secs => %s);
+            """, (INTERRUPTED_REPLY, MAINT_PENDING_MESSAGE_MAX_AGE_S))
+            report["stale_messages"] = cur.rowcount
+            conn.commit()
+
+        if KEYWORD_INDEX_ENABLED:
+            report["keyword_backfilled"] = backfill_keyword_index(cur)
+            report["term_stats_pruned"] = prune_term_stats(cur)
+            conn.commit()
+    finally:
+        cur.close(); conn.close()
+    return report
+
+
+# ---------- VACUUM / REINDEX ----------
+def _table_stats(cur, table: str) -> Tuple[int, int, int]:
+    """(tuples vivants, tuples morts, taille totale en octets : table + index + TOAST)."""
+    cur.execute("""
+        SELECT COALESCE(s.n_live_tup, 0), COALESCE(s.n_dead_tup, 0), pg_total_relation_size(c.oid)
+        FROM pg_class c LEFT JOIN pg_stat_user_tables s ON s.relid = c.oid
+        WHERE c.oid = to_regclass(%s);
+    """, (table,))
+    row = cur.fetchone()
+    return (row[0], row[1], row[2]) if row else (0, 0, 0)
+
+def _ann_indexes(cur, table: str) -> List[str]:
+    cur.execute("""
+        SELECT i.relname FROM pg_index x
+        JOIN pg_class i ON i.oid = x.indexrelid
+        JOIN pg_am am ON am.oid = i.relam
+        WHERE x.indrelid = to_regclass(%s) AND am.amname IN ('ivfflat', 'hnsw');
+    """, (table,))
+    return [r[0] for r in cur.fetchall()]
+
+def vacuum_vector_tables() -> Dict[str, Any]:
+    """
+    VACUUM ANALYZE des tables vecteur ; REINDEX CONCURRENTLY de leurs index ANN quand la part
+    de tuples morts (mesurée avant le VACUUM, qui remet le compteur à zéro) dépasse le seuil.
+    """
+    report: Dict[str, Any] = {"tables": {}, "bytes_freed": 0}
+    conn = get_pg_connection()
+    conn.autocommit = True  # VACUUM et REINDEX CONCURRENTLY refusent les transactions
+    cur = conn.cursor()
+    try:
+        for table in VECTOR_TABLES:
+            live, dead, before = _table_stats(cur, table)
+            if not before:
+                continue
+            ratio = dead / (live + dead) if (live + dead) else 0.0
+            cur.execute(f"VACUUM (ANALYZE) {table};")
+            reindexed = []
+            if ratio >= MAINT_REINDEX_DEAD_RATIO:
+                for index in _ann_indexes(cur, table):
+                    cur.execute(f'REINDEX INDEX CONCURRENTLY "{index}";')
+                    reindexed.append(index)
+            after = _table_stats(cur, table)[2]
+            report["tables"][table] = {"live": live, "dead": dead, "dead_ratio": round(ratio, 4),
+                                       "bytes_before": before, "bytes_after": after, "reindexed": reindexed}
+            report["bytes_freed"] += max(0, before - after)
+    finally:
+        cur.close(); conn.close()
+    return report
+
+
+# ---------- Planification ----------
+MAINTENANCE_TASKS: Dict[str, Tuple[Callable[[], Dict[str, Any]], int]] = {
+    "cleanup": (cleanup_orphans, MAINT_CLEANUP_INTERVAL_S),
+    "vacuum": (vacuum_vector_tables, MAINT_VACUUM_INTERVAL_S),
+}
+
+def maintenance_queue(listen_queues: List[str]) -> str:
+    """MAINT_QUEUE si ce process l'écoute, sinon sa propre file (la première écoutée)."""
+    return MAINT_QUEUE if MAINT_QUEUE in listen_queues else listen_queues[0]
+
+def _schedule(connection, task: str, delay_s: int, queue: str = MAINT_QUEUE):
+    Queue(queue, connection=connection).enqueue_in(
+        timedelta(seconds=delay_s), run_maintenance_task, task, job_timeout=3600,
+    )
+
+def ensure_maintenance_scheduled(connection, queue: str = MAINT_QUEUE):
+    """
+    Amorce chaque chaîne sur `queue` si aucune n'est planifiée (verrou NX, TTL = intervalle + marge).
+    `queue` doit être écoutée par l'appelant (cf. maintenance_queue) ; la chaîne y reste ensuite.
+    """
+    for task, (_, interval) in MAINTENANCE_TASKS.items():
+        if interval <= 0:
+            continue
+        if connection.set(SCHEDULE_LOCK_PREFIX + task, "1", nx=True, ex=interval + 600):
+            _schedule(connection, task, 60, queue)
+
+def run_maintenance_task(task: str) -> Dict[str, Any]:
+    func, interval = MAINTENANCE_TASKS[task]
+    job = get_current_job()
+    connection = job.connection
+    # Prochaine exécution planifiée d'abord (même file) : un échec de cette passe ne casse pas la chaîne
+    connection.set(SCHEDULE_LOCK_PREFIX + task, "1", ex=interval + 600)
+    _schedule(connection, task, interval, job.origin)
+    if not connection.set(RUN_LOCK_PREFIX + task, "1", nx=True, ex=3600):
+        return {"task": task, "skipped": "already running"}
+    started = time.monotonic()
+    try:
+        report = func()
+    finally:
+        connection.delete(RUN_LOCK_PREFIX + task)
+    report.update({"task": task, "duration_s": round(time.monotonic() - started, 2), "at": time.time()})
+    connection.hset(REPORT_KEY, task, json.dumps(report))
+    print(f"🧹 maintenance {task}: {report['bytes_freed'] / 1e6:.1f} MB libérés en {report['duration_s']}s")
+    return report
+
+def maintenance_reports(connection) -> Dict[str, Any]:
+    return {k.decode(): json.loads(v) for k, v in connection.hgetall(REPORT_KEY).items()}
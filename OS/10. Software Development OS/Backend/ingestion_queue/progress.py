@@ -0,0 +1,150 @@
+import json, time
+from contextlib import contextmanager
+from typing import Any, Dict, Optional
+from rq import get_current_job
+
+# Progression fine des jobs d'ingestion :
+#   - état courant dans un hash Redis  ingest:progress:state:<job_id>  (HINCRBY, partageable entre workers)
+#   - chaque mise à jour publiée sur   ingest:progress:<job_id>        (pub/sub -> SSE côté API)
+#   - copie dans job.meta["progress"] pour GET /jobs/{job_id}
+PROGRESS_CHANNEL_PREFIX = "ingest:progress:"
+PROGRESS_STATE_PREFIX = "ingest:progress:state:"
+PROGRESS_TTL_S = 24 * 3600
+PROGRESS_MIN_INTERVAL_S = 0.5
+TERMINAL_STATUSES = ("finished", "failed")
+
+COUNTERS = ("files_total", "files_read", "chunks_total", "chunks_embedded", "rows_inserted")
+
+def progress_channel(job_id: str) -> str:
+    return f"{PROGRESS_CHANNEL_PREFIX}{job_id}"
+
+def progress_state_key(job_id: str) -> str:
+    return f"{PROGRESS_STATE_PREFIX}{job_id}"
+
+def snapshot_from_hash(job_id: str, raw: Dict[Any, Any]) -> Optional[Dict[str, Any]]:
+    """Décode le hash Redis et calcule la fraction accomplie + ETA (secondes)."""
+    if not raw:
+        return None
+    h = {(k.decode() if isinstance(k, bytes) else k): (v.decode() if isinstance(v, bytes) else v)
+         for k, v in raw.items()}
+    snap: Dict[str, Any] = {"job_id": job_id, "status": h.get("status", "started"), "stage": h.get("stage")}
+    for c in COUNTERS:
+        snap[c] = int(h.get(c, 0) or 0)
+    started = float(h.get("started_at", 0) or 0)
+    updated = float(h.get("updated_at", 0) or started)
+    # Tant que tous les fichiers ne sont pas lus, le total de chunks est incomplet : on avance par fichiers
+    if snap["files_total"] and snap["files_read"] < snap["files_total"]:
+        fraction = snap["files_read"] / snap["files_total"]
+    elif snap["chunks_total"]:
+        fraction = snap["chunks_embedded"] / snap["chunks_total"]
+    else:
+        fraction = 1.0 if snap["status"] in TERMINAL_STATUSES else 0.0
+    if snap["status"] == "finished":
+        fraction = 1.0
+    elapsed = max(0.0, updated - started) if started else 0.0
+    snap["fraction"] = round(fraction, 4)
+    snap["elapsed_s"] = round(elapsed, 2)
+    snap["eta_s"] = round(elapsed * (1 - fraction) / fraction, 1) if 0 < fraction < 1 else (0.0 if fraction >= 1 else None)
+    if h.get("error"):
+        snap["error"] = h["error"]
+    return snap
+
+
+class ProgressReporter:
+    """
+    Reporter de progression pour un job RQ. Sans connexion Redis (appel hors worker), toutes
+    les méthodes sont des no-op : les fonctions d'ingestion restent appelables directement.
+    """
+
+    def __init__(self, job_id: Optional[str] = None, connection=None, job=None):
+        self.job = job
+        self.job_id = job_id or (job.id if job is not None else None)
+        self.conn = connection if connection is not None else (job.connection if job is not None else None)
+        self._last_publish = 0.0
+
+    @classmethod
+    def for_current_job(cls) -> "ProgressReporter":
+        job = get_current_job()
+        return cls(job=job) if job is not None else cls()
+
+    @property
+    def enabled(self) -> bool:
+        return self.conn is not None and self.job_id is not None
+
+    def start(self, stage: str = "started"):
+        if not self.enabled:
+            return
+        now = time.time()
+        key = progress_state_key(self.job_id)
+        pipe = self.conn.pipeline()
+        # Un retry RQ garde le même job_id : les compteurs repartent de zéro à chaque tentative
+        pipe.delete(key)
+        pipe.hset(key, mapping={"status": "started", "stage": stage, "started_at": now, "updated_at": now})
+        pipe.expire(key, PROGRESS_TTL_S)
+        pipe.execute()
+        self._publish(force=True)
+
+    def stage(self, stage: str):
+        if self.enabled:
+            self.conn.hset(progress_state_key(self.job_id), mapping={"stage": stage, "updated_at": time.time()})
+            self._publish(force=True)
+
+    def incr(self, **counters: int):
+        """Incrémente files_total/files_read/chunks_total/chunks_embedded/rows_inserted."""
+        if not self.enabled:
+            return
+        key = progress_state_key(self.job_id)
+        pipe = self.conn.pipeline()
+        for name, value in counters.items():
+            if value:
+                pipe.hincrby(key, name, int(value))
+        pipe.hset(key, "updated_at", time.time())
+        pipe.execute()
+        self._publish()
+
+    def finish(self, status: str = "finished", error: Optional[str] = None):
+        if not self.enabled:
+            return
+        mapping = {"status": status, "stage": status, "updated_at": time.time()}
+        if error:
+            mapping["error"] = error[:2000]
+        self.conn.hset(progress_state_key(self.job_id), mapping=mapping)
+        self._publish(force=True)
+
+    @contextmanager
+    def tracking(self, stage: str = "started", final: bool = True):
+        """
+        Publie 'started' puis 'finished', ou 'retrying' si RQ va rejouer le job (l'exception est propagée
+        à RQ ; l'échec définitif est publié par le callback on_failure, cf. ingestion_queue.failures).
+        final=False : le succès ne clôt pas la progression (job coordinateur dont un autre job termine le travail).
+        """
+        self.start(stage)
+        try:
+            yield self
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+            if self.job is not None and self.job.retries_left:
+                self.finish("retrying", error=error)
+            elif self.job is None or self.job.failure_callback is None:
+                self.finish("failed", error=error)
+            raise
+        if final:
+            self.finish("finished")
+
+    def snapshot(self) -> Optional[Dict[str, Any]]:
+        if not self.enabled:
+            return None
+        return snapshot_from_hash(self.job_id, self.conn.hgetall(progress_state_key(self.job_id)))
+
+    def _publish(self, force: bool = False):
+        now = time.monotonic()
+        if not force and now - self._last_publish < PROGRESS_MIN_INTERVAL_S:
+            return
+        self._last_publish = now
+        snap = self.snapshot()
+        if snap is None:
+            return
+        self.conn.publish(progress_channel(self.job_id), json.dumps(snap))
+        if self.job is not None and self.job.id == self.job_id:
+            self.job.meta["progress"] = snap
+            self.job.save_meta()
@@ -0,0 +1,70 @@
+import os
+from typing import Any, Callable, Dict, Optional, Tuple
+from rq import Queue
+from rq.job import Job
+from ingestion_queue.tasks import (
+    ingest_archive_job, ingest_pdf_job, ingest_image_job, ingest_single_file_job
+)
+from ingestion_queue.failures import retry_policy, on_ingest_failure
+
+# Files d'ingestion séparées par coût estimé : un gros job ne bloque jamais les petits uploads.
+# L'ordre (priorité décroissante) est celui attendu dans RQ_QUEUES côté worker.
+QUEUE_SMALL = "ingest-small"        # fichiers texte <= SMALL_TEXT_MAX_BYTES (latence interactive)
+QUEUE_IMAGE = "ingest-image"
+QUEUE_BULK = "ingest-bulk"          # gros fichiers texte (logs, dumps JSON, ...)
+QUEUE_ARCHIVE = "ingest-archive"
+QUEUE_OCR = "ingest-ocr"            # PDF (OCR)
+INGESTION_QUEUES = (QUEUE_SMALL, QUEUE_IMAGE, QUEUE_BULK, QUEUE_ARCHIVE, QUEUE_OCR)
+
+SMALL_TEXT_MAX_BYTES = int(os.getenv("INGEST_SMALL_TEXT_MAX_BYTES", str(2 * 1024 * 1024)))
+
+# Timeouts RQ par file (le défaut RQ de 180 s tue les gros archives/OCR)
+JOB_TIMEOUTS = {
+    QUEUE_SMALL: 600,
+    QUEUE_IMAGE: 900,
+    QUEUE_BULK: 3600,
+    QUEUE_ARCHIVE: 6 * 3600,
+    QUEUE_OCR: 2 * 3600,
+}
+
+# Retries par file : (nombre max, délai de base en s) ; backoff exponentiel avec jitter.
+# Les jobs OCR/images dépendent surtout des fournisseurs (429, 5xx) : plus de tentatives, plus espacées.
+RETRY_POLICIES = {
+    QUEUE_SMALL: (3, 10),
+    QUEUE_IMAGE: (3, 30),
+    QUEUE_BULK: (3, 30),
+    QUEUE_ARCHIVE: (2, 60),
+    QUEUE_OCR: (4, 60),
+}
+INGEST_RETRY_ENABLED = os.getenv("INGEST_RETRY_ENABLED", "1") == "1"
+
+ARCHIVE_EXTENSIONS = (".zip", ".jar", ".war", ".ear", ".tar.gz", ".tgz", ".tar")
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg")
+
+def route_upload(filename: str, size_bytes: int) -> Tuple[str, Callable]:
+    """Choisit (file, fonction de job) selon le type et la taille du fichier."""
+    fname = filename.lower()
+    if fname.endswith(ARCHIVE_EXTENSIONS):
+        return QUEUE_ARCHIVE, ingest_archive_job
+    if fname.endswith(".pdf"):
+        return QUEUE_OCR, ingest_pdf_job
+    if fname.endswith(IMAGE_EXTENSIONS):
+        return QUEUE_IMAGE, ingest_image_job
+    if size_bytes <= SMALL_TEXT_MAX_BYTES:
+        return QUEUE_SMALL, ingest_single_file_job
+    return QUEUE_BULK, ingest_single_file_job
+
+def job_options(queue_name: str, retry: bool = True) -> Dict[str, Any]:
+    """Options d'enqueue communes : timeout de la file, retry/backoff, callback d'échec (DLQ + compteurs)."""
+    opts: Dict[str, Any] = {"job_timeout": JOB_TIMEOUTS.get(queue_name, 600), "on_failure": on_ingest_failure}
+    max_retries, base_s = RETRY_POLICIES.get(queue_name, (0, 0))
+    policy = retry_policy(max_retries, base_s) if (retry and INGEST_RETRY_ENABLED) else None
+    if policy is not None:
+        opts["retry"] = policy
+    return opts
+
+def enqueue_upload(redis_conn, file_path: str, filename: str, size_bytes: int,
+                   upload_hash: Optional[str] = None, job_id: Optional[str] = None) -> Job:
+    queue_name, func = route_upload(filename, size_bytes)
+    q = Queue(queue_name, connection=redis_conn)
+    return q.enqueue(func, file_path, upload_hash=upload_hash, job_id=job_id, **job_options(queue_name))
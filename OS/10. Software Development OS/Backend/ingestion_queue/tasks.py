@@ -1,33 +1,159 @@
 import os
-from typing import Dict, Any
+from typing import Dict, Any, List, Optional
+from rq import Queue, get_current_job
+from rq.job import Job, Dependency
 from tools import (
-    read_supported_files_from, extract_archive, extract_nested_tars,
-    analyze_image_to_text_blob, ingest_pdf_with_ocr, store_in_pgvector
+    list_supported_files, read_supported_file, is_supported_file, extract_archive, extract_nested_tars,
+    process_image, link_image_document, ocr_pdf_to_markdown, store_in_pgvector, mark_upload_indexed,
+    mark_upload_unsupported, clear_checkpoints
 )
+from ingestion_queue.progress import ProgressReporter
 
-def ingest_archive_job(archive_path: str, extract_root: str = "Uploads/extracted") -> Dict[str, Any]:
-    base = os.path.splitext(os.path.basename(archive_path))[0]
-    extract_dir = os.path.join(extract_root, base)
-    extract_archive(archive_path, extract_dir)
-    extract_nested_tars(extract_dir)
-    files_content = read_supported_files_from(extract_dir)
-    store_in_pgvector(files_content)
-    return {"indexed": list(files_content.keys())}
-
-def ingest_pdf_job(pdf_path: str) -> Dict[str, Any]:
-    files_content = ingest_pdf_with_ocr(pdf_path)  # store_in_pgvector déjà appelé
-    return {"indexed": list(files_content.keys())}
-
-def ingest_image_job(image_path: str) -> Dict[str, Any]:
-    blob = analyze_image_to_text_blob(image_path)
-    files_content = {os.path.basename(image_path): blob}
-    store_in_pgvector(files_content)
-    return {"indexed": list(files_content.keys())}
-
-def ingest_single_file_job(file_path: str) -> Dict[str, Any]:
-    folder = os.path.dirname(file_path); name = os.path.basename(file_path)
-    all_map = read_supported_files_from(folder)
-    content = all_map.get(name)
-    files_content = {name: content} if content is not None else {}
-    store_in_pgvector(files_content)
-    return {"indexed": list(files_content.keys())}
+# Les checkpoints d'indexation sont rattachés à l'id du job RQ (conservé entre les retries)
+
+# Découpage des archives en sous-jobs (bornés en nombre de fichiers et en octets)
+ARCHIVE_BATCH_FILES = int(os.getenv("INGEST_ARCHIVE_BATCH_FILES", "32"))
+ARCHIVE_BATCH_BYTES = int(os.getenv("INGEST_ARCHIVE_BATCH_BYTES", str(8 * 1024 * 1024)))
+
+def batch_paths(paths: List[str], max_files: int = ARCHIVE_BATCH_FILES,
+                max_bytes: int = ARCHIVE_BATCH_BYTES) -> List[List[str]]:
+    batches: List[List[str]] = []
+    cur: List[str] = []; cur_bytes = 0
+    for p in paths:
+        size = os.path.getsize(p) if os.path.exists(p) else 0
+        if cur and (len(cur) >= max_files or cur_bytes + size > max_bytes):
+            batches.append(cur); cur, cur_bytes = [], 0
+        cur.append(p); cur_bytes += size
+    if cur:
+        batches.append(cur)
+    return batches
+
+def ingest_archive_job(archive_path: str, extract_root: str = "Uploads/extracted",
+                       upload_hash: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Coordinateur : extrait l'archive, répartit les fichiers en lots et enfile un sous-job par lot
+    (exécutés en parallèle par tous les workers), puis un job d'agrégation dépendant de tous les lots
+    qui produit le résultat final {"indexed": [...]} et le statut de l'upload.
+    Hors worker RQ (appel direct), les lots sont traités en séquence dans le process courant.
+    """
+    job = get_current_job()
+    progress = ProgressReporter.for_current_job()
+    with progress.tracking("extracting", final=False):
+        # Dossier d'extraction nommé par hash de contenu quand il est connu (pas de collision entre homonymes)
+        base = upload_hash or os.path.splitext(os.path.basename(archive_path))[0]
+        extract_dir = os.path.join(extract_root, base)
+        extract_archive(archive_path, extract_dir)
+        extract_nested_tars(extract_dir)
+        paths = list_supported_files(extract_dir)
+        batches = batch_paths(paths)
+        progress.incr(files_total=len(paths))
+
+        if job is None or not batches:
+            results = [ingest_files_batch_job(b, extract_dir) for b in batches]
+            return _aggregate(results, upload_hash, progress)
+
+        from ingestion_queue.routing import QUEUE_BULK, job_options
+        progress.stage("embedding")
+        # Les lots vont sur la file 'bulk' : écoutée par tous les workers non interactifs
+        q = Queue(QUEUE_BULK, connection=job.connection)
+        subs = [q.enqueue(ingest_files_batch_job, b, extract_dir, parent_job_id=job.id, **job_options(QUEUE_BULK))
+                for b in batches]
+        # Pas de retry sur l'agrégation : elle échoue seulement si un lot a épuisé ses tentatives
+        agg = Queue(job.origin, connection=job.connection).enqueue(
+            aggregate_archive_job, job.id, [s.id for s in subs], upload_hash=upload_hash,
+            depends_on=Dependency(jobs=subs, allow_failure=True), **job_options(job.origin, retry=False),
+        )
+        job.meta["sub_job_ids"] = [s.id for s in subs]
+        job.meta["aggregate_job_id"] = agg.id
+        job.save_meta()
+    return {"coordinator": True, "files": len(paths), "sub_jobs": len(subs), "aggregate_job_id": agg.id}
+
+def ingest_files_batch_job(paths: List[str], root: str, parent_job_id: Optional[str] = None) -> Dict[str, Any]:
+    """Sous-job : indexe un lot de fichiers extraits (clé = chemin relatif dans l'archive)."""
+    job = get_current_job()
+    if parent_job_id and job is not None:
+        # Compteurs partagés (HINCRBY) sur la progression du job coordinateur
+        progress = ProgressReporter(job_id=parent_job_id, connection=job.connection)
+    else:
+        progress = ProgressReporter()
+    files_content = {os.path.relpath(p, root): read_supported_file(p) for p in paths}
+    job_key = job.id if job is not None else None
+    doc_ids = store_in_pgvector(files_content, progress=progress, job_key=job_key)
+    clear_checkpoints(job_key)
+    return {"indexed": list(files_content.keys()), "document_ids": doc_ids}
+
+def aggregate_archive_job(parent_job_id: str, sub_job_ids: List[str],
+                          upload_hash: Optional[str] = None) -> Dict[str, Any]:
+    """Job dépendant de tous les lots : agrège les résultats et clôt la progression du coordinateur."""
+    conn = get_current_job().connection
+    progress = ProgressReporter(job_id=parent_job_id, connection=conn)
+    results, failed = [], []
+    for jid in sub_job_ids:
+        try:
+            sub = Job.fetch(jid, connection=conn)
+        except Exception:
+            sub = None
+        if sub is not None and sub.is_finished:
+            results.append(sub.result or {})
+        else:
+            failed.append(jid)
+    if failed:
+        progress.finish("failed", error=f"{len(failed)}/{len(sub_job_ids)} lots en échec : {', '.join(failed[:10])}")
+        raise RuntimeError(f"Ingestion d'archive incomplète : {len(failed)} lot(s) en échec")
+    return _aggregate(results, upload_hash, progress)
+
+def _aggregate(results: List[Dict[str, Any]], upload_hash: Optional[str], progress: ProgressReporter) -> Dict[str, Any]:
+    indexed = [name for r in results for name in r.get("indexed", [])]
+    doc_ids = [d for r in results for d in r.get("document_ids", [])]
+    if indexed or doc_ids:
+        mark_upload_indexed(upload_hash, doc_ids)
+    else:
+        mark_upload_unsupported(upload_hash)  # archive sans aucun fichier supporté
+    progress.finish("finished")
+    return {"indexed": indexed, "document_ids": doc_ids}
+
+def ingest_pdf_job(pdf_path: str, upload_hash: Optional[str] = None) -> Dict[str, Any]:
+    progress = ProgressReporter.for_current_job()
+    with progress.tracking("ocr"):
+        progress.incr(files_total=1)
+        md = ocr_pdf_to_markdown(pdf_path)
+        files_content = {f"{os.path.splitext(os.path.basename(pdf_path))[0]}.md": md}
+        progress.stage("embedding")
+        doc_ids = store_in_pgvector(files_content, progress=progress, job_key=progress.job_id)
+        mark_upload_indexed(upload_hash, doc_ids)
+        clear_checkpoints(progress.job_id)
+    return {"indexed": list(files_content.keys()), "document_ids": doc_ids}
+
+def ingest_image_job(image_path: str, upload_hash: Optional[str] = None) -> Dict[str, Any]:
+    """Seuls les métadonnées/OCR sont embeddés ; un quasi-doublon réutilise le document existant."""
+    progress = ProgressReporter.for_current_job()
+    with progress.tracking("analyzing"):
+        progress.incr(files_total=1)
+        info = process_image(image_path, upload_hash)
+        if info["duplicate_of"]:
+            progress.incr(files_read=1)
+            mark_upload_indexed(upload_hash, [info["document_id"]])
+            return {"indexed": [], "document_ids": [info["document_id"]], "duplicate_of": info["duplicate_of"]}
+        files_content = {os.path.basename(image_path): info["text"]}
+        progress.stage("embedding")
+        doc_ids = store_in_pgvector(files_content, progress=progress, job_key=progress.job_id)
+        if doc_ids:
+            link_image_document(info["sha256"], doc_ids[0])
+        mark_upload_indexed(upload_hash, doc_ids)
+        clear_checkpoints(progress.job_id)
+    return {"indexed": list(files_content.keys()), "document_ids": doc_ids}
+
+def ingest_single_file_job(file_path: str, upload_hash: Optional[str] = None) -> Dict[str, Any]:
+    progress = ProgressReporter.for_current_job()
+    with progress.tracking("reading"):
+        name = os.path.basename(file_path)
+        if not is_supported_file(name):
+            mark_upload_unsupported(upload_hash)
+            return {"indexed": [], "document_ids": [], "unsupported": [name]}
+        files_content = {name: read_supported_file(file_path)}
+        progress.incr(files_total=len(files_content))
+        progress.stage("embedding")
+        doc_ids = store_in_pgvector(files_content, progress=progress, job_key=progress.job_id)
+        mark_upload_indexed(upload_hash, doc_ids)
+        clear_checkpoints(progress.job_id)
+    return {"indexed": list(files_content.keys()), "document_ids": doc_ids}
@@ -0,0 +1,218 @@
+# keyword_index.py — statistiques lexicales du corpus (TF-IDF / BM25) pour le tagging et la recherche
+#
+# Tables :
+#   document_terms : une ligne par document complet, termes et fréquences en tableaux parallèles
+#                    (KEYWORD_MAX_TERMS_PER_DOC termes max), longueur du document en tokens
+#   term_stats     : df (nb de documents contenant le terme) et cf (occurrences dans le corpus)
+#   keyword_corpus : nb de documents et longueur cumulée (avgdl BM25)
+# Mise à jour incrémentale à la fin de l'ingestion d'un document (même transaction) ; la suppression
+# d'un document (ON DELETE CASCADE) décrémente les stats par trigger. Sans dépendance à tools :
+# toutes les fonctions prennent un curseur.
+import os, re, math
+from collections import Counter
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+KEYWORD_INDEX_ENABLED = os.getenv("KEYWORD_INDEX_ENABLED", "1") == "1"
+KEYWORD_MAX_TERMS_PER_DOC = int(os.getenv("KEYWORD_MAX_TERMS_PER_DOC", "1000"))
+KEYWORD_BM25_K1 = float(os.getenv("KEYWORD_BM25_K1", "1.2"))
+KEYWORD_BM25_B = float(os.getenv("KEYWORD_BM25_B", "0.75"))
+# Documents déjà indexés avant l'activation : rattrapés par lots lors du nettoyage de maintenance
+KEYWORD_BACKFILL_BATCH = int(os.getenv("KEYWORD_BACKFILL_BATCH", "200"))
+KEYWORD_SEARCH_MAX_CANDIDATES = int(os.getenv("KEYWORD_SEARCH_MAX_CANDIDATES", "2000"))
+CORPUS_SCOPE = "documents"
+
+_TOKEN_RE = re.compile(r"[^\W\d_][\w\-]{2,39}", re.UNICODE)
+STOP_WORDS = frozenset("""
+the and for are but not you all any can had her was one our out has have him his how its let may new now
+old see two way who did get got use used using with this that from they them then than there their these
+those what when where which while will would could should into onto over under about above after before
+again also been being both each few more most other some such only own same very just too does doing
+here your yours ours were is it of to in on at by be as or an if no so do we he she me my
+les des aux une un et ou de la le du en au ce ces cet cette dans par pour sur avec sans sous entre vers chez
+est sont été etre être avoir ont fait faire plus moins tout tous toute toutes mais donc car comme ainsi
+aussi alors leur leurs nous vous ils elles elle lui son sa ses mon ma mes ton ta tes notre votre qui que
+quoi dont quand pas peu très bien non oui même cela ceci celle celui ceux été sera seront était
+true false null none http https www com
+""".split())
+
+
+def tokenize(text: str) -> List[str]:
+    """Mots en minuscules (3 à 40 caractères, commençant par une lettre), hors stop-words FR/EN."""
+    return [t for t in (m.lower() for m in _TOKEN_RE.findall(text or "")) if t not in STOP_WORDS]
+
+def term_counts(text: str) -> Tuple[Counter, int]:
+    """(fréquences des termes, longueur du document en tokens)."""
+    tokens = tokenize(text)
+    return Counter(tokens), len(tokens)
+
+
+# ---------- DDL ----------
+def init_keyword_index(cur):
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS term_stats (
+            term TEXT PRIMARY KEY,
+            df INTEGER NOT NULL DEFAULT 0,
+            cf BIGINT NOT NULL DEFAULT 0
+        );
+    """)
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS document_terms (
+            document_id INTEGER PRIMARY KEY REFERENCES documents(id) ON DELETE CASCADE,
+            length INTEGER NOT NULL,
+            terms TEXT[] NOT NULL,
+            tfs INTEGER[] NOT NULL
+        );
+    """)
+    # Recherche lexicale : documents candidats via terms && termes de la requête
+    cur.execute("CREATE INDEX IF NOT EXISTS document_terms_terms_gin ON document_terms USING GIN (terms);")
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS keyword_corpus (
+            scope TEXT PRIMARY KEY,
+            docs BIGINT NOT NULL DEFAULT 0,
+            total_length BIGINT NOT NULL DEFAULT 0
+        );
+    """)
+    cur.execute("""
+        CREATE OR REPLACE FUNCTION document_terms_forget() RETURNS trigger AS $$
+        BEGIN
+            UPDATE term_stats s SET df = s.df - 1, cf = s.cf - t.tf
+            FROM unnest(OLD.terms, OLD.tfs) AS t(term, tf) WHERE s.term = t.term;
+            UPDATE keyword_corpus SET docs = docs - 1, total_length = total_length - OLD.length
+            WHERE scope = 'documents';
+            RETURN OLD;
+        END $$ LANGUAGE plpgsql;
+    """)
+    cur.execute("DROP TRIGGER IF EXISTS document_terms_forget ON document_terms;")
+    cur.execute("""
+        CREATE TRIGGER document_terms_forget AFTER DELETE ON document_terms
+        FOR EACH ROW EXECUTE FUNCTION document_terms_forget();
+    """)
+
+
+# ---------- Mise à jour ----------
+def index_document_terms(cur, document_id: int, text: str) -> bool:
+    """
+    Enregistre les termes d'un document et incrémente df/cf et le corpus. Idempotent : un document
+    déjà présent n'est pas recompté (le contenu d'un document est immuable, clé content_hash).
+    """
+    counts, length = term_counts(text)
+    top = sorted(counts.most_common(KEYWORD_MAX_TERMS_PER_DOC))  # tri par terme : ordre de verrouillage stable
+    terms, tfs = [t for t, _ in top], [n for _, n in top]
+    cur.execute("""
+        INSERT INTO document_terms (document_id, length, terms, tfs) VALUES (%s, %s, %s, %s)
+        ON CONFLICT (document_id) DO NOTHING RETURNING document_id;
+    """, (document_id, length, terms, tfs))
+    if cur.fetchone() is None:
+        return False
+    if terms:
+        # Termes triés : deux workers qui indexent en parallèle verrouillent les lignes dans le même ordre
+        cur.execute("""
+            INSERT INTO term_stats (term, df, cf)
+            SELECT t.term, 1, t.tf FROM unnest(%s::text[], %s::bigint[]) AS t(term, tf) ORDER BY t.term
+            ON CONFLICT (term) DO UPDATE SET df = term_stats.df + 1, cf = term_stats.cf + EXCLUDED.cf;
+        """, (terms, tfs))
+    cur.execute("""
+        INSERT INTO keyword_corpus (scope, docs, total_length) VALUES (%s, 1, %s)
+        ON CONFLICT (scope) DO UPDATE SET docs = keyword_corpus.docs + 1,
+                                          total_length = keyword_corpus.total_length + EXCLUDED.total_length;
+    """, (CORPUS_SCOPE, length))
+    return True
+
+def backfill_keyword_index(cur, limit: int = KEYWORD_BACKFILL_BATCH) -> int:
+    """Indexe jusqu'à `limit` documents complets sans termes (antérieurs à l'index ou en échec)."""
+    cur.execute("""
+        SELECT d.id, d.content FROM documents d
+        WHERE d.status = 'complete' AND NOT EXISTS (SELECT 1 FROM document_terms t WHERE t.document_id = d.id)
+        ORDER BY d.id LIMIT %s;
+    """, (limit,))
+    return sum(1 for doc_id, content in cur.fetchall() if index_document_terms(cur, doc_id, content or ""))
+
+def prune_term_stats(cur) -> int:
+    """Termes qui ne figurent plus dans aucun document (df retombé à 0 après suppressions)."""
+    cur.execute("DELETE FROM term_stats WHERE df <= 0;")
+    return cur.rowcount
+
+
+# ---------- Scores ----------
+def corpus_stats(cur) -> Tuple[int, float]:
+    """(nombre de documents, longueur moyenne en tokens)."""
+    cur.execute("SELECT docs, total_length FROM keyword_corpus WHERE scope=%s;", (CORPUS_SCOPE,))
+    row = cur.fetchone()
+    if not row or not row[0]:
+        return 0, 0.0
+    return int(row[0]), row[1] / row[0]
+
+def document_frequencies(cur, terms: Iterable[str]) -> Dict[str, int]:
+    terms = list(terms)
+    if not terms:
+        return {}
+    cur.execute("SELECT term, df FROM term_stats WHERE term = ANY(%s);", (terms,))
+    return {t: int(df) for t, df in cur.fetchall()}
+
+def bm25_idf(df: int, n_docs: int) -> float:
+    return math.log(1 + (n_docs - df + 0.5) / (df + 0.5))
+
+def bm25_weight(tf: int, df: int, n_docs: int, length: int, avgdl: float,
+                k1: float = KEYWORD_BM25_K1, b: float = KEYWORD_BM25_B) -> float:
+    norm = 1 - b + b * (length / avgdl if avgdl else 1.0)
+    return bm25_idf(df, n_docs) * tf * (k1 + 1) / (tf + k1 * norm)
+
+def weighted_terms(cur, counts: Dict[str, int], length: int, top: int = 15) -> List[Tuple[str, float]]:
+    """Termes d'un texte pondérés BM25 contre les statistiques du corpus (un aller-retour SQL + corpus)."""
+    n_docs, avgdl = corpus_stats(cur)
+    dfs = document_frequencies(cur, counts)
+    scored = [(t, bm25_weight(tf, dfs.get(t, 0), n_docs, length, avgdl)) for t, tf in counts.items()]
+    scored.sort(key=lambda x: (-x[1], x[0]))
+    return [(t, round(w, 4)) for t, w in scored[:top]]
+
+def text_tags(cur, text: str, top: int = 15) -> List[Tuple[str, float]]:
+    counts, length = term_counts(text)
+    return weighted_terms(cur, counts, length, top)
+
+def document_tags(cur, document_id: int, top: int = 15) -> List[Tuple[str, float]]:
+    """Tags BM25 d'un document indexé, depuis ses termes stockés (pas de relecture du contenu)."""
+    cur.execute("SELECT length, terms, tfs FROM document_terms WHERE document_id=%s;", (document_id,))
+    row = cur.fetchone()
+    if not row:
+        return []
+    return weighted_terms(cur, dict(zip(row[1], row[2])), row[0], top)
+
+def lexical_search(cur, query: str, top_k: int = 8) -> List[Dict[str, Any]]:
+    """
+    Recherche BM25 : candidats via l'index GIN (terms && termes de la requête), classés en SQL par
+    la somme des idf des termes de la requête qu'ils contiennent (termes rares d'abord) et bornés à
+    KEYWORD_SEARCH_MAX_CANDIDATES ; score BM25 complet calculé sur les fréquences stockées.
+    Approximation : un document hors de la borne ne peut dépasser les candidats que par tf / longueur.
+    """
+    q_terms = sorted(set(tokenize(query)))
+    if not q_terms:
+        return []
+    n_docs, avgdl = corpus_stats(cur)
+    dfs = document_frequencies(cur, q_terms)
+    q_terms = [t for t in q_terms if dfs.get(t)]  # terme absent du corpus : aucun candidat
+    if not q_terms:
+        return []
+    idfs = [bm25_idf(dfs[t], n_docs) for t in q_terms]
+    cur.execute("""
+        WITH q AS (SELECT * FROM unnest(%s::text[], %s::float8[]) AS q(term, idf))
+        SELECT c.document_id, c.filename, c.length, t.term, t.tf
+        FROM (
+            SELECT dt.document_id, d.filename, dt.length, dt.terms, dt.tfs
+            FROM document_terms dt
+            JOIN documents d ON d.id = dt.document_id AND d.status = 'complete'
+            WHERE dt.terms && %s
+            ORDER BY (SELECT sum(q.idf) FROM q WHERE q.term = ANY(dt.terms)) DESC, dt.document_id
+            LIMIT %s
+        ) c
+        CROSS JOIN LATERAL unnest(c.terms, c.tfs) AS t(term, tf)
+        WHERE t.term = ANY(%s);
+    """, (q_terms, idfs, q_terms, KEYWORD_SEARCH_MAX_CANDIDATES, q_terms))
+    docs: Dict[int, Dict[str, Any]] = {}
+    for doc_id, filename, length, term, tf in cur.fetchall():
+        d = docs.setdefault(doc_id, {"document_id": doc_id, "filename": filename, "score": 0.0, "matched": []})
+        d["score"] += bm25_weight(tf, dfs.get(term, 0), n_docs, length, avgdl)
+        d["matched"].append(term)
+    ranked = sorted(docs.values(), key=lambda d: -d["score"])[:top_k]
+    for d in ranked:
+        d["score"] = round(d["score"], 4)
+    return ranked
@@ -1,16 +1,31 @@
-import os, shutil, redis, psycopg2,uvicorn
+import os, uuid, json, time, hashlib, inspect, traceback, redis, psycopg2,uvicorn
+import redis.asyncio as aioredis
 from psycopg2.extras import RealDictCursor
-from typing import Optional
+from typing import Any, Dict, Optional
 from datetime import datetime, timezone
-from rq import Queue
 from fastapi import FastAPI, UploadFile, File, HTTPException, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse, FileResponse
 from pydantic import BaseModel
 from contextlib import asynccontextmanager
 from managers_registry import MANAGER_BY_MODULE
+from connector_tools import SIDE_EFFECT_TOOLS
 from fastapi.middleware.cors import CORSMiddleware
-from tools import UPLOAD_DIR, init_pgvector, KnowledgeBase
-from ingestion_queue.tasks import (
-    ingest_archive_job, ingest_pdf_job, ingest_image_job, ingest_single_file_job
+from tools import (
+    UPLOAD_DIR, init_pgvector, KnowledgeBase, content_addressed_path, get_upload, claim_upload,
+    get_pg_connection, search_lexical
+)
+import response_cache
+from rate_limiter import embedding_limiter
+from agent_tools import PARSE_CACHE
+from chat_memory import init_chat_state_table, load_chat_state, render_chat_context, record_turn
+from ingestion_queue.routing import enqueue_upload
+from ingestion_queue.failures import (
+    DeadLetterRequeueError, list_dead_letters, requeue_dead_letter, failure_stats
+)
+from ingestion_queue.maintenance import maintenance_reports
+from ingestion_queue.progress import (
+    TERMINAL_STATUSES, progress_channel, progress_state_key, snapshot_from_hash
 )
 
 # ---------- Config DB (même instance que pgvector) ----------
@@ -55,9 +70,14 @@ def init_chat_tables():
             role TEXT NOT NULL,         -- 'user' | 'assistant'
             content TEXT NOT NULL,
             agent_key TEXT,
+            status TEXT NOT NULL DEFAULT 'complete',  -- 'pending' | 'complete' | 'error'
             created_at TIMESTAMPTZ DEFAULT NOW()
         );
     """)
+    # Bases existantes : colonne de statut des tours en cours
+    cur.execute("ALTER TABLE messages ADD COLUMN IF NOT EXISTS status TEXT NOT NULL DEFAULT 'complete';")
+    # Contexte borné par chat (résumé + derniers tours)
+    init_chat_state_table(cur)
     conn.commit(); cur.close(); conn.close()
 
 # ---------- Lifespan (startup/shutdown) ----------
@@ -70,9 +90,9 @@ async def lifespan(app: FastAPI):
     # Tables vecteur (documents, chunks) + tables de chat
     init_pgvector()
     init_chat_tables()
-    # Redis / RQ attachés au state de l'app
+    response_cache.init_response_cache()
+    # Redis attaché au state de l'app (les files RQ sont choisies par ingestion_queue.routing)
     app.state.redis_conn = redis.from_url(REDIS_URL)
-    app.state.q = Queue("ingestion", connection=app.state.redis_conn)
     yield
     # (shutdown) rien à fermer ici
 
@@ -89,44 +109,104 @@ app.add_middleware(
 )
 
 # ---------- Hook routeur d'agent (sans branchement de managers pour l'instant) ----------
+NO_CONTEXT_REPLY = ("Je n'ai pas assez de contexte indexé pour répondre. "
+                    "Uploade des fichiers pertinents dans ce module, puis réessaie.")
+# Contenu visible en cas d'échec de l'agent ; le détail de l'exception va dans les logs du serveur
+GENERATION_ERROR_REPLY = "Erreur lors de la génération de la réponse. Réessaie dans un instant."
+
+def _accepts_history(handler) -> bool:
+    """Le handler prend-il un argument nommé history (ou **kwargs) ?"""
+    try:
+        params = inspect.signature(handler).parameters.values()
+    except (TypeError, ValueError):
+        return False
+    return any(p.kind is p.VAR_KEYWORD or (p.name == "history" and p.kind is not p.POSITIONAL_ONLY)
+               for p in params)
+
 class AgentRouter:
     """
     Tu enregistreras plus tard tes Team Managers avec:
       AgentRouter.register("code-quality", ton_handler)
     Ici, aucun handler n'est branché -> fallback KB-only.
+
+    Un cache sémantique (response_cache) est consulté avant le handler : même module,
+    même version d'index de connaissance, question d'embedding suffisamment proche.
+    Les modules dont les outils ont des effets de bord s'enregistrent avec cacheable=False.
+    Le contexte conversationnel n'est passé (history=...) qu'aux handlers qui l'acceptent :
+    un handler historique handler(module_key, chat_id, user_text, kb) reste valide.
     """
     _handlers = {}
+    _uncacheable = set()
+    _with_history = set()
 
     @classmethod
-    def register(cls, module_key: str, handler):
+    def register(cls, module_key: str, handler, cacheable: bool = True):
         cls._handlers[module_key] = handler
+        if cacheable:
+            cls._uncacheable.discard(module_key)
+        else:
+            cls._uncacheable.add(module_key)
+        if _accepts_history(handler):
+            cls._with_history.add(module_key)
+        else:
+            cls._with_history.discard(module_key)
 
     @classmethod
-    def handle(cls, module_key: str, chat_id: int, user_text: str, kb: KnowledgeBase) -> str:
+    def handle(cls, module_key: str, chat_id: int, user_text: str, kb: KnowledgeBase,
+               history: str = "", use_cache: bool = True) -> str:
+        if not (use_cache and module_key not in cls._uncacheable and response_cache.is_cacheable(module_key, history)):
+            response_cache.bypass(module_key)
+            return cls._dispatch(module_key, chat_id, user_text, kb, history)
+
+        probe = response_cache.lookup(module_key, user_text)
+        if probe is not None and probe.answer is not None:
+            return probe.answer
+        answer = cls._dispatch(module_key, chat_id, user_text, kb, history)
+        if probe is not None and answer != NO_CONTEXT_REPLY:
+            response_cache.store(probe, answer)
+        return answer
+
+    @classmethod
+    def _dispatch(cls, module_key: str, chat_id: int, user_text: str, kb: KnowledgeBase, history: str) -> str:
         h = cls._handlers.get(module_key)
         if h:
+            if module_key in cls._with_history:
+                return h(module_key, chat_id, user_text, kb, history=history)
             return h(module_key, chat_id, user_text, kb)
         # Fallback: réponse basée uniquement sur la KB
         context = kb.context_text(user_text)
         if not context:
-            return ("Je n'ai pas assez de contexte indexé pour répondre. "
-                    "Uploade des fichiers pertinents dans ce module, puis réessaie.")
+            return NO_CONTEXT_REPLY
         return f"Contexte pertinent trouvé :\n\n{context}\n\n(Réponse générée en mode KB-only.)"
 
 
 def _make_handler(team):
     # Appelle le manager agno et renvoie sa réponse textuelle
-    def _h(module_key: str, chat_id: int, user_text: str, kb):
+    def _h(module_key: str, chat_id: int, user_text: str, kb, history: str = ""):
+        # Contexte conversationnel borné (résumé + derniers tours), taille indépendante de la longueur du chat
+        prompt = f"{history}\n\nQuestion actuelle :\n{user_text}" if history else user_text
         try:
-            resp = team.run(user_text)
+            resp = team.run(prompt)
         except AttributeError:
-            resp = team.chat(user_text)
+            resp = team.chat(prompt)
         return getattr(resp, "content", None) or str(resp)
     return _h
 
-# Enregistrement: clé de module -> handler
+def _tool_names(team) -> set:
+    """Noms des outils d'une équipe agno et de ses membres (récursif)."""
+    names = set()
+    for tool in getattr(team, "tools", None) or ():
+        name = getattr(tool, "__name__", None) or getattr(tool, "name", None)
+        if name:
+            names.add(name)
+    for member in getattr(team, "members", None) or ():
+        names |= _tool_names(member)
+    return names
+
+# Enregistrement: clé de module -> handler ; pas de cache pour les équipes qui ont des outils à effets de bord
 for _module_key, _team in MANAGER_BY_MODULE.items():
-    AgentRouter.register(_module_key, _make_handler(_team))
+    AgentRouter.register(_module_key, _make_handler(_team),
+                         cacheable=not (_tool_names(_team) & SIDE_EFFECT_TOOLS))
 
 
 # ---------- Schémas Pydantic ----------
@@ -136,6 +216,7 @@ class NewChat(BaseModel):
 class NewMessage(BaseModel):
     text: str
     agent_key: Optional[str] = None  # réservé pour plus tard
+    use_cache: bool = True           # False pour forcer l'exécution (requêtes à effets de bord)
 
 class UploadMeta(BaseModel):
     pass  # placeholder si tu ajoutes tenant/tags/module ensuite
@@ -185,7 +266,7 @@ def get_messages(chat_id: int, limit: int = 100, offset: int = 0):
         raise HTTPException(status_code=404, detail="Chat introuvable")
 
     cur.execute("""
-        SELECT id, role, content, agent_key, created_at
+        SELECT id, role, content, agent_key, status, created_at
         FROM messages
         WHERE chat_id=%s
         ORDER BY created_at ASC
@@ -196,10 +277,20 @@ def get_messages(chat_id: int, limit: int = 100, offset: int = 0):
 
 @app.post("/chats/{chat_id}/messages")
 def post_message(chat_id: int, body: NewMessage):
+    """
+    Trois phases pour ne jamais garder de connexion/transaction ouverte pendant l'appel LLM :
+      1) transaction courte : message utilisateur + réponse assistant 'pending', commit immédiat ;
+      2) exécution de l'agent, sans connexion Postgres ;
+      3) nouvelle transaction courte : contenu final + statut 'complete' (ou 'error'),
+         et mise à jour de chat_state (résumé + derniers tours).
+    L'historique vient uniquement de chat_state : `messages` n'est jamais relu sur ce chemin.
+    Une réponse restée 'pending' (processus tué en phase 2) est passée en 'error' par la maintenance.
+    """
     user_text = (body.text or "").strip()
     if not user_text:
         raise HTTPException(status_code=400, detail="Message vide")
 
+    # 1) Enregistrer le tour (visible immédiatement par les autres lecteurs)
     conn = db_conn(); cur = conn.cursor()
     cur.execute("SELECT id, module_key FROM chats WHERE id=%s;", (chat_id,))
     chat = cur.fetchone()
@@ -208,70 +299,294 @@ def post_message(chat_id: int, body: NewMessage):
         raise HTTPException(status_code=404, detail="Chat introuvable")
 
     module_key = chat["module_key"]
-
-    # Enregistrer le message utilisateur
+    history = render_chat_context(load_chat_state(cur, chat_id))
     cur.execute(
         "INSERT INTO messages (chat_id, role, content, agent_key) VALUES (%s, %s, %s, %s) RETURNING id, created_at;",
         (chat_id, "user", user_text, None)
     )
     user_msg = cur.fetchone()
+    cur.execute(
+        "INSERT INTO messages (chat_id, role, content, agent_key, status) VALUES (%s, %s, %s, %s, %s) RETURNING id, created_at;",
+        (chat_id, "assistant", "", body.agent_key, "pending")
+    )
+    asst_msg = cur.fetchone()
+    conn.commit(); cur.close(); conn.close()
 
-    # Appeler le routeur (aucun manager branché => fallback KB-only)
+    # 2) Appeler le routeur (connexion relâchée pendant la retrieval + LLM)
     kb = KnowledgeBase(top_k=8)
-    assistant_text = AgentRouter.handle(module_key, chat_id, user_text, kb)
+    try:
+        assistant_text = AgentRouter.handle(module_key, chat_id, user_text, kb, history=history,
+                                            use_cache=body.use_cache)
+        status = "complete"
+    except Exception as e:
+        print(f"❌ chat {chat_id} / message {asst_msg['id']}: génération échouée ({type(e).__name__}: {e})")
+        traceback.print_exc()
+        assistant_text = GENERATION_ERROR_REPLY
+        status = "error"
 
-    # Enregistrer la réponse assistant
+    # 3) Persister la réponse dans une nouvelle transaction courte
+    conn = db_conn(); cur = conn.cursor()
     cur.execute(
-        "INSERT INTO messages (chat_id, role, content, agent_key) VALUES (%s, %s, %s, %s) RETURNING id, created_at;",
-        (chat_id, "assistant", assistant_text, body.agent_key)
+        "UPDATE messages SET content=%s, status=%s WHERE id=%s;",
+        (assistant_text, status, asst_msg["id"])
     )
-    asst_msg = cur.fetchone()
-
+    if status == "complete":
+        record_turn(cur, chat_id, user_text, assistant_text)
     conn.commit(); cur.close(); conn.close()
+
+    if status == "error":
+        raise HTTPException(status_code=502, detail=assistant_text)
     return {
         "user_message": {"id": user_msg["id"], "created_at": user_msg["created_at"], "content": user_text},
-        "assistant_message": {"id": asst_msg["id"], "created_at": asst_msg["created_at"], "content": assistant_text},
+        "assistant_message": {"id": asst_msg["id"], "created_at": asst_msg["created_at"],
+                              "content": assistant_text, "status": status},
     }
 
 # ---------- Upload + Jobs d’ingestion (asynchrone via RQ) ----------
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+UPLOAD_TMP_DIR = os.path.join(UPLOAD_DIR, ".tmp")
+
+# Ligne 'pending' dont le job n'est pas (encore) dans Redis : réservée par un upload concurrent
+# qui n'a pas fini d'enfiler, sauf si elle n'a pas bougé depuis ce délai
+UPLOAD_CLAIM_GRACE_S = float(os.getenv("UPLOAD_CLAIM_GRACE_S", "300"))
+
+def _dead_pending_job(redis_conn, upload: Dict[str, Any]) -> bool:
+    """Upload 'pending' dont le job a échoué / a été arrêté, ou a disparu de Redis depuis longtemps."""
+    from rq.job import Job
+    try:
+        job = Job.fetch(upload["job_id"], connection=redis_conn) if upload["job_id"] else None
+    except Exception:
+        job = None
+    if job is None:
+        return upload["age_s"] > UPLOAD_CLAIM_GRACE_S
+    return job.is_failed or job.is_stopped or job.is_canceled
+
 @app.post("/upload")
 async def upload(request: Request, file: UploadFile = File(...), meta: UploadMeta = UploadMeta()):
     """
-    Sauvegarde le fichier dans Uploads/ puis enfile un job d'ingestion selon l'extension.
+    Écrit le fichier par blocs (sans bloquer la boucle d'événements) en calculant son sha256,
+    le range sous Uploads/<ab>/<sha256>/<nom> puis enfile un job d'ingestion sur la file adaptée.
+    Si ce contenu est déjà indexé, aucun job n'est créé : on renvoie les ids de documents existants.
     L'UI du module courant peut appeler cet endpoint.
     """
-    file_path = os.path.join(UPLOAD_DIR, file.filename)
-    with open(file_path, "wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
-
-    fname = file.filename.lower()
-    q: Queue = request.app.state.q
-    if fname.endswith((".zip", ".jar", ".war", ".ear", ".tar.gz", ".tgz", ".tar")):
-        job = q.enqueue(ingest_archive_job, file_path)
-    elif fname.endswith(".pdf"):
-        job = q.enqueue(ingest_pdf_job, file_path)
-    elif fname.endswith((".png", ".jpg", ".jpeg")):
-        job = q.enqueue(ingest_image_job, file_path)
-    else:
-        job = q.enqueue(ingest_single_file_job, file_path)
-
-    return {"message": f"{file.filename} reçu, ingestion en cours", "job_id": job.get_id()}
+    filename = os.path.basename(file.filename or "") or "upload.bin"
+    await run_in_threadpool(os.makedirs, UPLOAD_TMP_DIR, exist_ok=True)
+    tmp_path = os.path.join(UPLOAD_TMP_DIR, uuid.uuid4().hex)
+    digest, size = hashlib.sha256(), 0
+    buffer = await run_in_threadpool(open, tmp_path, "wb")
+    try:
+        while True:
+            chunk = await file.read(UPLOAD_CHUNK_SIZE)
+            if not chunk:
+                break
+            digest.update(chunk); size += len(chunk)
+            await run_in_threadpool(buffer.write, chunk)
+    except Exception:
+        await run_in_threadpool(buffer.close)
+        await run_in_threadpool(os.remove, tmp_path)
+        raise
+    await run_in_threadpool(buffer.close)
+    sha256 = digest.hexdigest()
+
+    # Déduplication : contenu déjà indexé (ou ingestion en cours) -> pas de nouveau job.
+    # La ligne uploads est réservée atomiquement : deux uploads simultanés du même contenu,
+    # un seul enfile l'ingestion.
+    redis_conn = request.app.state.redis_conn
+    file_path = content_addressed_path(sha256, filename)
+    job_id = uuid.uuid4().hex
+    won = await run_in_threadpool(claim_upload, sha256, filename, file_path, size, job_id)
+    existing = None if won else await run_in_threadpool(get_upload, sha256)
+    if existing and existing["status"] == "pending" \
+            and await run_in_threadpool(_dead_pending_job, redis_conn, existing):
+        # Job mort sans avoir marqué l'upload (worker tué) : reprise, si personne ne l'a déjà reprise
+        won = await run_in_threadpool(claim_upload, sha256, filename, file_path, size, job_id,
+                                      existing["job_id"])
+        if not won:
+            existing = await run_in_threadpool(get_upload, sha256)
+    if not won:
+        await run_in_threadpool(os.remove, tmp_path)
+        if existing and existing["status"] == "indexed":
+            return {"message": f"{filename} déjà indexé", "job_id": None, "sha256": sha256,
+                    "deduplicated": True, "document_ids": existing["document_ids"]}
+        return {"message": f"{filename} déjà en cours d'ingestion", "job_id": existing and existing["job_id"],
+                "sha256": sha256, "deduplicated": True}
+
+    await run_in_threadpool(os.makedirs, os.path.dirname(file_path), exist_ok=True)
+    await run_in_threadpool(os.replace, tmp_path, file_path)
+
+    # File RQ choisie selon le type et la taille (petits textes / images / gros textes / archives / OCR) ;
+    # ligne déjà enregistrée : le job peut se terminer avant le retour de cet endpoint
+    job = await run_in_threadpool(enqueue_upload, redis_conn, file_path, filename, size,
+                                  upload_hash=sha256, job_id=job_id)
+
+    return {"message": f"{filename} reçu, ingestion en cours", "job_id": job.get_id(),
+            "sha256": sha256, "deduplicated": False}
+
+SSE_MAX_JOBS = 100
+SSE_HEARTBEAT_S = 15.0
+
+def _sse(data: Dict[str, Any], event: str = "progress") -> str:
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+def _effective_job(job, redis_conn):
+    """Pour un coordinateur d'archive, le statut final est celui de son job d'agrégation."""
+    from rq.job import Job
+    agg_id = job.meta.get("aggregate_job_id")
+    if not agg_id or not job.is_finished:
+        return job
+    try:
+        return Job.fetch(agg_id, connection=redis_conn)
+    except Exception:
+        return job
+
+def _rq_terminal_snapshot(redis_conn, job_id: str) -> Optional[Dict[str, Any]]:
+    """Statut RQ pour un job qui n'a rien publié (introuvable, ou worker mort avant la fin)."""
+    from rq.job import Job
+    try:
+        job = _effective_job(Job.fetch(job_id, connection=redis_conn), redis_conn)
+    except Exception:
+        return {"job_id": job_id, "status": "not_found"}
+    status = job.get_status()
+    if job.is_finished or job.is_failed or job.is_stopped or job.is_canceled:
+        return {"job_id": job_id, "status": "finished" if job.is_finished else "failed", "rq_status": str(status)}
+    return None
+
+@app.get("/jobs/dlq")
+def dead_letter_jobs(request: Request, limit: int = 100):
+    """Jobs d'ingestion en échec définitif (payload d'origine, classe d'erreur, nombre de tentatives)."""
+    return {"jobs": list_dead_letters(request.app.state.redis_conn, limit=max(1, min(limit, 1000)))}
+
+@app.post("/jobs/dlq/{job_id}/requeue")
+def requeue_dead_letter_job(job_id: str, request: Request):
+    """Rejoue un job de la DLQ sous le même id (suivi via /jobs/{job_id} ou le flux SSE)."""
+    try:
+        job = requeue_dead_letter(request.app.state.redis_conn, job_id)
+    except DeadLetterRequeueError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job absent de la dead-letter queue")
+    return {"job_id": job.id, "queue": job.origin, "status": str(job.get_status())}
+
+@app.get("/metrics/ingest-failures")
+def ingest_failure_metrics(request: Request):
+    """Échecs d'ingestion par classe d'exception : toutes tentatives vs échecs définitifs."""
+    return failure_stats(request.app.state.redis_conn)
+
+@app.get("/metrics/maintenance")
+def maintenance_metrics(request: Request):
+    """Dernier rapport de chaque tâche de maintenance planifiée (espace libéré, index reconstruits)."""
+    return maintenance_reports(request.app.state.redis_conn)
+
+@app.get("/jobs/progress/stream")
+async def job_progress_stream(request: Request, ids: str):
+    """
+    Server-Sent Events : progression fine d'un ou plusieurs jobs (ids séparés par des virgules)
+    sur une seule connexion. Un premier événement par job donne l'état courant, puis chaque mise à
+    jour publiée par le worker est relayée ; le flux se ferme quand tous les jobs sont terminés.
+    """
+    job_ids = list(dict.fromkeys(j.strip() for j in ids.split(",") if j.strip()))
+    if not job_ids or len(job_ids) > SSE_MAX_JOBS:
+        raise HTTPException(status_code=400, detail=f"ids : entre 1 et {SSE_MAX_JOBS} jobs")
+    redis_conn = request.app.state.redis_conn
+
+    async def events():
+        aconn = aioredis.from_url(REDIS_URL)
+        pubsub = aconn.pubsub()
+        await pubsub.subscribe(*[progress_channel(j) for j in job_ids])
+        pending = set(job_ids)
+        try:
+            # État initial, lu après l'abonnement pour ne perdre aucune mise à jour
+            for jid in job_ids:
+                snap = snapshot_from_hash(jid, await aconn.hgetall(progress_state_key(jid)))
+                snap = snap or await run_in_threadpool(_rq_terminal_snapshot, redis_conn, jid)
+                if snap:
+                    yield _sse(snap)
+                    if snap["status"] in TERMINAL_STATUSES or snap["status"] == "not_found":
+                        pending.discard(jid)
+            last_beat = time.monotonic()
+            while pending:
+                if await request.is_disconnected():
+                    break
+                msg = await pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
+                if msg:
+                    snap = json.loads(msg["data"])
+                    yield _sse(snap)
+                    if snap.get("status") in TERMINAL_STATUSES:
+                        pending.discard(snap.get("job_id"))
+                elif time.monotonic() - last_beat >= SSE_HEARTBEAT_S:
+                    last_beat = time.monotonic()
+                    yield ": keep-alive\n\n"
+                    for jid in list(pending):
+                        snap = await run_in_threadpool(_rq_terminal_snapshot, redis_conn, jid)
+                        if snap:
+                            yield _sse(snap); pending.discard(jid)
+            yield _sse({"job_ids": job_ids}, event="done")
+        finally:
+            await pubsub.unsubscribe()
+            await pubsub.close()
+            await aconn.close()
+
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@app.get("/images/{sha256}")
+def get_image(sha256: str, size: Optional[int] = None):
+    """Image stockée hors base : vignette bornée (?size=256) ou original."""
+    conn = get_pg_connection(); cur = conn.cursor()
+    cur.execute("SELECT path, thumbnails FROM images WHERE sha256=%s;", (sha256,))
+    row = cur.fetchone(); cur.close(); conn.close()
+    if not row:
+        raise HTTPException(status_code=404, detail="Image introuvable")
+    path, thumbs = row
+    if size is not None:
+        path = (thumbs or {}).get(str(size))
+        if not path:
+            raise HTTPException(status_code=404, detail=f"Vignette {size} indisponible ({', '.join(thumbs or {})})")
+    if not os.path.exists(path):
+        raise HTTPException(status_code=410, detail="Fichier image absent du stockage")
+    return FileResponse(path)
 
 @app.get("/jobs/{job_id}")
 def job_status(job_id: str, request: Request):
-    """Permet au frontend de suivre l'état d'un job d'ingestion."""
+    """Permet au frontend de suivre l'état d'un job d'ingestion (préférer /jobs/progress/stream)."""
     from rq.job import Job
     redis_conn = request.app.state.redis_conn
     try:
         job = Job.fetch(job_id, connection=redis_conn)
     except Exception:
         raise HTTPException(status_code=404, detail="Job introuvable")
+    final = _effective_job(job, redis_conn)
+    progress = snapshot_from_hash(job_id, redis_conn.hgetall(progress_state_key(job_id))) or job.meta.get("progress")
     return {
         "job_id": job_id,
-        "status": job.get_status(),
-        "result": job.result if job.is_finished else None,
+        "status": final.get_status(),
+        "result": final.result if final.is_finished else None,
+        "progress": progress,
     }
 
+@app.get("/search/lexical")
+def lexical_search_endpoint(q: str, top_k: int = 8):
+    """Documents classés par BM25 sur l'index lexical du corpus."""
+    return {"query": q, "results": search_lexical(q, max(1, min(top_k, 100)))}
+
+@app.get("/metrics/response-cache")
+def response_cache_metrics():
+    """Compteurs hit/miss/bypass du cache sémantique, par module (process courant)."""
+    return response_cache.cache_metrics()
+
+@app.get("/metrics/parse-cache")
+def parse_cache_metrics():
+    """Cache LRU des parses JSON/YAML/XML/rapports des outils agents (process courant)."""
+    return PARSE_CACHE.stats()
+
+@app.get("/metrics/embeddings")
+def embedding_metrics():
+    """Temps d'attente du limiteur partagé vs temps fournisseur, requêtes/tokens et 429 (tous process)."""
+    try:
+        return embedding_limiter.stats()
+    except Exception as e:
+        raise HTTPException(status_code=503, detail=f"Redis indisponible : {e}")
+
 @app.get("/health")
 def health_check():
     """Health check endpoint for Docker health checks"""
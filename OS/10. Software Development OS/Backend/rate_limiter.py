@@ -0,0 +1,135 @@
+# rate_limiter.py — token bucket Redis partagé par tous les workers et l'API pour les appels d'embedding
+import os, time, random
+from typing import Any, Dict, Optional
+import redis
+
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+# Quotas du fournisseur (par minute) ; régler au quota réel du compte
+EMBED_RPM = int(os.getenv("EMBED_RPM", "3000"))
+EMBED_TPM = int(os.getenv("EMBED_TPM", "1000000"))
+EMBED_MAX_RETRIES = int(os.getenv("EMBED_MAX_RETRIES", "8"))
+EMBED_BACKOFF_BASE_S = float(os.getenv("EMBED_BACKOFF_BASE_S", "1.0"))
+EMBED_BACKOFF_MAX_S = float(os.getenv("EMBED_BACKOFF_MAX_S", "60"))
+
+BUCKET_KEY = "ratelimit:embeddings:bucket"
+COOLDOWN_KEY = "ratelimit:embeddings:cooldown_until_ms"
+STRIKES_KEY = "ratelimit:embeddings:strikes"
+STATS_KEY = "ratelimit:embeddings:stats"
+
+# Deux seaux (requêtes et tokens) rechargés en continu ; retourne 0 si accordé, sinon l'attente en ms.
+# Un cooldown global (posé après un 429) bloque tout le monde jusqu'à son échéance.
+_ACQUIRE_LUA = """
+local t = redis.call('TIME')
+local now = tonumber(t[1]) * 1000 + math.floor(tonumber(t[2]) / 1000)
+local rpm, tpm, want = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3])
+local cooldown = tonumber(redis.call('GET', KEYS[2]) or '0')
+if cooldown > now then return cooldown - now end
+local s = redis.call('HMGET', KEYS[1], 'req', 'tok', 'ts')
+local req = tonumber(s[1]) or rpm
+local tok = tonumber(s[2]) or tpm
+local ts = tonumber(s[3]) or now
+local elapsed = math.max(0, now - ts)
+req = math.min(rpm, req + elapsed * rpm / 60000)
+tok = math.min(tpm, tok + elapsed * tpm / 60000)
+local wait = 0
+if req < 1 then wait = math.max(wait, (1 - req) * 60000 / rpm) end
+if tok < want then wait = math.max(wait, (want - tok) * 60000 / tpm) end
+if wait == 0 then req = req - 1; tok = tok - want end
+redis.call('HSET', KEYS[1], 'req', req, 'tok', tok, 'ts', now)
+redis.call('PEXPIRE', KEYS[1], 120000)
+return math.ceil(wait)
+"""
+
+def estimate_tokens(text: str) -> int:
+    # ~4 caractères par token pour l'anglais/le code : estimation suffisante pour le seau TPM
+    return max(1, len(text or "") // 4 + 1)
+
+
+class EmbeddingRateLimiter:
+    """
+    Limiteur partagé (token bucket RPM + TPM dans Redis) avec backoff adaptatif sur les 429.
+    Si Redis est injoignable, le limiteur laisse passer (les 429 restent gérés par le backoff local).
+    """
+
+    def __init__(self, connection=None, rpm: int = EMBED_RPM, tpm: int = EMBED_TPM):
+        self.rpm, self.tpm = rpm, tpm
+        self._conn = connection
+        self._script = None
+
+    @property
+    def conn(self):
+        if self._conn is None:
+            self._conn = redis.from_url(REDIS_URL)
+        return self._conn
+
+    def acquire(self, tokens: int) -> float:
+        """Bloque jusqu'à obtenir un jeton de requête et `tokens` tokens ; retourne le temps d'attente (s)."""
+        tokens = min(max(1, tokens), self.tpm)
+        waited = 0.0
+        while True:
+            try:
+                if self._script is None:
+                    self._script = self.conn.register_script(_ACQUIRE_LUA)
+                wait_ms = int(self._script(keys=[BUCKET_KEY, COOLDOWN_KEY], args=[self.rpm, self.tpm, tokens]))
+            except redis.RedisError as e:
+                print(f"⚠️  rate limiter indisponible, appel non limité : {e}")
+                return waited
+            if wait_ms <= 0:
+                return waited
+            # Petit jitter : évite que tous les workers se réveillent au même instant
+            delay = wait_ms / 1000.0 * random.uniform(1.0, 1.2)
+            time.sleep(delay); waited += delay
+
+    def on_rate_limited(self, retry_after: Optional[float] = None) -> float:
+        """429 reçu : pose un cooldown global, exponentiel sur les 429 rapprochés (ou Retry-After)."""
+        try:
+            strikes = int(self.conn.incr(STRIKES_KEY))
+            self.conn.expire(STRIKES_KEY, int(EMBED_BACKOFF_MAX_S * 2))
+        except redis.RedisError:
+            strikes = 1
+        backoff = min(EMBED_BACKOFF_MAX_S, EMBED_BACKOFF_BASE_S * (2 ** (strikes - 1)))
+        delay = max(retry_after or 0.0, backoff) * random.uniform(1.0, 1.25)
+        try:
+            until_ms = int((time.time() + delay) * 1000)
+            pipe = self.conn.pipeline()
+            pipe.set(COOLDOWN_KEY, until_ms, px=int(delay * 1000) + 1000)
+            pipe.hincrby(STATS_KEY, "throttled", 1)
+            pipe.execute()
+        except redis.RedisError:
+            pass
+        return delay
+
+    def on_success(self):
+        try:
+            if int(self.conn.get(STRIKES_KEY) or 0) > 0:
+                self.conn.decr(STRIKES_KEY)
+        except redis.RedisError:
+            pass
+
+    def record(self, queue_s: float, provider_s: float, tokens: int):
+        try:
+            pipe = self.conn.pipeline()
+            pipe.hincrby(STATS_KEY, "requests", 1)
+            pipe.hincrby(STATS_KEY, "tokens", tokens)
+            pipe.hincrbyfloat(STATS_KEY, "queue_time_s", queue_s)
+            pipe.hincrbyfloat(STATS_KEY, "provider_time_s", provider_s)
+            pipe.execute()
+        except redis.RedisError:
+            pass
+
+    def stats(self) -> Dict[str, Any]:
+        raw = {k.decode(): float(v) for k, v in self.conn.hgetall(STATS_KEY).items()}
+        reqs = raw.get("requests", 0.0)
+        return {
+            "requests": int(reqs),
+            "tokens": int(raw.get("tokens", 0)),
+            "throttled": int(raw.get("throttled", 0)),
+            "queue_time_s": round(raw.get("queue_time_s", 0.0), 3),
+            "provider_time_s": round(raw.get("provider_time_s", 0.0), 3),
+            "avg_queue_ms": round(raw.get("queue_time_s", 0.0) * 1000 / reqs, 2) if reqs else 0.0,
+            "avg_provider_ms": round(raw.get("provider_time_s", 0.0) * 1000 / reqs, 2) if reqs else 0.0,
+            "limits": {"rpm": self.rpm, "tpm": self.tpm},
+        }
+
+
+embedding_limiter = EmbeddingRateLimiter()
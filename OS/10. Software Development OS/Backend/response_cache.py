@@ -0,0 +1,124 @@
+# response_cache.py
+import os, time, threading
+from typing import Any, Dict, List, Optional
+from dataclasses import dataclass
+from tools import get_pg_connection, embed_text, get_index_version
+
+# ---------- Config ----------
+RESPONSE_CACHE_ENABLED = os.getenv("RESPONSE_CACHE_ENABLED", "1") == "1"
+RESPONSE_CACHE_THRESHOLD = float(os.getenv("RESPONSE_CACHE_THRESHOLD", "0.95"))   # similarité cosinus minimale
+RESPONSE_CACHE_TTL_S = int(os.getenv("RESPONSE_CACHE_TTL_S", str(7 * 24 * 3600)))
+# Modules exclus en plus de ceux dont une équipe a des outils à effets de bord (workflows, tickets,
+# commentaires : exclus d'office à l'enregistrement, cf. connector_tools.SIDE_EFFECT_TOOLS)
+RESPONSE_CACHE_DISABLED_MODULES = {
+    m.strip() for m in os.getenv("RESPONSE_CACHE_DISABLED_MODULES", "").split(",") if m.strip()
+}
+# Par défaut, seules les questions sans historique de chat sont servies/alimentées par le cache
+RESPONSE_CACHE_STATELESS_ONLY = os.getenv("RESPONSE_CACHE_STATELESS_ONLY", "1") == "1"
+
+# ---------- DDL ----------
+def init_response_cache():
+    conn = get_pg_connection(); cur = conn.cursor()
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS response_cache (
+            id SERIAL PRIMARY KEY,
+            module_key TEXT NOT NULL,
+            index_version BIGINT NOT NULL,
+            query TEXT NOT NULL,
+            embedding vector(1536) NOT NULL,
+            response TEXT NOT NULL,
+            hits INTEGER NOT NULL DEFAULT 0,
+            created_at TIMESTAMPTZ DEFAULT NOW(),
+            last_hit_at TIMESTAMPTZ
+        );
+    """)
+    cur.execute("CREATE INDEX IF NOT EXISTS response_cache_module_idx ON response_cache (module_key, index_version);")
+    conn.commit(); cur.close(); conn.close()
+
+# ---------- Métriques (par process) ----------
+_METRICS_LOCK = threading.Lock()
+_METRICS: Dict[str, Dict[str, float]] = {}
+
+def _count(module_key: str, key: str, value: float = 1):
+    with _METRICS_LOCK:
+        m = _METRICS.setdefault(module_key, {"hits": 0, "misses": 0, "bypass": 0, "stores": 0,
+                                             "errors": 0, "lookup_ms_total": 0.0})
+        m[key] += value
+
+def cache_metrics() -> Dict[str, Any]:
+    with _METRICS_LOCK:
+        out = {k: dict(v) for k, v in _METRICS.items()}
+    for m in out.values():
+        lookups = m["hits"] + m["misses"]
+        m["hit_ratio"] = round(m["hits"] / lookups, 4) if lookups else 0.0
+        m["avg_lookup_ms"] = round(m["lookup_ms_total"] / lookups, 2) if lookups else 0.0
+    return out
+
+# ---------- Lookup / store ----------
+@dataclass
+class CacheProbe:
+    module_key: str
+    query: str
+    embedding: Optional[List[float]] = None
+    index_version: int = 0
+    answer: Optional[str] = None
+    similarity: float = 0.0
+
+def is_cacheable(module_key: str, history: str = "") -> bool:
+    if not RESPONSE_CACHE_ENABLED or module_key in RESPONSE_CACHE_DISABLED_MODULES:
+        return False
+    return not (history and RESPONSE_CACHE_STATELESS_ONLY)
+
+def bypass(module_key: str):
+    _count(module_key, "bypass")
+
+def lookup(module_key: str, query: str) -> Optional[CacheProbe]:
+    """
+    Cherche une réponse déjà produite pour une question proche, sur la même version d'index.
+    Retourne None si le cache est indisponible (embeddings/DB) : l'appelant traite comme un bypass.
+    """
+    t0 = time.perf_counter()
+    try:
+        probe = CacheProbe(module_key, query, embed_text(query), get_index_version())
+        conn = get_pg_connection(); cur = conn.cursor()
+        try:
+            cur.execute("""
+                SELECT id, response, 1 - (embedding <=> %s::vector) AS sim
+                FROM response_cache
+                WHERE module_key = %s AND index_version = %s
+                  AND created_at > NOW() - make_interval(secs => %s)
+                ORDER BY embedding <=> %s::vector
+                LIMIT 1;
+            """, (probe.embedding, module_key, probe.index_version, RESPONSE_CACHE_TTL_S, probe.embedding))
+            row = cur.fetchone()
+            if row and float(row[2]) >= RESPONSE_CACHE_THRESHOLD:
+                probe.answer, probe.similarity = row[1], float(row[2])
+                cur.execute("UPDATE response_cache SET hits = hits + 1, last_hit_at = NOW() WHERE id=%s;", (row[0],))
+                conn.commit()
+        finally:
+            cur.close(); conn.close()
+    except Exception as e:
+        print(f"⚠️  response_cache indisponible ({module_key}) : {e}")
+        _count(module_key, "errors")
+        return None
+    _count(module_key, "hits" if probe.answer is not None else "misses")
+    _count(module_key, "lookup_ms_total", (time.perf_counter() - t0) * 1000.0)
+    return probe
+
+def store(probe: CacheProbe, answer: str):
+    if not answer or probe.embedding is None:
+        return
+    try:
+        conn = get_pg_connection(); cur = conn.cursor()
+        try:
+            cur.execute(
+                "INSERT INTO response_cache (module_key, index_version, query, embedding, response) VALUES (%s, %s, %s, %s, %s);",
+                (probe.module_key, probe.index_version, probe.query, probe.embedding, answer)
+            )
+            conn.commit()
+        finally:
+            cur.close(); conn.close()
+        _count(probe.module_key, "stores")
+    except Exception as e:
+        print(f"⚠️  response_cache: écriture impossible ({probe.module_key}) : {e}")
+        _count(probe.module_key, "errors")
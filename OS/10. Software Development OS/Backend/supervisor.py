@@ -0,0 +1,235 @@
+# supervisor.py — pool de workers RQ avec autoscaling sur la profondeur des files
+import os, json, math, time, signal
+import multiprocessing as mp
+from typing import Any, Dict, List, Optional, Tuple
+from rq import Queue, Worker
+from rq.job import Job, JobStatus
+from rq.registry import StartedJobRegistry
+from rq.utils import utcnow
+from worker import LISTEN_QUEUES, get_connection, parse_queue_spec, listen_order, worker_name, run_worker
+from ingestion_queue.maintenance import ensure_maintenance_scheduled, maintenance_queue
+
+SUPERVISOR_INTERVAL_S = float(os.getenv("SUPERVISOR_INTERVAL_S", "5"))
+# Cible : nombre de jobs en attente par worker avant d'en ajouter un
+SUPERVISOR_JOBS_PER_WORKER = int(os.getenv("SUPERVISOR_JOBS_PER_WORKER", "4"))
+# Au-delà de cet âge, le plus vieux job en attente force l'ajout d'un worker
+SUPERVISOR_MAX_JOB_AGE_S = float(os.getenv("SUPERVISOR_MAX_JOB_AGE_S", "30"))
+SUPERVISOR_SCALE_DOWN_COOLDOWN_S = float(os.getenv("SUPERVISOR_SCALE_DOWN_COOLDOWN_S", "60"))
+# Drainage à l'arrêt : doit rester sous le délai avant SIGKILL du conteneur (docker-compose
+# stop_grace_period: 10m), avec une marge pour l'arrêt à froid et la remise en file. Les jobs plus
+# longs (archives 6 h, OCR 2 h, cf. JOB_TIMEOUTS) sont interrompus et remis en tête de leur file
+# sous le même id : les checkpoints d'indexation évitent de refaire le travail déjà commité.
+SUPERVISOR_DRAIN_TIMEOUT_S = float(os.getenv("SUPERVISOR_DRAIN_TIMEOUT_S", "480"))
+# Attente après le second SIGTERM (arrêt à froid RQ : le work-horse est tué) avant SIGKILL du worker
+SUPERVISOR_FORCE_STOP_WAIT_S = float(os.getenv("SUPERVISOR_FORCE_STOP_WAIT_S", "30"))
+SUPERVISOR_REPORT_INTERVAL_S = float(os.getenv("SUPERVISOR_REPORT_INTERVAL_S", "60"))
+THROUGHPUT_KEY = "ingest:workers:throughput"
+
+
+class QueuePool:
+    """Process workers dédiés à une file (plus les files prioritaires en repli)."""
+
+    def __init__(self, name: str, listen: List[str], min_procs: int, max_procs: int):
+        self.name = name
+        self.listen = listen
+        self.min_procs = min_procs
+        self.max_procs = max_procs
+        self.procs: List[Tuple[mp.Process, str]] = []
+        self.last_scale_down = 0.0
+
+    def alive(self) -> List[Tuple[mp.Process, str]]:
+        self.procs = [(p, n) for p, n in self.procs if p.is_alive()]
+        return self.procs
+
+    def spawn(self):
+        name = worker_name(self.name)
+        p = mp.Process(target=run_worker, args=(self.listen, name), name=name)
+        p.start()
+        self.procs.append((p, name))
+
+    def stop_one(self, connection) -> Optional[Tuple[mp.Process, str]]:
+        """
+        Arrête un worker inactif (le plus récent d'abord) ; None si tous ont un job en cours.
+        SIGTERM = arrêt à chaud RQ : le process sort seul, l'appelant le joint (Supervisor._stopping).
+        """
+        for i in range(len(self.procs) - 1, -1, -1):
+            p, name = self.procs[i]
+            try:
+                w = Worker.find_by_key(Worker.redis_worker_namespace_prefix + name, connection=connection)
+            except Exception:
+                w = None
+            if w is None or w.get_state() != "idle":
+                continue
+            del self.procs[i]
+            if p.is_alive():
+                os.kill(p.pid, signal.SIGTERM)
+            return p, name
+        return None
+
+
+class Supervisor:
+    def __init__(self, specs: List[Tuple[str, int, int]], autoscale: bool = True, connection=None):
+        self.conn = connection or get_connection()
+        self.autoscale = autoscale
+        self.pools = [QueuePool(name, listen_order(specs, i), lo, hi if autoscale else max(lo, 1))
+                      for i, (name, lo, hi) in enumerate(specs)]
+        if not autoscale:
+            for pool in self.pools:
+                pool.min_procs = pool.max_procs
+        self.draining = False
+        self._stopping: List[Tuple[mp.Process, str]] = []  # workers arrêtés, en attente de sortie
+        self._last_report = time.monotonic()
+        self._last_counts: Dict[str, Tuple[int, float]] = {}
+
+    # ---------- Mesures Redis ----------
+    def queue_load(self, name: str) -> Tuple[int, float]:
+        """(profondeur, âge en secondes du plus vieux job en attente)."""
+        q = Queue(name, connection=self.conn)
+        depth = q.count
+        if not depth:
+            return 0, 0.0
+        ids = q.get_job_ids(0, 1)
+        job = Job.fetch(ids[0], connection=self.conn) if ids else None
+        if job is None or job.enqueued_at is None:
+            return depth, 0.0
+        return depth, max(0.0, (utcnow() - job.enqueued_at).total_seconds())
+
+    def desired_size(self, pool: QueuePool, current: int) -> int:
+        depth, age = self.queue_load(pool.name)
+        desired = math.ceil(depth / SUPERVISOR_JOBS_PER_WORKER) if depth else 0
+        if age > SUPERVISOR_MAX_JOB_AGE_S:
+            desired = max(desired, current + 1)
+        return max(pool.min_procs, min(pool.max_procs, desired))
+
+    # ---------- Boucle ----------
+    def reap_stopped(self):
+        """Joint les workers arrêtés qui sont sortis (pas de process zombie)."""
+        still = []
+        for p, name in self._stopping:
+            if p.is_alive():
+                still.append((p, name))
+            else:
+                p.join()
+        self._stopping = still
+
+    def reconcile(self):
+        now = time.monotonic()
+        self.reap_stopped()
+        for pool in self.pools:
+            current = len(pool.alive())
+            target = self.desired_size(pool, current) if self.autoscale else pool.min_procs
+            if target > current:
+                for _ in range(target - current):
+                    pool.spawn()
+                print(f"⬆️  {pool.name}: {current} -> {target} workers")
+            elif target < current and now - pool.last_scale_down >= SUPERVISOR_SCALE_DOWN_COOLDOWN_S:
+                # Descente progressive (un worker inactif par cooldown) pour absorber les rafales
+                stopped = pool.stop_one(self.conn)
+                if stopped is not None:
+                    self._stopping.append(stopped); pool.last_scale_down = now
+                    print(f"⬇️  {pool.name}: {current} -> {current - 1} workers")
+
+    def throughput_report(self) -> Dict[str, Any]:
+        """Jobs/min par worker (fenêtre depuis le dernier rapport) à partir des compteurs RQ."""
+        report: Dict[str, Any] = {"at": utcnow().isoformat(), "pools": {}}
+        now = time.monotonic()
+        for pool in self.pools:
+            workers = []
+            for _, name in pool.alive():
+                try:
+                    w = Worker.find_by_key(Worker.redis_worker_namespace_prefix + name, connection=self.conn)
+                except Exception:
+                    w = None
+                if w is None:
+                    continue
+                done = w.successful_job_count + w.failed_job_count
+                prev_done, prev_t = self._last_counts.get(name, (0, now - SUPERVISOR_REPORT_INTERVAL_S))
+                window = max(1e-6, now - prev_t)
+                self._last_counts[name] = (done, now)
+                workers.append({
+                    "worker": name,
+                    "state": w.get_state(),
+                    "successful": w.successful_job_count,
+                    "failed": w.failed_job_count,
+                    "busy_s": round(w.total_working_time, 1),
+                    "jobs_per_min": round((done - prev_done) * 60.0 / window, 2),
+                })
+            depth, age = self.queue_load(pool.name)
+            report["pools"][pool.name] = {
+                "size": len(workers), "min": pool.min_procs, "max": pool.max_procs,
+                "depth": depth, "oldest_job_age_s": round(age, 1),
+                "jobs_per_min": round(sum(w["jobs_per_min"] for w in workers), 2),
+                "workers": workers,
+            }
+        self.conn.set(THROUGHPUT_KEY, json.dumps(report), ex=int(SUPERVISOR_REPORT_INTERVAL_S * 5))
+        return report
+
+    def request_drain(self, signum, _frame):
+        if self.draining:
+            return
+        self.draining = True
+        print(f"🛑 Signal {signum} : drainage des workers (jobs en cours terminés)")
+        for pool in self.pools:
+            for p, name in pool.alive():
+                self._stopping.append((p, name))
+                # SIGINT est déjà reçu par tout le groupe de process depuis un terminal
+                if signum == signal.SIGTERM:
+                    os.kill(p.pid, signal.SIGTERM)
+            pool.procs = []
+
+    def drain(self):
+        deadline = time.monotonic() + SUPERVISOR_DRAIN_TIMEOUT_S
+        for p, _ in self._stopping:
+            p.join(max(0.0, deadline - time.monotonic()))
+        stuck = [(p, name, self._current_job_id(name)) for p, name in self._stopping if p.is_alive()]
+        for p, name, _ in stuck:
+            print(f"⚠️  {name} toujours actif après {SUPERVISOR_DRAIN_TIMEOUT_S:.0f}s, arrêt forcé")
+            os.kill(p.pid, signal.SIGTERM)  # second signal : arrêt à froid, RQ tue le work-horse
+        deadline = time.monotonic() + SUPERVISOR_FORCE_STOP_WAIT_S
+        for p, _, job_id in stuck:
+            p.join(max(0.0, deadline - time.monotonic()))
+            if p.is_alive():
+                p.kill(); p.join()
+            if job_id:
+                self._requeue_interrupted(job_id)
+
+    def _current_job_id(self, name: str) -> Optional[str]:
+        try:
+            w = Worker.find_by_key(Worker.redis_worker_namespace_prefix + name, connection=self.conn)
+            return w.get_current_job_id() if w is not None else None
+        except Exception:
+            return None
+
+    def _requeue_interrupted(self, job_id: str):
+        """Remet en tête de sa file un job interrompu par l'arrêt (même id : progression et checkpoints)."""
+        try:
+            job = Job.fetch(job_id, connection=self.conn)
+            if job.get_status() != JobStatus.STARTED:
+                return
+            StartedJobRegistry(job.origin, connection=self.conn).remove(job)
+            Queue(job.origin, connection=self.conn).enqueue_job(job, at_front=True)
+            print(f"↩️  job {job_id} interrompu par l'arrêt, remis en file {job.origin}")
+        except Exception as e:
+            print(f"⚠️  job {job_id} interrompu, remise en file impossible : {e}")
+
+    def run(self):
+        signal.signal(signal.SIGTERM, self.request_drain)
+        signal.signal(signal.SIGINT, self.request_drain)
+        while not self.draining:
+            try:
+                self.reconcile()
+                ensure_maintenance_scheduled(self.conn, maintenance_queue([pool.name for pool in self.pools]))
+                if time.monotonic() - self._last_report >= SUPERVISOR_REPORT_INTERVAL_S:
+                    self._last_report = time.monotonic()
+                    for name, pool in self.throughput_report()["pools"].items():
+                        print(f"📊 {name}: {pool['size']} workers, file={pool['depth']}, "
+                              f"{pool['jobs_per_min']} jobs/min")
+            except Exception as e:
+                # Redis indisponible : on garde les workers existants et on réessaie
+                print(f"⚠️  supervisor: {e}")
+            time.sleep(SUPERVISOR_INTERVAL_S)
+        self.drain()
+
+
+if __name__ == "__main__":
+    Supervisor(parse_queue_spec(LISTEN_QUEUES), autoscale=True).run()
@@ -1,15 +1,28 @@
-import os, json, zipfile, tarfile, csv, psycopg2, base64, hashlib
+import os, json, zipfile, tarfile, csv, psycopg2, base64, hashlib, shutil
 from io import BytesIO
-from typing import List, Dict, Any, Tuple
+from typing import List, Dict, Any, Tuple, Optional
 from dataclasses import dataclass
+from concurrent.futures import ThreadPoolExecutor
 from enum import Enum
 import ast
 import re
 import json
-from openai import OpenAI
+import time
+from openai import OpenAI, RateLimitError
+import numpy as np
 from PIL import Image
 from mistralai.client import MistralClient
 from pgvector.psycopg2 import register_vector
+from rate_limiter import embedding_limiter, estimate_tokens, EMBED_MAX_RETRIES
+from keyword_index import KEYWORD_INDEX_ENABLED, init_keyword_index, index_document_terms, lexical_search
+try:
+    from pypdf import PdfReader, PdfWriter
+    from pypdf.errors import PyPdfError
+    # PDF chiffré, tronqué ou mal formé : pypdf lève ses propres erreurs, ou ValueError/KeyError/TypeError
+    PDF_READ_ERRORS = (PyPdfError, ValueError, KeyError, TypeError)
+except ImportError:
+    PdfReader = PdfWriter = None
+    PDF_READ_ERRORS = ()
 
 # Dossiers de travail
 UPLOAD_DIR = "Uploads"
@@ -45,8 +58,10 @@ client = OpenAI(api_key=OPENAI_API_KEY) if OPENAI_API_KEY else None
 mistral_client = MistralClient(api_key=MISTRAL_API_KEY) if MISTRAL_API_KEY else None
 
 # DB pg / pgvector
-def get_pg_connection():
-    conn = psycopg2.connect(**PG_CONFIG)
+def get_pg_connection(connect_timeout: Optional[int] = None):
+    """connect_timeout (s) : pour les appelants qui ont un repli et ne doivent pas attendre la base."""
+    extra = {"connect_timeout": connect_timeout} if connect_timeout else {}
+    conn = psycopg2.connect(**PG_CONFIG, **extra)
     register_vector(conn)
     return conn
 
@@ -71,14 +86,197 @@ def init_pgvector():
             embedding vector(1536)
         );
     """)
+    # Reprise après crash : statut du document + chunks uniques par (document, index)
+    cur.execute("ALTER TABLE documents ADD COLUMN IF NOT EXISTS status TEXT NOT NULL DEFAULT 'complete';")
+    cur.execute("ALTER TABLE documents ADD COLUMN IF NOT EXISTS chunks_total INTEGER;")
+    cur.execute("ALTER TABLE documents ADD COLUMN IF NOT EXISTS created_at TIMESTAMPTZ DEFAULT NOW();")
+    cur.execute("""
+        CREATE UNIQUE INDEX IF NOT EXISTS document_chunks_doc_idx_uniq
+        ON document_chunks (document_id, chunk_index);
+    """)
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS ingest_checkpoints (
+            job_key TEXT NOT NULL,
+            filename TEXT NOT NULL,
+            content_hash TEXT NOT NULL,
+            document_id INTEGER REFERENCES documents(id) ON DELETE CASCADE,
+            chunks_done INTEGER NOT NULL DEFAULT 0,
+            status TEXT NOT NULL,                      -- 'partial' | 'done'
+            updated_at TIMESTAMPTZ DEFAULT NOW(),
+            PRIMARY KEY (job_key, filename)
+        );
+    """)
+    # Version de l'index de connaissance : incrémentée à chaque ajout/suppression de documents
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS index_versions (
+            scope TEXT PRIMARY KEY,
+            version BIGINT NOT NULL DEFAULT 0
+        );
+    """)
+    # Uploads adressés par contenu (sha256) -> documents indexés
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS uploads (
+            sha256 TEXT PRIMARY KEY,
+            filename TEXT NOT NULL,
+            path TEXT NOT NULL,
+            size_bytes BIGINT,
+            status TEXT NOT NULL DEFAULT 'pending',   -- 'pending' | 'indexed' | 'unsupported' | 'failed'
+            job_id TEXT,
+            document_ids INTEGER[] NOT NULL DEFAULT '{}',
+            created_at TIMESTAMPTZ DEFAULT NOW(),
+            indexed_at TIMESTAMPTZ,
+            updated_at TIMESTAMPTZ DEFAULT NOW()
+        );
+    """)
+    # Bases existantes : date du dernier changement de statut (uploads 'pending' abandonnés)
+    cur.execute("ALTER TABLE uploads ADD COLUMN IF NOT EXISTS updated_at TIMESTAMPTZ DEFAULT NOW();")
+    # Images : octets et vignettes sur disque, seul le texte (métadonnées/OCR) est embeddé.
+    # phash_bands = 8 octets du pHash préfixés par leur position : candidats quasi-doublons via GIN &&
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS images (
+            sha256 TEXT PRIMARY KEY,
+            filename TEXT NOT NULL,
+            path TEXT NOT NULL,
+            format TEXT,
+            width INTEGER,
+            height INTEGER,
+            phash BIGINT NOT NULL,
+            phash_bands INTEGER[] NOT NULL,
+            thumbnails JSONB NOT NULL DEFAULT '{}',
+            document_id INTEGER REFERENCES documents(id) ON DELETE SET NULL,
+            duplicate_of TEXT,
+            created_at TIMESTAMPTZ DEFAULT NOW()
+        );
+    """)
+    cur.execute("CREATE INDEX IF NOT EXISTS images_phash_bands_gin ON images USING GIN (phash_bands);")
+    # Statistiques lexicales du corpus (tags TF-IDF/BM25, recherche lexicale)
+    init_keyword_index(cur)
+    conn.commit(); cur.close(); conn.close()
+
+# Index de connaissance partagé par tous les modules (les documents ne sont pas rattachés à un module)
+KB_INDEX_SCOPE = "documents"
+
+def bump_index_version(cur, scope: str = KB_INDEX_SCOPE):
+    cur.execute(
+        "INSERT INTO index_versions (scope, version) VALUES (%s, 1) "
+        "ON CONFLICT (scope) DO UPDATE SET version = index_versions.version + 1;",
+        (scope,)
+    )
+
+def get_index_version(scope: str = KB_INDEX_SCOPE) -> int:
+    conn = get_pg_connection(); cur = conn.cursor()
+    cur.execute("SELECT version FROM index_versions WHERE scope=%s;", (scope,))
+    row = cur.fetchone(); cur.close(); conn.close()
+    return int(row[0]) if row else 0
+
+# Registre des uploads (déduplication par hash de contenu)
+def content_addressed_path(sha256: str, filename: str) -> str:
+    """Uploads/<ab>/<sha256>/<nom> : deux contenus différents ne s'écrasent jamais."""
+    return os.path.join(UPLOAD_DIR, sha256[:2], sha256, os.path.basename(filename))
+
+def get_upload(sha256: str) -> Optional[Dict[str, Any]]:
+    conn = get_pg_connection(); cur = conn.cursor()
+    cur.execute("""
+        SELECT filename, path, status, job_id, document_ids, EXTRACT(EPOCH FROM NOW() - updated_at)
+        FROM uploads WHERE sha256=%s;
+    """, (sha256,))
+    row = cur.fetchone(); cur.close(); conn.close()
+    if not row:
+        return None
+    return {"sha256": sha256, "filename": row[0], "path": row[1], "status": row[2],
+            "job_id": row[3], "document_ids": list(row[4] or []), "age_s": float(row[5] or 0)}
+
+def claim_upload(sha256: str, filename: str, path: str, size_bytes: int, job_id: str,
+                 stale_job_id: Optional[str] = None) -> bool:
+    """
+    Réserve atomiquement l'ingestion d'un contenu pour job_id : True si la ligne est gagnée.
+    Nouveau hash, ou upload 'failed'/'unsupported' : réservé. Sinon (indexé ou en cours), refusé.
+    stale_job_id : reprise d'un upload 'pending' dont le job est mort, seulement s'il a toujours ce job
+    (deux reprises concurrentes : une seule gagne).
+    """
+    conn = get_pg_connection(); cur = conn.cursor()
+    if stale_job_id is None:
+        cur.execute("""
+            INSERT INTO uploads (sha256, filename, path, size_bytes, status, job_id)
+            VALUES (%s, %s, %s, %s, 'pending', %s)
+            ON CONFLICT (sha256) DO UPDATE
+                SET filename=EXCLUDED.filename, path=EXCLUDED.path, status='pending', job_id=EXCLUDED.job_id,
+                    updated_at=NOW()
+                WHERE uploads.status IN ('failed', 'unsupported')
+            RETURNING job_id;
+        """, (sha256, filename, path, size_bytes, job_id))
+    else:
+        cur.execute("""
+            UPDATE uploads SET filename=%s, path=%s, job_id=%s, updated_at=NOW()
+            WHERE sha256=%s AND status='pending' AND job_id=%s
+            RETURNING job_id;
+        """, (filename, path, job_id, sha256, stale_job_id))
+    won = cur.fetchone() is not None
+    conn.commit(); cur.close(); conn.close()
+    return won
+
+def mark_upload_indexed(sha256: str, document_ids: List[int]):
+    if not sha256:
+        return
+    conn = get_pg_connection(); cur = conn.cursor()
+    cur.execute(
+        "UPDATE uploads SET status='indexed', document_ids=%s, indexed_at=NOW(), updated_at=NOW() WHERE sha256=%s;",
+        (list(document_ids), sha256)
+    )
+    conn.commit(); cur.close(); conn.close()
+
+def mark_upload_unsupported(sha256: str):
+    """Aucun fichier indexable (type non supporté, archive sans fichier supporté) : pas de document."""
+    if not sha256:
+        return
+    conn = get_pg_connection(); cur = conn.cursor()
+    cur.execute(
+        "UPDATE uploads SET status='unsupported', document_ids='{}', indexed_at=NOW(), updated_at=NOW() "
+        "WHERE sha256=%s;",
+        (sha256,)
+    )
+    conn.commit(); cur.close(); conn.close()
+
+def set_upload_status(sha256: str, status: str, only_if: Optional[str] = None):
+    """'failed' (échec définitif de l'ingestion) ou 'pending' (rejeu depuis la DLQ) ; only_if : statut attendu."""
+    if not sha256:
+        return
+    conn = get_pg_connection(); cur = conn.cursor()
+    cur.execute(
+        "UPDATE uploads SET status=%s, updated_at=NOW() WHERE sha256=%s AND (%s IS NULL OR status=%s);",
+        (status, sha256, only_if, only_if)
+    )
     conn.commit(); cur.close(); conn.close()
 
 # Embeddings + utilitaires
+def _retry_after_s(err: RateLimitError) -> Optional[float]:
+    try:
+        return float(err.response.headers.get("retry-after"))
+    except Exception:
+        return None
+
 def embed_text(text: str) -> List[float]:
+    """
+    Embedding via le seau partagé (RPM/TPM) : on attend son tour plutôt que de déclencher un 429,
+    et un 429 éventuel pose un cooldown commun à tous les process avant de réessayer.
+    """
     if not client:
         raise RuntimeError("OpenAI client not configured. Set OPENAI_API_KEY environment variable.")
-    resp = client.embeddings.create(model="text-embedding-3-small", input=text)
-    return resp.data[0].embedding
+    tokens = estimate_tokens(text)
+    for attempt in range(EMBED_MAX_RETRIES + 1):
+        queue_s = embedding_limiter.acquire(tokens)
+        t0 = time.perf_counter()
+        try:
+            resp = client.embeddings.create(model="text-embedding-3-small", input=text)
+        except RateLimitError as e:
+            if attempt >= EMBED_MAX_RETRIES:
+                raise
+            delay = embedding_limiter.on_rate_limited(_retry_after_s(e))
+            print(f"⏳ 429 embeddings, cooldown partagé {delay:.1f}s (tentative {attempt + 1}/{EMBED_MAX_RETRIES})")
+            continue
+        embedding_limiter.record(queue_s, time.perf_counter() - t0, tokens)
+        embedding_limiter.on_success()
+        return resp.data[0].embedding
 
 def compute_content_hash(content_str: str) -> str:
     return hashlib.sha256(content_str.encode("utf-8")).hexdigest()
@@ -94,31 +292,37 @@ def chunk_text(text: str, max_chars: int = 7200, overlap: int = 800) -> list[str
     return chunks
 
 # Lecture / extraction / OCR / images
-def read_supported_files_from(folder: str) -> Dict[str, Any]:
-    out: Dict[str, Any] = {}
+def is_supported_file(name: str) -> bool:
+    ext = os.path.splitext(name)[1].lower()
+    return ext in SUPPORTED_EXTENSIONS or name.lower() == "dockerfile"
+
+def list_supported_files(folder: str) -> List[str]:
+    """Chemins des fichiers supportés sous folder (parcours récursif, ordre stable)."""
+    out: List[str] = []
     if not os.path.exists(folder): return out
-    for root, _, files in os.walk(folder):
-        for file in files:
-            ext = os.path.splitext(file)[1].lower()
-            is_dockerfile = file.lower() == "dockerfile"
-            if (ext not in SUPPORTED_EXTENSIONS) and (not is_dockerfile):
-                continue
-            path = os.path.join(root, file)
-            try:
-                if ext == ".csv":
-                    with open(path, "r", encoding="utf-8") as f:
-                        out[file] = list(csv.reader(f))
-                else:
-                    with open(path, "r", encoding="utf-8", errors="ignore") as f:
-                        content = f.read()
-                        if ext == ".json":
-                            try: content = json.loads(content)
-                            except json.JSONDecodeError: pass
-                        out[file] = content
-            except Exception as e:
-                out[file] = f"Erreur lecture : {e}"
+    for root, dirs, files in os.walk(folder):
+        dirs.sort()
+        out.extend(os.path.join(root, f) for f in sorted(files) if is_supported_file(f))
     return out
 
+def read_supported_file(path: str) -> Any:
+    ext = os.path.splitext(path)[1].lower()
+    try:
+        if ext == ".csv":
+            with open(path, "r", encoding="utf-8") as f:
+                return list(csv.reader(f))
+        with open(path, "r", encoding="utf-8", errors="ignore") as f:
+            content = f.read()
+        if ext == ".json":
+            try: content = json.loads(content)
+            except json.JSONDecodeError: pass
+        return content
+    except Exception as e:
+        return f"Erreur lecture : {e}"
+
+def read_supported_files_from(folder: str) -> Dict[str, Any]:
+    return {os.path.basename(p): read_supported_file(p) for p in list_supported_files(folder)}
+
 def extract_archive(file_path: str, extract_dir: str) -> str:
     os.makedirs(extract_dir, exist_ok=True)
     if file_path.endswith((".zip", ".jar", ".war", ".ear")):
@@ -139,33 +343,241 @@ def extract_nested_tars(root_dir: str):
             except Exception:
                 continue
 
+# Images : vignettes bornées, pHash (DCT NumPy) pour les quasi-doublons, OCR optionnel
+IMAGE_THUMB_SIZES = [int(x) for x in os.getenv("IMAGE_THUMB_SIZES", "256,1024").split(",") if x.strip()]
+IMAGE_PHASH_MAX_DISTANCE = int(os.getenv("IMAGE_PHASH_MAX_DISTANCE", "6"))
+IMAGE_OCR_ENABLED = os.getenv("IMAGE_OCR_ENABLED", "1") == "1"
+
+def _dct_matrix(n: int) -> np.ndarray:
+    k = np.arange(n).reshape(-1, 1)
+    m = np.cos(np.pi * (2 * np.arange(n) + 1) * k / (2 * n)) * np.sqrt(2.0 / n)
+    m[0] /= np.sqrt(2.0)
+    return m
+
+_DCT32 = _dct_matrix(32)
+
+def image_phash(img: Image.Image) -> int:
+    """pHash 64 bits : DCT 2D d'une vignette 32x32 en niveaux de gris, 8x8 basses fréquences vs médiane."""
+    px = np.asarray(img.convert("L").resize((32, 32), Image.LANCZOS), dtype=np.float64)
+    low = (_DCT32 @ px @ _DCT32.T)[:8, :8].flatten()
+    bits = low > np.median(low[1:])  # composante continue exclue de la médiane
+    return int("".join("1" if b else "0" for b in bits), 2)
+
+def phash_bands(h: int) -> List[int]:
+    # 8 bandes de 8 bits : deux hashs à distance <= 7 partagent forcément au moins une bande
+    return [i * 256 + ((h >> (8 * i)) & 0xFF) for i in range(8)]
+
+def _to_signed64(h: int) -> int:
+    return h - (1 << 64) if h >= (1 << 63) else h
+
+def hamming64(a: int, b: int) -> int:
+    return bin((a ^ b) & 0xFFFFFFFFFFFFFFFF).count("1")
+
+def make_thumbnails(img: Image.Image, out_dir: str) -> Dict[str, str]:
+    """Vignettes JPEG bornées (IMAGE_THUMB_SIZES) ; la plus grande n'excède jamais l'original."""
+    os.makedirs(out_dir, exist_ok=True)
+    rgb = img.convert("RGB")
+    out: Dict[str, str] = {}
+    for size in sorted(IMAGE_THUMB_SIZES):
+        thumb = rgb.copy(); thumb.thumbnail((size, size))
+        path = os.path.join(out_dir, f"thumb_{size}.jpg")
+        thumb.save(path, format="JPEG", quality=85, optimize=True)
+        out[str(size)] = path
+    return out
+
+def _image_ocr_text(thumb_path: Optional[str]) -> str:
+    """OCR sur la plus grande vignette (taille bornée) ; vide si indisponible."""
+    if not (IMAGE_OCR_ENABLED and mistral_client and thumb_path):
+        return ""
+    try:
+        with open(thumb_path, "rb") as f:
+            data_url = "data:image/jpeg;base64," + base64.b64encode(f.read()).decode("ascii")
+        ocr = mistral_client.ocr.process(
+            model="mistral-ocr-latest",
+            document={"type": "image_url", "image_url": data_url},
+            include_image_base64=False,
+        )
+        return "\n".join(p.markdown for p in ocr.pages).strip()
+    except Exception as e:
+        print(f"⚠️  OCR image indisponible : {e}")
+        return ""
+
+class CorruptUploadError(ValueError):
+    """Contenu illisible : rejouer le job ne changera rien (pas de retry côté file d'ingestion)."""
+
 def analyze_image_to_text_blob(file_path: str) -> Dict[str, Any]:
+    """Métadonnées de l'image (sans les octets)."""
     try:
         with Image.open(file_path) as img:
             meta = {"filename": os.path.basename(file_path),
                     "format": img.format, "size": img.size, "mode": img.mode}
-            buf = BytesIO(); img.save(buf, format="PNG")
-            meta["base64_png"] = base64.b64encode(buf.getvalue()).decode("utf-8")
+            exif = img.getexif()
+            for tag, key in ((0x010F, "camera_make"), (0x0110, "camera_model"), (0x0132, "datetime"),
+                             (0x010E, "description")):
+                if exif.get(tag):
+                    meta[key] = str(exif.get(tag))
             return meta
     except Exception as e:
         return {"error": str(e), "filename": os.path.basename(file_path)}
 
-def ocr_pdf_to_markdown(pdf_path: str) -> str:
+def find_similar_image(cur, h: int, exclude_sha: str) -> Optional[Tuple[str, int]]:
+    """(sha256, document_id) d'une image indexée à distance de Hamming <= IMAGE_PHASH_MAX_DISTANCE."""
+    cur.execute(
+        "SELECT sha256, phash, document_id FROM images "
+        "WHERE phash_bands && %s::integer[] AND document_id IS NOT NULL AND sha256 <> %s;",
+        (phash_bands(h), exclude_sha)
+    )
+    best = None
+    for sha, other, doc_id in cur.fetchall():
+        d = hamming64(h, other)
+        if d <= IMAGE_PHASH_MAX_DISTANCE and (best is None or d < best[0]):
+            best = (d, sha, doc_id)
+    return (best[1], best[2]) if best else None
+
+def process_image(file_path: str, sha256: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Range l'image hors base (Uploads/<ab>/<sha256>/ + vignettes), calcule son pHash et
+    cherche un quasi-doublon déjà indexé. Retourne le texte à embedder (métadonnées + OCR),
+    ou duplicate_of/document_id si l'image est un quasi-doublon (rien à embedder).
+    """
+    sha256 = sha256 or file_sha256(file_path)
+    name = os.path.basename(file_path)
+    stored = content_addressed_path(sha256, name)
+    if os.path.abspath(stored) != os.path.abspath(file_path):
+        os.makedirs(os.path.dirname(stored), exist_ok=True)
+        if not os.path.exists(stored):
+            shutil.copyfile(file_path, stored)
+
+    meta = analyze_image_to_text_blob(stored)
+    if "error" in meta:
+        raise CorruptUploadError(f"Image illisible ({name}) : {meta['error']}")
+    with Image.open(stored) as img:
+        img.draft("RGB", (max(IMAGE_THUMB_SIZES or [1024]),) * 2)  # décodage JPEG réduit
+        h = image_phash(img)
+        thumbs = make_thumbnails(img, os.path.join(os.path.dirname(stored), "thumbs"))
+
+    conn = get_pg_connection(); cur = conn.cursor()
+    try:
+        similar = find_similar_image(cur, h, sha256)
+        cur.execute("""
+            INSERT INTO images (sha256, filename, path, format, width, height, phash, phash_bands,
+                                thumbnails, document_id, duplicate_of)
+            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+            ON CONFLICT (sha256) DO UPDATE
+                SET path=EXCLUDED.path, thumbnails=EXCLUDED.thumbnails,
+                    document_id=COALESCE(images.document_id, EXCLUDED.document_id),
+                    duplicate_of=EXCLUDED.duplicate_of;
+        """, (sha256, name, stored, meta.get("format"), meta["size"][0], meta["size"][1],
+              _to_signed64(h), phash_bands(h), json.dumps(thumbs),
+              similar[1] if similar else None, similar[0] if similar else None))
+        conn.commit()
+    finally:
+        cur.close(); conn.close()
+
+    info = {"sha256": sha256, "filename": name, "path": stored, "phash": f"{h:016x}",
+            "thumbnails": thumbs, "duplicate_of": None, "document_id": None, "text": ""}
+    if similar:
+        info["duplicate_of"], info["document_id"] = similar
+        return info
+    lines = [f"Image: {name}", f"Format: {meta.get('format')} {meta['size'][0]}x{meta['size'][1]} {meta.get('mode')}"]
+    lines += [f"{k}: {meta[k]}" for k in ("camera_make", "camera_model", "datetime", "description") if k in meta]
+    text = _image_ocr_text(thumbs.get(str(max(IMAGE_THUMB_SIZES))) if IMAGE_THUMB_SIZES else None)
+    if text:
+        lines += ["", "Texte (OCR) :", text]
+    info["text"] = "\n".join(lines)
+    return info
+
+def link_image_document(sha256: str, document_id: int):
+    conn = get_pg_connection(); cur = conn.cursor()
+    cur.execute("UPDATE images SET document_id=%s WHERE sha256=%s;", (document_id, sha256))
+    conn.commit(); cur.close(); conn.close()
+
+# Pipeline PDF : couche texte locale, OCR par lots en parallèle, cache par hash de contenu
+PDF_TEXT_MIN_CHARS = int(os.getenv("PDF_TEXT_MIN_CHARS", "40"))
+PDF_OCR_BATCH_PAGES = int(os.getenv("PDF_OCR_BATCH_PAGES", "8"))
+PDF_OCR_WORKERS = int(os.getenv("PDF_OCR_WORKERS", "4"))
+
+def file_sha256(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            h.update(block)
+    return h.hexdigest()
+
+def _mistral_ocr(file_name: str, content) -> List[str]:
     if not mistral_client:
         raise RuntimeError("Mistral client not configured. Set MISTRAL_API_KEY environment variable.")
-    uploaded = mistral_client.files.upload(
-        file={"file_name": os.path.basename(pdf_path), "content": open(pdf_path, "rb")},
-        purpose="ocr"
-    )
+    uploaded = mistral_client.files.upload(file={"file_name": file_name, "content": content}, purpose="ocr")
     signed = mistral_client.files.get_signed_url(file_id=uploaded.id)
     ocr = mistral_client.ocr.process(
         model="mistral-ocr-latest",
         document={"type": "document_url", "document_url": signed.url},
         include_image_base64=False,
     )
-    md = "\n".join([p.markdown for p in ocr.pages])
-    out_path = os.path.join(MARKDOWN_DIR, f"{os.path.splitext(os.path.basename(pdf_path))[0]}.md")
-    with open(out_path, "w", encoding="utf-8") as f: f.write(md)
+    return [p.markdown for p in ocr.pages]
+
+def _subset_pdf(reader, pages: List[int]) -> bytes:
+    """Sous-PDF ne contenant que les pages demandées (un appel OCR par lot)."""
+    writer = PdfWriter()
+    for i in pages:
+        writer.add_page(reader.pages[i])
+    buf = BytesIO(); writer.write(buf)
+    return buf.getvalue()
+
+def _extract_text_layer(reader) -> List[Optional[str]]:
+    """Texte embarqué par page ; None si la page n'a pas de couche texte exploitable (scan)."""
+    out: List[Optional[str]] = []
+    for page in reader.pages:
+        try:
+            text = (page.extract_text() or "").strip()
+        except Exception:
+            text = ""
+        out.append(text if len(text) >= PDF_TEXT_MIN_CHARS else None)
+    return out
+
+def ocr_pdf_to_markdown(pdf_path: str) -> str:
+    """
+    Markdown d'un PDF, mis en cache dans Markdown/<sha256>.md : un ré-upload ne coûte rien.
+    Les pages avec couche texte sont extraites localement (pypdf) ; seules les autres partent
+    à l'OCR, par lots de PDF_OCR_BATCH_PAGES traités en parallèle. Sans pypdf, ou si pypdf ne
+    sait pas lire le fichier (chiffré, mal formé) : OCR du PDF entier.
+    """
+    sha = file_sha256(pdf_path)
+    cache_path = os.path.join(MARKDOWN_DIR, f"{sha}.md")
+    if os.path.exists(cache_path):
+        with open(cache_path, "r", encoding="utf-8") as f:
+            return f.read()
+
+    base_name = os.path.splitext(os.path.basename(pdf_path))[0]
+    pages_md = None
+    if PdfReader is not None:
+        try:
+            reader = PdfReader(pdf_path)
+            pages_md = _extract_text_layer(reader)
+            missing = [i for i, text in enumerate(pages_md) if text is None]
+            batches = [missing[i:i + PDF_OCR_BATCH_PAGES] for i in range(0, len(missing), PDF_OCR_BATCH_PAGES)]
+            # Découpage séquentiel (PdfReader n'est pas thread-safe), appels OCR en parallèle ensuite
+            parts = [(f"{base_name}.p{b[0] + 1}-{b[-1] + 1}.pdf", _subset_pdf(reader, b)) for b in batches]
+        except PDF_READ_ERRORS as e:
+            print(f"⚠️ {base_name}: lecture pypdf impossible ({type(e).__name__}: {e}), OCR du PDF entier")
+            pages_md = None
+    if pages_md is None:
+        with open(pdf_path, "rb") as fh:
+            pages_md = _mistral_ocr(os.path.basename(pdf_path), fh)
+    else:
+        if batches:
+            print(f"🔎 {base_name}: {len(pages_md) - len(missing)} page(s) texte, "
+                  f"{len(missing)} à l'OCR en {len(batches)} lot(s)")
+            with ThreadPoolExecutor(max_workers=max(1, min(PDF_OCR_WORKERS, len(parts)))) as pool:
+                for pages, result in zip(batches, pool.map(lambda part: _mistral_ocr(*part), parts)):
+                    for i, md in zip(pages, result):
+                        pages_md[i] = md
+        pages_md = [md or "" for md in pages_md]
+
+    md = "\n".join(pages_md)
+    tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f: f.write(md)
+    os.replace(tmp_path, cache_path)
     return md
 
 def ingest_pdf_with_ocr(pdf_path: str) -> dict:
@@ -175,49 +587,147 @@ def ingest_pdf_with_ocr(pdf_path: str) -> dict:
     store_in_pgvector(payload)
     return payload
 
-# Indexation (documents + chunks)
-def store_in_pgvector(files_dict: Dict[str, Any]):
-    if not files_dict: return
+# Indexation (documents + chunks), commits par lot + checkpoint par job
+CHUNK_COMMIT_BATCH = int(os.getenv("INGEST_CHUNK_COMMIT_BATCH", "16"))
+
+def load_checkpoint(cur, job_key: str) -> Dict[str, Tuple[str, int]]:
+    """filename -> (content_hash, document_id) des fichiers entièrement indexés par ce job."""
+    cur.execute(
+        "SELECT filename, content_hash, document_id FROM ingest_checkpoints WHERE job_key=%s AND status='done';",
+        (job_key,)
+    )
+    return {r[0]: (r[1], r[2]) for r in cur.fetchall()}
+
+def save_checkpoint(cur, job_key: Optional[str], filename: str, content_hash: str, doc_id: int,
+                    chunks_done: int, status: str):
+    if not job_key:
+        return
+    cur.execute("""
+        INSERT INTO ingest_checkpoints (job_key, filename, content_hash, document_id, chunks_done, status, updated_at)
+        VALUES (%s, %s, %s, %s, %s, %s, NOW())
+        ON CONFLICT (job_key, filename) DO UPDATE
+            SET content_hash=EXCLUDED.content_hash, document_id=EXCLUDED.document_id,
+                chunks_done=EXCLUDED.chunks_done, status=EXCLUDED.status, updated_at=NOW();
+    """, (job_key, filename, content_hash, doc_id, chunks_done, status))
+
+def clear_checkpoints(job_key: Optional[str]):
+    if not job_key:
+        return
     conn = get_pg_connection(); cur = conn.cursor()
+    cur.execute("DELETE FROM ingest_checkpoints WHERE job_key=%s;", (job_key,))
+    conn.commit(); cur.close(); conn.close()
+
+def _index_terms(cur, doc_id: int, content_str: str):
+    """Termes du document dans la même transaction ; un échec n'annule pas l'ingestion (rattrapé par la maintenance)."""
+    cur.execute("SAVEPOINT keyword_index;")
+    try:
+        index_document_terms(cur, doc_id, content_str)
+        cur.execute("RELEASE SAVEPOINT keyword_index;")
+    except psycopg2.Error as e:
+        cur.execute("ROLLBACK TO SAVEPOINT keyword_index;")
+        print(f"⚠️  index lexical non mis à jour pour doc_id={doc_id}: {e}")
+
+def store_in_pgvector(files_dict: Dict[str, Any], progress=None, job_key: Optional[str] = None) -> List[int]:
+    """
+    Indexe les fichiers et retourne les ids des documents correspondants (nouveaux ou déjà présents).
+    Commit après chaque fichier et tous les CHUNK_COMMIT_BATCH chunks : un crash ne perd qu'un lot.
+    Un document interrompu reste 'partial' ; le retry (même job_key, ou même contenu) reprend
+    aux chunks manquants et ne ré-embedde jamais ce qui est déjà stocké.
+    progress: ProgressReporter optionnel (files_read, chunks_total, chunks_embedded, rows_inserted).
+    """
+    if not files_dict: return []
+    conn = get_pg_connection(); cur = conn.cursor()
+    done = load_checkpoint(cur, job_key) if job_key else {}
+    inserted, doc_ids = 0, []
     for filename, content in files_dict.items():
         content_str = json.dumps(content, ensure_ascii=False) if isinstance(content, (dict, list)) else str(content)
         content_hash = compute_content_hash(content_str)
-        cur.execute("SELECT id FROM documents WHERE content_hash=%s;", (content_hash,))
-        if cur.fetchone():
-            print(f"⚠️  {filename} déjà en base, ignoré."); continue
+        if done.get(filename, (None, None))[0] == content_hash:
+            doc_ids.append(done[filename][1])
+            if progress: progress.incr(files_read=1)
+            continue
 
-        doc_vec = embed_text(content_str)
-        cur.execute(
-            "INSERT INTO documents (filename, content, embedding, content_hash) VALUES (%s, %s, %s, %s) RETURNING id;",
-            (filename, content_str, doc_vec, content_hash)
-        )
-        doc_id = cur.fetchone()[0]
+        cur.execute("SELECT id, status FROM documents WHERE content_hash=%s;", (content_hash,))
+        existing = cur.fetchone()
+        if existing and existing[1] == "complete":
+            doc_ids.append(existing[0])
+            save_checkpoint(cur, job_key, filename, content_hash, existing[0], 0, "done"); conn.commit()
+            if progress: progress.incr(files_read=1)
+            print(f"⚠️  {filename} déjà en base, ignoré."); continue
 
         chunks = chunk_text(content_str)
+        if existing:
+            doc_id = existing[0]
+        else:
+            doc_vec = embed_text(content_str)
+            # ON CONFLICT : un autre worker peut indexer le même contenu en parallèle
+            cur.execute("""
+                INSERT INTO documents (filename, content, embedding, content_hash, status, chunks_total)
+                VALUES (%s, %s, %s, %s, 'partial', %s)
+                ON CONFLICT (content_hash) DO NOTHING RETURNING id;
+            """, (filename, content_str, doc_vec, content_hash, len(chunks)))
+            row = cur.fetchone()
+            if row is None:
+                cur.execute("SELECT id FROM documents WHERE content_hash=%s;", (content_hash,))
+                row = cur.fetchone()
+            doc_id = row[0]
+            conn.commit()
+        cur.execute("SELECT chunk_index FROM document_chunks WHERE document_id=%s;", (doc_id,))
+        stored = {r[0] for r in cur.fetchall()}
+        if progress: progress.incr(files_read=1, chunks_total=len(chunks), chunks_embedded=len(stored),
+                                   rows_inserted=0 if existing else 1)
+
+        pending = 0
         for idx, ch in enumerate(chunks):
+            if idx in stored:
+                continue
             ch_vec = embed_text(ch)
-            cur.execute(
-                "INSERT INTO document_chunks (document_id, chunk_index, content, embedding) VALUES (%s, %s, %s, %s);",
-                (doc_id, idx, ch, ch_vec)
-            )
+            cur.execute("""
+                INSERT INTO document_chunks (document_id, chunk_index, content, embedding) VALUES (%s, %s, %s, %s)
+                ON CONFLICT (document_id, chunk_index) DO NOTHING;
+            """, (doc_id, idx, ch, ch_vec))
+            stored.add(idx); pending += 1
+            if progress: progress.incr(chunks_embedded=1, rows_inserted=1)
+            if pending >= CHUNK_COMMIT_BATCH:
+                save_checkpoint(cur, job_key, filename, content_hash, doc_id, len(stored), "partial")
+                conn.commit(); pending = 0
 
+        cur.execute("UPDATE documents SET status='complete' WHERE id=%s;", (doc_id,))
+        if KEYWORD_INDEX_ENABLED:
+            _index_terms(cur, doc_id, content_str)
+        save_checkpoint(cur, job_key, filename, content_hash, doc_id, len(stored), "done")
+        conn.commit()
+        inserted += 1; doc_ids.append(doc_id)
         print(f"✅ {filename} ajouté (doc_id={doc_id}, chunks={len(chunks)}).")
+    if inserted:
+        bump_index_version(cur)
     conn.commit(); cur.close(); conn.close()
+    return doc_ids
 
 # Recherche + KB
 def search_pgvector_chunks(query: str, top_k: int = 8):
+    """Chunks les plus proches de la requête, documents complets uniquement (pas d'ingestion en cours)."""
     qv = embed_text(query)
     conn = get_pg_connection(); cur = conn.cursor()
     cur.execute("""
         SELECT d.filename, dc.content, 1 - (dc.embedding <=> %s) AS sim
         FROM document_chunks dc
         JOIN documents d ON d.id = dc.document_id
+        WHERE d.status = 'complete'
         ORDER BY sim DESC
         LIMIT %s;
     """, (qv, top_k))
     rows = cur.fetchall(); cur.close(); conn.close()
     return [{"filename": r[0], "content": r[1], "similarity": float(r[2])} for r in rows]
 
+def search_lexical(query: str, top_k: int = 8) -> List[Dict[str, Any]]:
+    """Recherche BM25 sur les statistiques lexicales du corpus (sans embedding de la requête)."""
+    conn = get_pg_connection(); cur = conn.cursor()
+    try:
+        return lexical_search(cur, query, top_k)
+    finally:
+        cur.close(); conn.close()
+
 class KnowledgeBase:
     def __init__(self, top_k: int = 8):
         self.top_k = top_k
@@ -1,16 +1,57 @@
 import os
+import uuid
+import socket
+from typing import List, Optional, Tuple
 import redis
-from rq import Worker, Queue
+from rq import Queue
+from ingestion_queue.failures import IngestWorker
 
 REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
-LISTEN_QUEUES = os.getenv("RQ_QUEUES", "ingestion").split(",")
+# "file[:concurrence]" séparés par des virgules, par priorité décroissante.
+# La concurrence est soit fixe ("ingest-small:4"), soit une plage min-max pour supervisor.py ("ingest-small:2-8").
+# Chaque process écoute sa file puis, à vide, les files plus prioritaires :
+# un worker d'archives aide les petits uploads, jamais l'inverse.
+DEFAULT_QUEUES = "ingest-small:2,ingest-image:1,ingest-bulk:1,ingest-archive:1,ingest-ocr:1"
+LISTEN_QUEUES = os.getenv("RQ_QUEUES", DEFAULT_QUEUES)
 
 def get_connection():
     return redis.from_url(REDIS_URL)
 
-if __name__ == "__main__":
+def parse_queue_spec(spec: str) -> List[Tuple[str, int, int]]:
+    """'ingest-small:2-8,ingest-ocr:1,ingestion' -> [('ingest-small', 2, 8), ('ingest-ocr', 1, 1), ('ingestion', 1, 1)]"""
+    out: List[Tuple[str, int, int]] = []
+    for item in spec.split(","):
+        name, _, conc = item.strip().partition(":")
+        if not name.strip():
+            continue
+        lo, _, hi = conc.strip().partition("-")
+        lo_n = max(0, int(lo)) if lo else 1
+        hi_n = max(lo_n, 1, int(hi)) if hi else max(lo_n, 1)
+        out.append((name.strip(), lo_n, hi_n))
+    return out
+
+def listen_order(specs: List[Tuple[str, int, int]], index: int) -> List[str]:
+    """File dédiée d'abord, puis les files plus prioritaires dans l'ordre de RQ_QUEUES."""
+    return [specs[index][0]] + [spec[0] for spec in specs[:index]]
+
+def worker_name(pool: str) -> str:
+    return f"{socket.gethostname()}.{pool}.{uuid.uuid4().hex[:8]}"
+
+def run_worker(queue_names: List[str], name: Optional[str] = None):
     conn = get_connection()
-    queues = [Queue(name.strip(), connection=conn) for name in LISTEN_QUEUES if name.strip()]
-    worker = Worker(queues, connection=conn)
+    queues = [Queue(q, connection=conn) for q in queue_names]
+    # IngestWorker : pas de retry pour les erreurs classées non rejouables par le callback d'échec
+    worker = IngestWorker(queues, connection=conn, name=name)
     # with_scheduler=True si tu utilises rq-scheduler
     worker.work(with_scheduler=True)
+
+if __name__ == "__main__":
+    specs = parse_queue_spec(LISTEN_QUEUES)
+    if len(specs) == 1 and specs[0][2] == 1:
+        from ingestion_queue.maintenance import ensure_maintenance_scheduled, maintenance_queue
+        ensure_maintenance_scheduled(get_connection(), maintenance_queue([specs[0][0]]))
+        run_worker([specs[0][0]])
+    else:
+        # Pool fixe (borne basse de chaque plage) ; supervisor.py pour l'autoscaling
+        from supervisor import Supervisor
+        Supervisor(specs, autoscale=False).run()
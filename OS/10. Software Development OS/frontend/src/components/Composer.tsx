@@ -44,7 +44,7 @@ export default function Composer({ chatId, onMessageSent }: ComposerProps) {
     onSuccess: (data, file) => {
       setFileUploads(prev => prev.map(fu => 
         fu.file === file 
-          ? { ...fu, status: 'uploaded' as const, jobId: data.job_id, filename: data.filename }
+          ? { ...fu, status: 'uploaded' as const, jobId: data.job_id ?? undefined, filename: data.filename }
           : fu
       ));
     },
@@ -15,12 +15,16 @@ export type Message = {
   chat_id: number; 
   role: "user" | "assistant"; 
   content: string; 
+  status?: "pending" | "complete" | "error";
   created_at: string; 
 };
 
 export type UploadJob = { 
-  job_id: string; 
+  job_id: string | null; 
   filename: string; 
+  sha256?: string;
+  deduplicated?: boolean;
+  document_ids?: number[];
 };
 
 export type FileUpload = {